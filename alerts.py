@@ -0,0 +1,211 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("apy", "tvl")
+BELOW = "below"
+ABOVE = "above"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    pool_id TEXT NOT NULL,
+    pool_name TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    threshold REAL NOT NULL,
+    description TEXT NOT NULL,
+    created INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS alerts_chat ON alerts (chat_id);
+"""
+
+_ALERT_RE = re.compile(
+    r"^(?P<pool>.+?)\s+(?P<metric>apy|tvl)\s+(?:(?P<op>[<>])\s*(?P<value>\d+(?:[.,]\d+)?)\s*(?P<suffix>[kmb]?)|drop\s+(?P<pct>\d+(?:[.,]\d+)?)\s*%?)$",
+    re.IGNORECASE,
+)
+_SUFFIXES = {"": 1.0, "k": 1e3, "m": 1e6, "b": 1e9}
+
+
+class AlertSyntaxError(ValueError):
+    """Некорректный текст команды /alert."""
+
+
+def _parse_number(text: str) -> float:
+    """Число из команды: '3', '3.5' или '3,5'. '10,000' неоднозначно (10 или 10 тысяч) и отклоняется."""
+    whole, _, fraction = text.replace(",", ".").partition(".")
+    if "," in text and len(fraction) == 3:
+        raise AlertSyntaxError(f"'{text}' неоднозначно: пишите {whole}.{fraction} или {whole}{fraction} (можно с суффиксом k/M/B)")
+    try:
+        return float(text.replace(",", "."))
+    except ValueError:
+        raise AlertSyntaxError(f"'{text}' — не число") from None
+
+
+@dataclass(frozen=True, slots=True)
+class AlertRequest:
+    """Разобранная команда /alert: порог задан либо значением, либо падением в процентах."""
+    pool_name: str
+    metric: str
+    direction: str
+    threshold: float | None
+    drop_pct: float | None
+
+
+@dataclass(frozen=True, slots=True)
+class Alert:
+    id: int
+    chat_id: int
+    pool_id: str
+    pool_name: str
+    metric: str
+    direction: str
+    threshold: float
+    description: str
+
+
+def parse_alert(text: str) -> AlertRequest:
+    """Разбирает '<пул> apy < 3', '<пул> tvl > 10M' или '<пул> tvl drop 20%'."""
+    match = _ALERT_RE.match(" ".join(text.split()))
+    if match is None:
+        raise AlertSyntaxError("ожидается '<пул> apy|tvl < значение', '<пул> apy|tvl > значение' или '<пул> apy|tvl drop N%'")
+    metric = match["metric"].lower()
+    if match["pct"] is not None:
+        pct = _parse_number(match["pct"])
+        if not 0 < pct < 100:
+            raise AlertSyntaxError("процент падения должен быть от 0 до 100")
+        return AlertRequest(match["pool"], metric, BELOW, None, pct)
+    value = _parse_number(match["value"]) * _SUFFIXES[match["suffix"].lower()]
+    return AlertRequest(match["pool"], metric, BELOW if match["op"] == "<" else ABOVE, value, None)
+
+
+class AlertIndex:
+    """Подписки, разложенные по (pool, metric, direction) в отсортированные по порогу списки.
+
+    Проверка срабатывания — по пересечению порога между двумя снимками: для пула,
+    у которого значение изменилось со old на new, сработавшие подписки — это
+    непрерывный отрезок отсортированного списка, который находится двумя бинарными
+    поисками. Стоимость проверки O(log n + число сработавших), а не O(число подписок).
+    """
+
+    def __init__(self):
+        self.alerts: dict[int, Alert] = {}
+        self._by_chat: dict[int, dict[int, Alert]] = {}
+        self._thresholds: dict[tuple[str, str, str], list[tuple[float, int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.alerts)
+
+    def pool_ids(self) -> set[str]:
+        return {pool_id for pool_id, _, _ in self._thresholds}
+
+    def add(self, alert: Alert) -> None:
+        self.alerts[alert.id] = alert
+        self._by_chat.setdefault(alert.chat_id, {})[alert.id] = alert
+        entries = self._thresholds.setdefault((alert.pool_id, alert.metric, alert.direction), [])
+        entries.insert(bisect_left(entries, (alert.threshold, alert.id)), (alert.threshold, alert.id))
+
+    def replace(self, alerts: list[Alert]) -> None:
+        """Заменяет все подписки (например, после изменений в AlertStore другим воркером)."""
+        self.alerts.clear()
+        self._by_chat.clear()
+        self._thresholds.clear()
+        for alert in alerts:
+            self.add(alert)
+
+    def remove(self, alert_id: int) -> Alert | None:
+        alert = self.alerts.pop(alert_id, None)
+        if alert is None:
+            return None
+        self._by_chat[alert.chat_id].pop(alert.id, None)
+        key = (alert.pool_id, alert.metric, alert.direction)
+        entries = self._thresholds[key]
+        entries.remove((alert.threshold, alert.id))
+        if not entries:
+            del self._thresholds[key]
+        return alert
+
+    def for_chat(self, chat_id: int) -> list[Alert]:
+        return sorted(self._by_chat.get(chat_id, {}).values(), key=lambda alert: alert.id)
+
+    def crossed(self, pool_id: str, metric: str, old: float, new: float) -> list[Alert]:
+        """Подписки, чей порог пересечен при изменении значения со old на new."""
+        if old != old or new != new or old == new:  # NaN или без изменений
+            return []
+        fired = []
+        below = self._thresholds.get((pool_id, metric, BELOW))
+        if below and new < old:
+            # value < T стало верным: new < T <= old
+            lo = bisect_right(below, (new, float("inf")))
+            hi = bisect_right(below, (old, float("inf")))
+            fired += [self.alerts[alert_id] for _, alert_id in below[lo:hi]]
+        above = self._thresholds.get((pool_id, metric, ABOVE))
+        if above and new > old:
+            # value > T стало верным: old <= T < new
+            lo = bisect_left(above, (old, -1))
+            hi = bisect_left(above, (new, -1))
+            fired += [self.alerts[alert_id] for _, alert_id in above[lo:hi]]
+        return fired
+
+    def evaluate(self, previous, current) -> list[tuple[Alert, float]]:
+        """Сравнивает два снимка PoolsSnapshot только по пулам, на которые есть подписки.
+
+        Возвращает сработавшие подписки вместе с новым значением метрики.
+        """
+        fired = []
+        for pool_id in self.pool_ids():
+            old_row = previous.row_by_id.get(pool_id)
+            new_row = current.row_by_id.get(pool_id)
+            if old_row is None or new_row is None:
+                continue
+            for metric in METRICS:
+                old, new = metric_value(previous, old_row, metric), metric_value(current, new_row, metric)
+                fired += [(alert, new) for alert in self.crossed(pool_id, metric, old, new)]
+        return fired
+
+
+def metric_value(snapshot, row: int, metric: str) -> float:
+    """Значение метрики пула в снимке (NaN, если его нет)."""
+    value = snapshot.display_apy(row) if metric == "apy" else snapshot.tvl_usd(row)
+    return float("nan") if value is None else value
+
+
+class AlertStore:
+    """Подписки на алерты в SQLite; вызовы рассчитаны на asyncio.to_thread."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def load(self) -> list[Alert]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, chat_id, pool_id, pool_name, metric, direction, threshold, description FROM alerts"
+            ).fetchall()
+        return [Alert(*row) for row in rows]
+
+    def add(self, chat_id: int, pool_id: str, pool_name: str, metric: str, direction: str, threshold: float, description: str) -> Alert:
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO alerts (chat_id, pool_id, pool_name, metric, direction, threshold, description, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (chat_id, pool_id, pool_name, metric, direction, threshold, description, int(time.time())),
+            )
+        return Alert(cursor.lastrowid, chat_id, pool_id, pool_name, metric, direction, threshold, description)
+
+    def remove(self, alert_id: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM alerts WHERE id = ?", (alert_id,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
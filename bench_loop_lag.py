@@ -0,0 +1,169 @@
+# bench_loop_lag.py
+"""Задержка обработчиков во время обновления снимка /pools: разбор в event loop против разбора в процессе.
+
+Пока идет get_defilama_pools_data, в event loop каждые --interval мс приходит
+«обновление Telegram»: короткий обработчик (await и отрисовка страницы /pools по
+предыдущему снимку). Задержка обработчика считается от момента, когда обновление
+должно было прийти, до конца обработки — так обновления, пришедшие, пока loop был
+занят, честно ждут вместе с ним. Параллельно работает LoopLagMonitor бота.
+
+Режимы:
+    idle     без обновления снимка (нижняя граница)
+    loop     POOLS_DECODE_PROCESSES=0: потоковый разбор прямо в event loop (как раньше)
+    process  POOLS_DECODE_PROCESSES=1: разбор в процессе pools_decoder
+
+Примеры:
+    python bench_loop_lag.py                       # 100k синтетических пулов, 3 обновления на режим
+    python bench_loop_lag.py --fixture fixtures/pools.json --refreshes 5
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+from bench_pipeline import FixtureServer, sample_config, synthetic_universe
+from metrics import Histogram, Registry
+
+MODES = ("idle", "loop", "process")
+
+
+def percentile(values: list[float], pct: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * pct), len(values) - 1)]
+
+
+async def handler_load(bot, snapshot, chain: str, group: str, interval: float, stop: asyncio.Event) -> list[float]:
+    """Шлет «обновления» каждые interval секунд, пока не выставлен stop. Возвращает задержки обработчиков."""
+    latencies = []
+    tasks = set()
+    rows = bot.match_pool_rows(snapshot, chain, group)[:bot.POOLS_PAGE_SIZE]
+
+    async def handle(arrived: float) -> None:
+        await asyncio.sleep(0)  # ответ Telegram и прочие await обработчика
+        bot.render_pools_table(snapshot, rows, chain, group, "1/1")
+        latencies.append(time.perf_counter() - arrived)
+
+    start = time.perf_counter()
+    sent = 0
+    while not stop.is_set():
+        sent += 1
+        arrival = start + sent * interval
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.create_task(handle(arrival))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+    return latencies
+
+
+async def run_mode(bot, mode: str, snapshot, chain: str, group: str, refreshes: int, interval: float) -> dict:
+    from loop_monitor import LoopLagMonitor
+    monitor = LoopLagMonitor(interval=0.01, window=100_000, histogram=Histogram("bench_lag_seconds", "", registry=Registry()))
+    monitor.start()
+    stop = asyncio.Event()
+    load = asyncio.create_task(handler_load(bot, snapshot, chain, group, interval, stop))
+    refresh_seconds = []
+    for _ in range(refreshes):
+        await asyncio.sleep(0.2)
+        start = time.perf_counter()
+        if mode == "idle":
+            await asyncio.sleep(1.0)
+        elif await bot.get_defilama_pools_data() is None:
+            raise SystemExit(f"Режим {mode}: обновление снимка не удалось")
+        refresh_seconds.append(time.perf_counter() - start)
+    stop.set()
+    latencies = await load
+    lag = monitor.stats()
+    await monitor.stop()
+    return {
+        "handlers": len(latencies),
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "lag_p99_ms": lag["p99"] * 1000,
+        "lag_max_ms": lag["max"] * 1000,
+        "refresh_ms": percentile(refresh_seconds, 0.5) * 1000,
+    }
+
+
+async def bench(pools_body: bytes, config_path: str, modes: list[str], refreshes: int, interval: float) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench_loop_lag_")
+    for name, filename in (("HISTORY_DB_PATH", "history.sqlite3"), ("ALERTS_DB_PATH", "alerts.sqlite3"),
+                           ("POOLS_SNAPSHOT_PATH", "snapshot.bin"), ("POOLS_RESOLVED_PATH", "resolved.json")):
+        os.environ[name] = os.path.join(workdir, filename)
+    os.environ["POOLS_DECODE_PROCESSES"] = "0"
+    import bot
+    from pools_decoder import PoolsDecoder
+    from pools_registry import ALL_GROUPS, PoolsRegistry
+    logging.getLogger().setLevel(logging.WARNING)
+
+    bot.pools_registry = PoolsRegistry(config_path)
+    bot.pools_registry.reload_if_changed()
+    chain = max(bot.pools_registry.chains, key=lambda name: len(bot.pools_registry.pools_for(name, ALL_GROUPS)))
+    decoder = PoolsDecoder(1) if "process" in modes else None
+
+    results = {}
+    with FixtureServer({"/pools": pools_body}) as server:
+        bot.DEFILLAMA_POOLS_URL = f"{server.url}/pools"
+        try:
+            bot.pools_decoder = None
+            snapshot = await bot.get_defilama_pools_data()
+            for mode in modes:
+                bot.pools_decoder = decoder if mode == "process" else None
+                results[mode] = await run_mode(bot, mode, snapshot, chain, ALL_GROUPS, refreshes, interval)
+        finally:
+            await bot.upstream.aclose()
+            bot.history_store.close()
+            bot.alert_store.close()
+            if decoder is not None:
+                decoder.shutdown()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixture", help="записанный ответ /pools (по умолчанию — синтетический)")
+    parser.add_argument("--pools", type=int, default=100_000, help="размер синтетического ответа /pools")
+    parser.add_argument("--config-entries", type=int, default=5000, help="размер синтетического конфига")
+    parser.add_argument("--refreshes", type=int, default=3, help="обновлений снимка на режим")
+    parser.add_argument("--interval", type=float, default=10.0, help="интервал между обновлениями Telegram (мс)")
+    parser.add_argument("--modes", default=",".join(MODES), help="режимы через запятую")
+    parser.add_argument("--output", help="куда записать JSON результата")
+    args = parser.parse_args()
+
+    if args.fixture:
+        with open(args.fixture, 'rb') as f:
+            pools_body = f.read()
+        pools = json.loads(pools_body)["data"]
+        config = sample_config(pools, args.config_entries, random.Random(42))
+    else:
+        pools, config = synthetic_universe(args.pools, args.config_entries)
+        pools_body = json.dumps({"status": "success", "data": pools}).encode()
+    n_pools = len(pools)
+    del pools
+    config_path = os.path.join(tempfile.mkdtemp(prefix="bench_fixture_"), "pools_config.json")
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+
+    modes = [mode for mode in args.modes.split(",") if mode]
+    results = asyncio.run(bench(pools_body, config_path, modes, args.refreshes, args.interval / 1000))
+    print(f"Пулов {n_pools}, обновлений на режим {args.refreshes}, обновление Telegram каждые {args.interval:g} мс", file=sys.stderr)
+    print(f"{'режим':<8} {'обработчиков':>12} {'p50':>9} {'p99':>9} {'max':>9} {'lag p99':>9} {'lag max':>9} {'обновление':>11}", file=sys.stderr)
+    for mode, values in results.items():
+        print(f"{mode:<8} {values['handlers']:>12} {values['p50_ms']:9.1f} {values['p99_ms']:9.1f} {values['max_ms']:9.1f} "
+              f"{values['lag_p99_ms']:9.1f} {values['lag_max_ms']:9.1f} {values['refresh_ms']:11.0f}", file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"pools": n_pools, "refreshes": args.refreshes, "interval_ms": args.interval, "modes": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+# bench_pipeline.py
+"""Воспроизводимый замер пути /pools -> кнопка группы на записанных (или синтетических) ответах.
+
+Ответы DefiLlama /pools и coins API отдает локальный HTTP сервер, бот ходит к нему
+через тот же UpstreamClient. Каждый этап button_handler замеряется отдельно:
+
+    fetch    загрузка тела /pools (потоково, через upstream.get_stream)
+    decode   потоковый разбор JSON с фильтром по конфигурации (PoolsStreamParser)
+    build    колоночный снимок и индексы (PoolsSnapshot)
+    match    сопоставление записей конфига со строками снимка
+    render   HTML страницы по POOLS_PAGE_SIZE пулов
+    prices   /prices: пачка цен из DefiLlama coins API
+    total    get_defilama_pools_data + match/render, как при промахе кеша
+
+Результат — JSON (p50/p95/min в мс, пик выделенной памяти по tracemalloc на этап,
+пиковый RSS процесса вместе с телом фикстуры в памяти), который можно сравнить с
+результатом другого коммита.
+
+Примеры:
+    python bench_pipeline.py                                  # 100k пулов, 5k записей конфига
+    python bench_pipeline.py --record fixtures/               # записать живые /pools и цены DefiLlama
+    python bench_pipeline.py --fixture fixtures/pools.json --prices fixtures/prices.json
+    python bench_pipeline.py --output base.json && python bench_pipeline.py --compare base.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bench_pools import CHUNK_SIZE, DEFILLAMA_POOLS_URL, record_fixture, synthetic_pool
+from prices import COINS_BASE_URL
+
+PRICE_COINS = "coingecko:bitcoin,coingecko:ethereum,coingecko:curve-dao-token"
+GROUPS = {"USDC": "stables", "USDT": "stables", "DAI": "stables", "USDE": "stables", "GHO": "stables", "CRVUSD": "stables",
+          "USDC-USDT": "stables", "WETH": "eth", "STETH": "eth", "WETH-USDC": "eth", "WBTC": "btc", "CBBTC": "btc"}
+STAGES = ("fetch", "decode", "build", "match", "render", "prices", "total")
+
+
+class BytesSink:
+    """Приемник для upstream.get_stream, который только собирает тело ответа."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def feed(self, chunk: bytes) -> None:
+        self.chunks.append(chunk)
+
+    def getvalue(self) -> bytes:
+        return b"".join(self.chunks)
+
+
+class FixtureServer:
+    """Локальная замена DefiLlama: отдает записанные ответы по путям /pools и /prices/current/... (по префиксу)."""
+
+    def __init__(self, routes: dict[str, bytes]):
+        routes = dict(routes)
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                body = next((body for prefix, body in routes.items() if path == prefix or path.startswith(prefix + "/")), None)
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def synthetic_universe(n_pools: int, n_config: int, seed: int = 42) -> tuple[list[dict], list[dict]]:
+    """Синтетический ответ /pools и конфиг из n_config пулов (половина с defilama_id, половина по chain/project/symbol)."""
+    rng = random.Random(seed)
+    pools = [synthetic_pool(rng) for _ in range(n_pools)]
+    return pools, sample_config(pools, n_config, rng)
+
+
+def sample_config(pools: list[dict], n_config: int, rng: random.Random) -> list[dict]:
+    config = []
+    for i, pool in enumerate(rng.sample(pools, min(n_config, len(pools)))):
+        symbol = (pool.get("symbol") or "").upper()
+        config.append({
+            "defilama_id": pool["pool"] if i % 2 == 0 else None,
+            "chain": pool["chain"].lower(),
+            "project": pool["project"],
+            "symbol": symbol.lower(),
+            "user_comment": f"{pool['project']} {symbol.lower()} #{i}",
+            "ticker_group": GROUPS.get(symbol, "other"),
+        })
+    return config
+
+
+def record_prices(path: str) -> None:
+    import httpx
+    response = httpx.get(f"{COINS_BASE_URL}/prices/current/{PRICE_COINS}", timeout=30)
+    response.raise_for_status()
+    with open(path, 'wb') as f:
+        f.write(response.content)
+
+
+def git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(timings: list[float]) -> dict:
+    timings = sorted(timings)
+    return {
+        "p50_ms": timings[len(timings) // 2] * 1000,
+        "p95_ms": timings[min(int(len(timings) * 0.95), len(timings) - 1)] * 1000,
+        "min_ms": timings[0] * 1000,
+    }
+
+
+async def run_stages(bot, chain: str, group: str, repeat: int) -> dict:
+    """Прогоняет этапы: один прогрев, repeat замеров времени и один прогон под tracemalloc для памяти."""
+    timings = {stage: [] for stage in STAGES}
+    allocations = {}
+
+    def decode(content: bytes) -> dict:
+        parser = bot.make_pools_parser()
+        view = memoryview(content)
+        for offset in range(0, len(content), CHUNK_SIZE):
+            parser.feed(bytes(view[offset:offset + CHUNK_SIZE]))
+        return parser.close()
+
+    async def total() -> list[str]:
+        snapshot = await bot.get_defilama_pools_data()
+        return bot.render_pools_result(snapshot, chain, group)
+
+    def render(snapshot, rows: list[int]) -> list[str]:
+        pages = [rows[i:i + bot.POOLS_PAGE_SIZE] for i in range(0, len(rows), bot.POOLS_PAGE_SIZE)]
+        return [bot.render_pools_table(snapshot, page, chain, group, f"{n}/{len(pages)}") for n, page in enumerate(pages, start=1)]
+
+    for iteration in range(repeat + 2):
+        warmup = iteration == 0
+        trace = iteration == repeat + 1
+        if trace:
+            tracemalloc.start()
+
+        async def step(stage: str, func, *args):
+            if trace:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            result = func(*args)
+            if asyncio.iscoroutine(result):
+                result = await result
+            elapsed = time.perf_counter() - start
+            if trace:
+                allocations[stage] = tracemalloc.get_traced_memory()[1] - before
+            elif not warmup:
+                timings[stage].append(elapsed)
+            return result
+
+        content = (await step("fetch", bot.upstream.get_stream, bot.DEFILLAMA_POOLS_URL, BytesSink)).getvalue()
+        pools = await step("decode", decode, content)
+        snapshot = await step("build", bot.PoolsSnapshot, pools)
+        rows = await step("match", bot.match_pool_rows, snapshot, chain, group)
+        await step("render", render, snapshot, rows)
+        await step("prices", bot.price_service.refresh_watched)
+        del content, pools, snapshot
+        await step("total", total)
+        if trace:
+            tracemalloc.stop()
+
+    return {
+        stage: {**summarize(timings[stage]), "alloc_peak_kb": allocations[stage] / 1024}
+        for stage in STAGES
+    }
+
+
+async def bench(pools_body: bytes, prices_body: bytes, config_path: str, repeat: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    # Базы и файлы состояния бота — во временный каталог, чтобы не трогать рабочие
+    for name, filename in (("HISTORY_DB_PATH", "history.sqlite3"), ("ALERTS_DB_PATH", "alerts.sqlite3"),
+                           ("POOLS_SNAPSHOT_PATH", "snapshot.bin"), ("POOLS_RESOLVED_PATH", "resolved.json")):
+        os.environ[name] = os.path.join(workdir, filename)
+    import bot
+    from pools_registry import ALL_GROUPS, PoolsRegistry
+    logging.getLogger().setLevel(logging.WARNING)
+
+    bot.pools_registry = PoolsRegistry(config_path)
+    bot.pools_registry.reload_if_changed()
+    # Самая большая сеть конфига, все группы: больше всего строк и несколько сообщений
+    chain = max(bot.pools_registry.chains, key=lambda name: len(bot.pools_registry.pools_for(name, ALL_GROUPS)))
+
+    bot.watch_coins(PRICE_COINS.split(","))
+
+    with FixtureServer({"/pools": pools_body, "/prices/current": prices_body}) as server:
+        bot.DEFILLAMA_POOLS_URL = f"{server.url}/pools"
+        bot.price_service.base_url = server.url
+        try:
+            stages = await run_stages(bot, chain, ALL_GROUPS, repeat)
+        finally:
+            await bot.upstream.aclose()
+            bot.history_store.close()
+            bot.alert_store.close()
+    return {
+        "chain": chain,
+        "config_entries": len(bot.pools_registry.pools),
+        "rows": len(bot.pools_registry.pools_for(chain, ALL_GROUPS)),
+        "stages": stages,
+    }
+
+
+def print_report(result: dict, baseline: dict | None) -> None:
+    meta = result["meta"]
+    print(f"Коммит {meta['commit']}, пулов {meta['pools']}, записей конфига {result['config_entries']}, "
+          f"сеть {result['chain']} ({result['rows']} пулов), повторов {meta['repeat']}", file=sys.stderr)
+    for stage, values in result["stages"].items():
+        line = f"{stage:>7}: p50 {values['p50_ms']:9.2f} мс  p95 {values['p95_ms']:9.2f} мс  память {values['alloc_peak_kb'] / 1024:8.2f} МБ"
+        base = (baseline or {}).get("stages", {}).get(stage)
+        if base:
+            line += f"  (p50 {(values['p50_ms'] / base['p50_ms'] - 1) * 100:+6.1f}% к {baseline['meta']['commit']})"
+        print(line, file=sys.stderr)
+    print(f"Пиковый RSS: {result['peak_rss_kb'] / 1024:.1f} МБ", file=sys.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixture", help="записанный ответ /pools (по умолчанию — синтетический)")
+    parser.add_argument("--prices", help="записанный ответ DefiLlama /prices/current")
+    parser.add_argument("--config", help="pools_config.json (по умолчанию — синтетический из --config-entries пулов)")
+    parser.add_argument("--record", metavar="DIR", help="записать живые ответы /pools и цены DefiLlama в DIR и выйти")
+    parser.add_argument("--pools", type=int, default=100_000, help="размер синтетического ответа /pools")
+    parser.add_argument("--config-entries", type=int, default=5000, help="размер синтетического конфига")
+    parser.add_argument("--repeat", type=int, default=5, help="повторов каждого этапа")
+    parser.add_argument("--output", help="куда записать JSON результата (по умолчанию stdout)")
+    parser.add_argument("--compare", help="JSON результата другого коммита для сравнения")
+    args = parser.parse_args()
+
+    if args.record:
+        os.makedirs(args.record, exist_ok=True)
+        record_fixture(os.path.join(args.record, "pools.json"))
+        record_prices(os.path.join(args.record, "prices.json"))
+        print(f"Ответы записаны в {args.record}")
+        return
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_fixture_")
+    if args.fixture:
+        with open(args.fixture, 'rb') as f:
+            pools_body = f.read()
+        pools = None
+    else:
+        pools, config = synthetic_universe(args.pools, args.config_entries)
+        pools_body = json.dumps({"status": "success", "data": pools}).encode()
+    config_path = args.config
+    if config_path is None:
+        if pools is None:
+            pools = json.loads(pools_body)["data"]
+            config = sample_config(pools, args.config_entries, random.Random(42))
+        config_path = os.path.join(tmpdir, "pools_config.json")
+        with open(config_path, 'w', encoding='utf-8') as f:
+            json.dump(config, f)
+    n_pools = len(pools) if pools is not None else None
+    del pools
+    if args.prices:
+        with open(args.prices, 'rb') as f:
+            prices_body = f.read()
+    else:
+        prices_body = json.dumps({"coins": {
+            coin: {"price": price, "symbol": coin.split(":")[1][:3].upper(), "timestamp": int(time.time()), "confidence": 0.99}
+            for coin, price in zip(PRICE_COINS.split(","), (67000.0, 3500.0, 0.45))
+        }}).encode()
+
+    result = asyncio.run(bench(pools_body, prices_body, config_path, args.repeat))
+    result["meta"] = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "pools": n_pools,
+        "fixture_bytes": len(pools_body),
+        "repeat": args.repeat,
+        "timestamp": int(time.time()),
+    }
+    result["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# bench_pools.py
+"""Замеры разбора ответа DefiLlama /pools на записанном (или синтетическом) ответе.
+
+Примеры:
+    python bench_pools.py --record pools_fixture.json   # записать живой ответ /pools
+    python bench_pools.py --fixture pools_fixture.json  # замер на записанном ответе
+    python bench_pools.py --pools 20000                 # замер на синтетическом ответе
+    python bench_pools.py --store --pools 20000         # словари против колоночного снимка
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+POOLS_CONFIG_PATH = "pools_config.json"
+DEFILLAMA_POOLS_URL = "https://yields.llama.fi/pools"
+CHUNK_SIZE = 64 * 1024
+
+CHAINS = ["Ethereum", "Base", "Arbitrum", "Optimism", "Polygon", "BSC", "Avalanche", "Solana"]
+PROJECTS = ["aave-v3", "compound-v3", "curve-dex", "uniswap-v3", "lido", "morpho-blue", "pendle", "euler-v2", "fluid-lending", "spark"]
+SYMBOLS = ["USDC", "USDT", "DAI", "WETH", "WBTC", "STETH", "USDE", "GHO", "CRVUSD", "CBBTC", "WETH-USDC", "USDC-USDT"]
+
+
+def synthetic_pool(rng: random.Random, chain=None, project=None, symbol=None, pool_id=None) -> dict:
+    """Пул в формате ответа /pools со всеми полями, которые отдает DefiLlama."""
+    apy_base = round(rng.uniform(0, 20), 5)
+    apy_reward = round(rng.uniform(0, 5), 5) if rng.random() < 0.3 else None
+    return {
+        "chain": chain or rng.choice(CHAINS),
+        "project": project or rng.choice(PROJECTS),
+        "symbol": symbol or rng.choice(SYMBOLS),
+        "tvlUsd": rng.randint(10_000, 2_000_000_000),
+        "apyBase": apy_base,
+        "apyReward": apy_reward,
+        "apy": apy_base + (apy_reward or 0),
+        "rewardTokens": [f"0x{rng.getrandbits(160):040x}"] if apy_reward else None,
+        "pool": pool_id or str(uuid.UUID(int=rng.getrandbits(128))),
+        "apyPct1D": round(rng.uniform(-1, 1), 5),
+        "apyPct7D": round(rng.uniform(-3, 3), 5),
+        "apyPct30D": round(rng.uniform(-5, 5), 5),
+        "stablecoin": rng.random() < 0.4,
+        "ilRisk": rng.choice(["no", "yes"]),
+        "exposure": rng.choice(["single", "multi"]),
+        "predictions": {"predictedClass": "Stable/Up", "predictedProbability": rng.randint(50, 99), "binnedConfidence": rng.randint(1, 3)},
+        "poolMeta": None,
+        "mu": round(rng.uniform(0, 20), 5),
+        "sigma": round(rng.uniform(0, 2), 5),
+        "count": rng.randint(1, 1500),
+        "outlier": False,
+        "underlyingTokens": [f"0x{rng.getrandbits(160):040x}" for _ in range(rng.randint(1, 3))],
+        "il7d": None,
+        "apyBase7d": None,
+        "apyMean30d": round(rng.uniform(0, 20), 5),
+        "volumeUsd1d": None,
+        "volumeUsd7d": None,
+        "apyBaseInception": None,
+    }
+
+
+def generate_fixture(path: str, n_pools: int, seed: int = 42) -> None:
+    """Пишет синтетический ответ /pools, в котором есть все пулы из pools_config.json."""
+    rng = random.Random(seed)
+    with open(POOLS_CONFIG_PATH, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    pools = [
+        synthetic_pool(rng, chain=entry["chain"].capitalize(), project=entry["project"], symbol=entry["symbol"].upper(), pool_id=entry.get("defilama_id"))
+        for entry in config
+    ]
+    pools += [synthetic_pool(rng) for _ in range(max(n_pools - len(pools), 0))]
+    rng.shuffle(pools)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"status": "success", "data": pools}, f)
+
+
+def record_fixture(path: str) -> None:
+    import httpx
+    with httpx.stream("GET", DEFILLAMA_POOLS_URL, timeout=60) as response:
+        response.raise_for_status()
+        with open(path, 'wb') as f:
+            for chunk in response.iter_bytes():
+                f.write(chunk)
+
+
+def parse_full(path: str) -> int:
+    """Прежний способ: весь ответ в память, json.loads и словарь со всеми полями."""
+    with open(path, 'rb') as f:
+        content = f.read()
+    data = json.loads(content)
+    pools_dict_by_pool_key = {pool.get('pool'): pool for pool in data['data'] if pool.get('pool')}
+    return len(pools_dict_by_pool_key)
+
+
+def parse_stream(path: str) -> int:
+    """Потоковый разбор с фильтром по конфигурации, как в bot.get_defilama_pools_data."""
+    from pools_registry import PoolsRegistry
+    from pools_stream import PoolsStreamParser
+    registry = PoolsRegistry(POOLS_CONFIG_PATH)
+    registry.reload_if_changed()
+    parser = PoolsStreamParser(keep=registry.is_tracked)
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            parser.feed(chunk)
+    return len(parser.close())
+
+
+MODES = {"full": parse_full, "stream": parse_stream}
+
+
+def slim_pools(n_pools: int, seed: int = 42) -> dict[str, dict]:
+    """Синтетические пулы в том виде, в котором их оставляет PoolsStreamParser."""
+    from pools_stream import POOL_FIELDS
+    rng = random.Random(seed)
+    pools = (synthetic_pool(rng) for _ in range(n_pools))
+    return {pool["pool"]: {field: pool.get(field) for field in POOL_FIELDS} for pool in pools}
+
+
+def filter_dicts(pools: dict[str, dict], chain: str, limit: int = 20) -> list[str]:
+    """Прежний подход: проход по всем словарям с цепочками .get()."""
+    found = [pool for pool in pools.values() if pool.get("chain", "").lower() == chain and (pool.get("apy") if pool.get("apy") is not None else pool.get("apyBase")) is not None]
+    found.sort(key=lambda pool: pool.get("apy") if pool.get("apy") is not None else pool.get("apyBase"), reverse=True)
+    return [pool["pool"] for pool in found[:limit]]
+
+
+def filter_columns(snapshot, chain: str, limit: int = 20) -> list[str]:
+    """Колоночный снимок: готовый список строк сети и сортировка по колонке APY."""
+    rows = snapshot.sort_rows(snapshot.rows_by_chain.get(chain, []), by="apy")
+    return [snapshot.pool_ids[row] for row in rows[:limit]]
+
+
+def measure(func, repeat: int = 20) -> float:
+    """Медианное время вызова в миллисекундах."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def bench_store(n_pools: int) -> None:
+    from pools_snapshot import PoolsSnapshot
+    tracemalloc.start()
+    pools = slim_pools(n_pools)
+    dicts_bytes = tracemalloc.get_traced_memory()[0]
+    snapshot = PoolsSnapshot(pools)
+    columns_bytes = tracemalloc.get_traced_memory()[0] - dicts_bytes
+    tracemalloc.stop()
+
+    dicts_ms = measure(lambda: filter_dicts(pools, "ethereum"))
+    columns_ms = measure(lambda: filter_columns(snapshot, "ethereum"))
+    print(f"Пулов: {n_pools}")
+    print(f"   dicts: память {dicts_bytes / 1e6:7.2f} МБ, фильтр+сортировка по сети {dicts_ms:7.2f} мс")
+    print(f" columns: память {columns_bytes / 1e6:7.2f} МБ, фильтр+сортировка по сети {columns_ms:7.2f} мс")
+
+
+def run_child(mode: str, path: str) -> None:
+    """Выполняется в отдельном процессе, чтобы пиковый RSS не смешивался между режимами."""
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    kept = MODES[mode](path)
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"mode": mode, "seconds": elapsed, "peak_rss_kb": peak_rss, "delta_rss_kb": peak_rss - baseline_rss, "pools_kept": kept}))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixture", help="записанный ответ /pools")
+    parser.add_argument("--record", help="скачать живой ответ /pools в файл и выйти")
+    parser.add_argument("--pools", type=int, default=20000, help="размер синтетического ответа, если --fixture не задан")
+    parser.add_argument("--store", action="store_true", help="сравнить словари пулов и колоночный снимок")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.store:
+        bench_store(args.pools)
+        return
+
+    if args.record:
+        record_fixture(args.record)
+        print(f"Ответ /pools записан в {args.record} ({os.path.getsize(args.record)} байт)")
+        return
+    if args.child:
+        run_child(args.child, args.fixture)
+        return
+
+    fixture = args.fixture
+    tmp = None
+    if fixture is None:
+        tmp = tempfile.NamedTemporaryFile(suffix=".json", delete=False)
+        tmp.close()
+        fixture = tmp.name
+        generate_fixture(fixture, args.pools)
+    try:
+        print(f"Фикстура: {fixture} ({os.path.getsize(fixture) / 1e6:.1f} МБ)")
+        for mode in MODES:
+            out = subprocess.run([sys.executable, __file__, "--child", mode, "--fixture", fixture], capture_output=True, text=True, check=True)
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{mode:>6}: {result['seconds'] * 1000:8.1f} мс, пиковый RSS {result['peak_rss_kb'] / 1024:7.1f} МБ "
+                  f"(+{result['delta_rss_kb'] / 1024:.1f} МБ), пулов в снимке: {result['pools_kept']}")
+    finally:
+        if tmp is not None:
+            os.remove(tmp.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# bench_screener.py
+"""Замер скринера /top: сборка индексов и время запросов на снимке из всех пулов.
+
+Для сравнения тот же запрос выполняется полным проходом по колонкам снимка
+с сортировкой (как сделал бы /top без индексов).
+
+Примеры:
+    python bench_screener.py                            # 100k синтетических пулов
+    python bench_screener.py --fixture pools.json       # записанный ответ /pools (bench_pools.py --record)
+    python bench_screener.py --pools 20000 --repeat 200
+"""
+import argparse
+import random
+import time
+
+from bench_pools import CHUNK_SIZE, slim_pools
+
+QUERIES = [
+    "ethereum stablecoin apy>5 tvl>10M sort=apy limit=20",
+    "sort=apy",
+    "sort=tvl limit=50",
+    "ethereum,base,arbitrum apy>15 sort=apy",
+    "stablecoin single tvl>100M sort=apy",
+    "solana multi volatile apy<2 sort=tvl limit=50",
+    "tvl>1.9B apy<1 sort=apy",
+    "base stablecoin apy>3 apy<4 tvl<1M sort=tvl",
+]
+
+
+def load_snapshot(fixture: str | None, n_pools: int):
+    from pools_snapshot import PoolsSnapshot
+    from pools_stream import PoolsStreamParser
+    if fixture is None:
+        return PoolsSnapshot(slim_pools(n_pools))
+    parser = PoolsStreamParser()
+    with open(fixture, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            parser.feed(chunk)
+    return PoolsSnapshot(parser.close())
+
+
+def full_scan(index, query) -> list[int]:
+    """Без индексов: проход по всем пулам снимка, фильтры и сортировка отобранных."""
+    snapshot = index.snapshot
+    sort_column = index.apy if query.sort == "apy" else snapshot.tvl
+    found = []
+    for row in range(len(snapshot)):
+        if query.chains and snapshot.chain[row].lower() not in query.chains:
+            continue
+        apy, tvl = index.apy[row], snapshot.tvl[row]
+        if sort_column[row] != sort_column[row]:
+            continue
+        if query.min_apy is not None and not apy > query.min_apy or query.max_apy is not None and not apy < query.max_apy:
+            continue
+        if query.min_tvl is not None and not tvl > query.min_tvl or query.max_tvl is not None and not tvl < query.max_tvl:
+            continue
+        if query.stablecoin is not None and bool(snapshot.stablecoin[row]) != query.stablecoin:
+            continue
+        if query.exposure is not None and snapshot.exposure[row] != query.exposure:
+            continue
+        found.append(row)
+    found.sort(key=lambda row: -sort_column[row])
+    return found[:query.limit]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * pct), len(values) - 1)]
+
+
+def measure(func, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main() -> None:
+    from screener import ScreenerIndex, parse_query
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixture", help="записанный ответ /pools")
+    parser.add_argument("--pools", type=int, default=100_000, help="размер синтетического снимка, если --fixture не задан")
+    parser.add_argument("--repeat", type=int, default=100, help="повторов каждого запроса")
+    parser.add_argument("--random", type=int, default=1000, help="случайных запросов для оценки худшего случая")
+    args = parser.parse_args()
+
+    snapshot = load_snapshot(args.fixture, args.pools)
+    start = time.perf_counter()
+    index = ScreenerIndex(snapshot)
+    print(f"Пулов: {len(snapshot)}, сетей: {len(index.chain_names)}, сборка индексов {(time.perf_counter() - start) * 1000:.0f} мс")
+    print(f"{'запрос (мс)':<50} {'p50':>7} {'p99':>7} {'max':>7} {'без индексов':>13}")
+    for text in QUERIES:
+        query = parse_query(text.split())
+        if index.query(query) != full_scan(index, query):
+            raise SystemExit(f"Результаты индекса и полного прохода различаются: {text}")
+        timings = measure(lambda: index.query(query), args.repeat)
+        scan_ms = percentile(measure(lambda: full_scan(index, query), 5), 0.5)
+        print(f"{text:<50} {percentile(timings, 0.5):7.3f} {percentile(timings, 0.99):7.3f} {max(timings):7.3f} {scan_ms:13.1f}")
+
+    # Случайные сочетания фильтров: худший случай важнее среднего
+    rng = random.Random(1)
+    chains = sorted(index.chain_names)
+    timings = []
+    for _ in range(args.random):
+        words = [f"sort={rng.choice(['apy', 'tvl'])}"]
+        if rng.random() < 0.7:
+            words.append(",".join(rng.sample(chains, rng.randint(1, 3))))
+        words += [word for word, chance in (("stablecoin", 0.4), (rng.choice(["single", "multi"]), 0.3), ("volatile", 0.1)) if rng.random() < chance]
+        if rng.random() < 0.6:
+            words.append(f"apy{rng.choice('<>')}{rng.uniform(0, 20):.2f}")
+        if rng.random() < 0.6:
+            words.append(f"tvl{rng.choice('<>')}{rng.choice([1, 10, 100, 1000])}M")
+        query = parse_query(words)
+        timings += measure(lambda: index.query(query), 1)
+    print(f"Случайные запросы ({args.random}): p50 {percentile(timings, 0.5):.3f} мс, "
+          f"p99 {percentile(timings, 0.99):.3f} мс, max {max(timings):.3f} мс")
+
+
+if __name__ == "__main__":
+    main()
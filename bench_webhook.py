@@ -0,0 +1,222 @@
+# bench_webhook.py
+"""Локальный нагрузочный тест приема обновлений: long polling против webhook.
+
+Бот работает с поддельным Bot API (ответ на каждый вызов приходит через --api-latency).
+Обновления появляются с заданной частотой, задержка считается от появления обновления
+до завершения его обработчика. Режимы:
+
+    polling  настоящий Updater.start_polling: поддельный getUpdates — long poll, который
+             отдает накопившиеся обновления, как только они есть (или пустой ответ по таймауту)
+    webhook  обновления отправляются POST-запросами в WebhookServer
+
+Каждый режим прогоняется с concurrent_updates=1 (по умолчанию в PTB) и с --concurrency,
+чтобы отделить вклад способа доставки от вклада параллельной обработки.
+
+Примеры:
+    python bench_webhook.py                          # 500 синтетических обновлений, 50 в секунду
+    python bench_webhook.py --updates updates.jsonl  # записанные обновления (по одному JSON в строке)
+    python bench_webhook.py --rate 500 --concurrency 64 --api-latency 0.08
+"""
+import argparse
+import asyncio
+import json
+import logging
+import socket
+import time
+
+import httpx
+from telegram import Update
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ContextTypes
+from telegram.request import BaseRequest, RequestData
+
+from webhook import SECRET_HEADER, WebhookServer
+
+BENCH_TOKEN = "123456:BENCHMARK"
+BENCH_SECRET = "bench-secret"
+WEBHOOK_PATH = "/telegram"
+
+
+class FakeBotApi(BaseRequest):
+    """Bot API без сети: каждый вызов отвечает через latency секунд."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        # Обновления для getUpdates (режим polling)
+        self.pending: list[dict] = []
+        self.arrived = asyncio.Event()
+
+    @property
+    def read_timeout(self) -> float | None:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url, method, request_data: RequestData | None = None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None) -> tuple[int, bytes]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if url.endswith("/getUpdates"):
+            return 200, json.dumps({"ok": True, "result": await self.get_updates(request_data)}).encode()
+        if url.endswith("/getMe"):
+            result = {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif url.endswith("/sendMessage") or url.endswith("/editMessageText"):
+            result = {"message_id": 1, "date": int(time.time()), "chat": {"id": 1, "type": "private"}, "text": "ok"}
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    def push(self, update: dict) -> None:
+        self.pending.append(update)
+        self.arrived.set()
+
+    async def get_updates(self, request_data: RequestData | None) -> list[dict]:
+        """Long poll: накопившиеся обновления сразу или ожидание первого до timeout запроса."""
+        parameters = request_data.parameters if request_data is not None else {}
+        if not self.pending:
+            self.arrived.clear()
+            try:
+                await asyncio.wait_for(self.arrived.wait(), timeout=float(parameters.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        offset = int(parameters.get("offset") or 0)
+        batch = [update for update in self.pending if update["update_id"] >= offset][:int(parameters.get("limit") or 100)]
+        self.pending = self.pending[len(batch):]
+        return batch
+
+
+def synthetic_updates(count: int) -> list[dict]:
+    """Смесь команд /pools и нажатий кнопок от разных пользователей."""
+    updates = []
+    for i in range(count):
+        user = {"id": 1000 + i % 50, "is_bot": False, "first_name": "User"}
+        chat = {"id": user["id"], "type": "private"}
+        if i % 2:
+            message = {"message_id": i, "date": int(time.time()), "chat": chat, "from": user, "text": "/pools",
+                       "entities": [{"type": "bot_command", "offset": 0, "length": 6}]}
+            updates.append({"update_id": i, "message": message})
+        else:
+            message = {"message_id": i, "date": int(time.time()), "chat": chat, "from": {**user, "id": 123456, "is_bot": True}, "text": "..."}
+            updates.append({"update_id": i, "callback_query": {"id": str(i), "from": user, "chat_instance": "1",
+                                                               "message": message, "data": "select_chain:Ethereum"}})
+    return updates
+
+
+def load_updates(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    for i, update in enumerate(updates):
+        update["update_id"] = i  # update_id используется как ключ замера
+    return updates
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+async def run(updates: list[dict], mode: str, concurrency: int, rate: float, api_latency: float) -> dict:
+    api = FakeBotApi(api_latency)
+    application = (Application.builder().token(BENCH_TOKEN).request(api).get_updates_request(api)
+                   .concurrent_updates(concurrency).build())
+    sent_at: dict[int, float] = {}
+    latencies: list[float] = []
+    done = asyncio.Event()
+
+    async def on_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        # Как /pools: ответ с клавиатурой — один вызов Bot API
+        await update.message.reply_text("Выберите сеть:")
+
+    async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        # Как выбор сети: answer + edit_message_text — два вызова Bot API
+        await update.callback_query.answer()
+        await update.callback_query.edit_message_text("Выберите группу:")
+
+    async def record(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        latencies.append(time.perf_counter() - sent_at[update.update_id])
+        if len(latencies) == len(updates):
+            done.set()
+
+    application.add_handler(CommandHandler("pools", on_command))
+    application.add_handler(CallbackQueryHandler(on_button))
+    application.add_handler(CommandHandler("pools", record), group=1)
+    application.add_handler(CallbackQueryHandler(record), group=1)
+
+    port = free_port()
+    server = WebhookServer(application, WEBHOOK_PATH, BENCH_SECRET) if mode == "webhook" else None
+    async with application:
+        await application.start()
+        if server is not None:
+            server.listen(port, "127.0.0.1")
+        else:
+            await application.updater.start_polling(timeout=10)
+        url = f"http://127.0.0.1:{port}{WEBHOOK_PATH}"
+        limits = httpx.Limits(max_connections=100, max_keepalive_connections=100)
+        try:
+            async with httpx.AsyncClient(limits=limits, headers={SECRET_HEADER: BENCH_SECRET}) as client:
+                async def deliver(update: dict) -> None:
+                    sent_at[update["update_id"]] = time.perf_counter()
+                    if server is None:
+                        api.push(update)
+                        return
+                    response = await client.post(url, content=json.dumps(update))
+                    response.raise_for_status()
+
+                started = time.perf_counter()
+                deliveries = []
+                for i, update in enumerate(updates):
+                    delay = started + i / rate - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    deliveries.append(asyncio.create_task(deliver(update)))
+                await asyncio.gather(*deliveries)
+                await done.wait()
+                elapsed = time.perf_counter() - started
+        finally:
+            if server is not None:
+                await server.stop()
+            else:
+                await application.updater.stop()
+            await application.stop()
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "updates": len(updates),
+        "api_calls": api.calls,
+        "throughput": len(updates) / elapsed,
+        "latency_p50_ms": percentile(latencies, 0.50) * 1000,
+        "latency_p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", help="файл с записанными обновлениями (JSON lines)")
+    parser.add_argument("--count", type=int, default=500, help="число синтетических обновлений, если --updates не задан")
+    parser.add_argument("--rate", type=float, default=50.0, help="частота отправки обновлений в секунду")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent_updates для параллельной обработки")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="задержка ответа Bot API в секундах")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    updates = load_updates(args.updates) if args.updates else synthetic_updates(args.count)
+    print(f"{len(updates)} обновлений, {args.rate:.0f}/с, задержка Bot API {args.api_latency * 1000:.0f} мс")
+    for mode in ("polling", "webhook"):
+        for concurrency in dict.fromkeys((1, args.concurrency)):
+            name = f"{mode} (concurrent_updates={concurrency})"
+            result = asyncio.run(run(updates, mode, concurrency, args.rate, args.api_latency))
+            print(f"{name:40s} {result['throughput']:8.1f} обн./с  p50 {result['latency_p50_ms']:9.1f} мс  p99 {result['latency_p99_ms']:9.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
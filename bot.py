@@ -1,14 +1,40 @@
+import argparse
 import logging
 import os
-import requests
-import json # Оставляем для загрузки конфига
+import socket
+import json
 import asyncio
 import html # Для экранирования HTML символов
+import io
+import time
+import httpx
+import tornado.web
 from dotenv import load_dotenv
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup # Добавляем импорты для Inline Keyboard
-from telegram.ext import Application, CommandHandler, ContextTypes, CallbackQueryHandler # Добавляем CallbackQueryHandler
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent, Update
+from telegram.ext import Application, CommandHandler, ContextTypes, CallbackQueryHandler, InlineQueryHandler # Добавляем CallbackQueryHandler
 from telegram.request import HTTPXRequest
 from telegram.constants import ParseMode # Для форматирования
+from telegram.error import BadRequest
+from alerts import ABOVE, AlertIndex, AlertStore, AlertSyntaxError, metric_value, parse_alert
+from fanout import FanOut, FanOutResult
+from history_store import WINDOWS, HistoryStore, parse_chart_points, summarize_chart_points
+from loop_monitor import LoopLagMonitor
+from metrics import Gauge, MetricsHandler, span, timed_handler
+from pools_cache import SnapshotCache, Timestamped
+from pools_decoder import FileSink, PoolsDecoder
+from pools_registry import ALL_GROUPS, PoolsRegistry
+from pools_snapshot import PoolResolutions, PoolsSnapshot
+from pools_stream import PoolsStreamParser
+from prices import CoinIndex, PriceService
+from profiler import StackSampler, busy_samples, collapsed, hot_frames
+from refresher import BackgroundRefresher
+from render_cache import RenderCache
+from screener import ScreenerIndex, ScreenerSyntaxError, parse_query
+from send_queue import BULK, INTERACTIVE, SendScheduler
+from snapshot_store import SnapshotStore, decode_snapshot, encode_snapshot
+from state_backend import make_state_backend
+from upstream import upstream
+from webhook import run_webhook
 
 # Включаем логирование
 logging.basicConfig(
@@ -21,70 +47,316 @@ load_dotenv(dotenv_path='.env')
 
 # --- Конфигурация ---
 POOLS_CONFIG_PATH = "pools_config.json"
+# Карта пулов, найденных по chain/project/symbol (заполняется ботом автоматически)
+POOLS_RESOLVED_PATH = os.getenv("POOLS_RESOLVED_PATH", "pools_resolved.json")
+# Хранить в снимке только пулы из конфигурации (по умолчанию — все пулы DefiLlama, но только нужные поля:
+# они нужны скринеру /top; 1 — меньше памяти, но /top недоступен)
+POOLS_TRACKED_ONLY = os.getenv("POOLS_TRACKED_ONLY", "0") != "0"
+# Файл с последним успешным снимком /pools для быстрого старта без сети
+# (в Docker его стоит положить на volume, чтобы он переживал redeploy)
+POOLS_SNAPSHOT_PATH = os.getenv("POOLS_SNAPSHOT_PATH", "pools_snapshot.bin")
+# Сколько процессов разбирают ответ /pools вне event loop (0 — разбор потоково прямо в event loop, как раньше)
+POOLS_DECODE_PROCESSES = int(os.getenv("POOLS_DECODE_PROCESSES", "1"))
+# Интервал таймера, по которому меряется задержка event loop (секунды)
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+# История APY/TVL в SQLite: файл базы и минимальный интервал между точками (секунды)
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "pools_history.sqlite3")
+HISTORY_INTERVAL = float(os.getenv("HISTORY_INTERVAL", "3600"))
+# Подписки на алерты APY/TVL
+ALERTS_DB_PATH = os.getenv("ALERTS_DB_PATH", "alerts.sqlite3")
+# Ограничения исходящих сообщений Telegram (сообщений в секунду): на весь бот и на один чат
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+# Сколько пулов показывать на одной странице результата /pools
+POOLS_PAGE_SIZE = int(os.getenv("POOLS_PAGE_SIZE", "20"))
+# Сколько готовых ответов /pools (сеть, группа, сортировка) держать в памяти
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "256"))
+# Как часто проверять изменение файла конфигурации (секунды)
+POOLS_CONFIG_CHECK_INTERVAL = float(os.getenv("POOLS_CONFIG_CHECK_INTERVAL", "10"))
+# Сколько обновлений обрабатывать одновременно (1 — строго по очереди, как раньше)
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "32"))
+# Режим webhook: публичный URL, секрет для заголовка X-Telegram-Bot-Api-Secret-Token и адрес HTTP сервера
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # без пути, например https://bot.example.com
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# Общее состояние воркеров: memory (один процесс) или sqlite (несколько воркеров с общим файлом;
+# ALERTS_DB_PATH и HISTORY_DB_PATH тогда тоже должны указывать на общий том)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "bot_state.sqlite3")
+WORKER_ID = os.getenv("WORKER_ID", f"{socket.gethostname()}:{os.getpid()}")
+# Аренда лидера (секунды) и как часто воркеры забирают опубликованные лидером снимки
+LEADER_LEASE = float(os.getenv("LEADER_LEASE", "30"))
+SHARED_SYNC_INTERVAL = float(os.getenv("SHARED_SYNC_INTERVAL", "5"))
+# Порт отдельного HTTP сервера с /metrics в режиме polling (0 — выключен; в режиме webhook /metrics
+# отдается тем же сервером, что и webhook)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Telegram ID администраторов через запятую (команда /profile)
+ADMIN_IDS = {int(user_id) for user_id in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if user_id}
+PROFILE_MAX_SECONDS = 60.0
 DEFILLAMA_POOLS_URL = "https://yields.llama.fi/pools" # Исправленный URL
+DEFILLAMA_CHART_URL = "https://yields.llama.fi/chart/{pool}"
+DEFILLAMA_PROTOCOL_URL = "https://api.llama.fi/protocol/{protocol}"
+# Подробности по пулам сети/группы (/chart/{pool} и /protocol/{protocol}): одновременных запросов,
+# таймаут одного запроса и сколько ждать всех ответов, прежде чем показать то, что успело загрузиться
+DETAILS_CONCURRENCY = int(os.getenv("DETAILS_CONCURRENCY", "8"))
+DETAILS_REQUEST_TIMEOUT = float(os.getenv("DETAILS_REQUEST_TIMEOUT", "15"))
+DETAILS_DEADLINE = float(os.getenv("DETAILS_DEADLINE", "8"))
+# Точки /chart появляются раз в сутки, TVL протокола DefiLlama пересчитывает примерно раз в час
+CHART_CACHE_TTL = float(os.getenv("CHART_CACHE_TTL", "3600"))
+PROTOCOL_CACHE_TTL = float(os.getenv("PROTOCOL_CACHE_TTL", "1800"))
 
-# ID криптовалют на CoinGecko (для команды /prices)
-COIN_IDS = ["bitcoin", "ethereum", "curve-dao-token"]
-VS_CURRENCY = "usd"
+# Тикеры для /prices без аргументов (цены DefiLlama coins API) и файл, дополняющий индекс тикер -> ID монеты
+PRICE_SYMBOLS = [symbol for symbol in os.getenv("PRICE_SYMBOLS", "BTC,ETH,CRV").replace(" ", "").split(",") if symbol]
+COINS_INDEX_PATH = os.getenv("COINS_INDEX_PATH", "coins_index.json")
+# Сколько монет держать в фоновом обновлении (тикеры по умолчанию плюс запрошенные пользователями)
+PRICES_WATCH_LIMIT = int(os.getenv("PRICES_WATCH_LIMIT", "200"))
+
+# Кеш снимка /pools: сколько секунд данные считаются свежими и сколько еще их можно отдавать устаревшими
+POOLS_CACHE_TTL = float(os.getenv("POOLS_CACHE_TTL", "300"))
+POOLS_CACHE_STALE_TTL = float(os.getenv("POOLS_CACHE_STALE_TTL", "900"))
+PRICES_CACHE_TTL = float(os.getenv("PRICES_CACHE_TTL", "60"))
+
+# Фоновое обновление данных через JobQueue (интервалы в секундах)
+POOLS_REFRESH_INTERVAL = float(os.getenv("POOLS_REFRESH_INTERVAL", "120"))
+PRICES_REFRESH_INTERVAL = float(os.getenv("PRICES_REFRESH_INTERVAL", "60"))
 
 # --- Вспомогательные функции ---
 
-def load_pools_config(path: str = POOLS_CONFIG_PATH) -> list[dict]:
-    """Загружает конфигурацию отслеживаемых пулов из JSON файла."""
+def make_pools_parser() -> PoolsStreamParser:
+    """Потоковый парсер /pools, оставляющий только пулы из конфигурации (если не задан POOLS_TRACKED_ONLY=0)."""
+    if not POOLS_TRACKED_ONLY:
+        return PoolsStreamParser()
+    resolved_ids = pool_resolutions.pool_ids()
+    return PoolsStreamParser(keep=lambda pool: pools_registry.is_tracked(pool) or pool.get("pool") in resolved_ids)
+
+def tracked_filter() -> tuple[frozenset | None, frozenset | None]:
+    """Фильтр make_pools_parser для процесса разбора: (UUID пулов, ключи chain/project/symbol) или (None, None) — все пулы."""
+    if not POOLS_TRACKED_ONLY:
+        return None, None
+    return pools_registry.tracked_ids | pool_resolutions.pool_ids(), pools_registry.tracked_keys
+
+async def decode_pools_in_process() -> tuple[PoolsSnapshot, int]:
+    """Загружает ответ /pools во временный файл и разбирает его в процессе pools_decoder.
+
+    Возвращает (снимок, пулов в ответе).
+    """
+    path = pools_decoder.temp_path()
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-        if not isinstance(config, list):
-            logger.error(f"Ошибка: Файл конфигурации {path} должен содержать список JSON объектов.")
-            return []
-        logger.info(f"Успешно загружено {len(config)} пулов из {path}")
-        return config
-    except FileNotFoundError:
-        logger.error(f"Ошибка: Файл конфигурации {path} не найден.")
-        return []
-    except json.JSONDecodeError as e:
-        logger.error(f"Ошибка декодирования JSON в файле {path}: {e}")
-        return []
-    except Exception as e:
-        logger.error(f"Неожиданная ошибка при чтении файла {path}: {e}")
-        return []
+        # Запись в файл — не разбор: время загрузки целиком идет в fetch, разбор — в decode_process
+        with await upstream.get_stream(DEFILLAMA_POOLS_URL, lambda: FileSink(path), feed_stage=None):
+            pass  # файл закрывается до того, как его прочитает процесс разбора
+        with span("decode_process"):
+            return await pools_decoder.decode(path, *tracked_filter())
+    finally:
+        pools_decoder.discard(path)
+
+async def get_defilama_pools_data() -> PoolsSnapshot | None:
+    """Асинхронно получает данные о пулах с DefiLlama API.
 
-def get_defilama_pools_data_sync() -> dict | None:
-    """Синхронно получает данные о всех пулах с DefiLlama API."""
+    С POOLS_DECODE_PROCESSES > 0 ответ разбирается в отдельном процессе, иначе — потоково в event loop.
+    """
     logger.info(f"Запрос данных с {DEFILLAMA_POOLS_URL}...")
     try:
-        response = requests.get(DEFILLAMA_POOLS_URL, timeout=30) # Увеличим таймаут еще
-        logger.info(f"Статус ответа: {response.status_code}")
-        response.raise_for_status() # Вызовет исключение для 4xx/5xx
-        data = response.json()
-        if 'data' in data and isinstance(data['data'], list):
-            logger.info(f"Успешно получено {len(data['data'])} пулов с DefiLlama.")
-            # Создаем словарь для быстрого доступа по ключу 'pool', пропуская пулы без него
-            pools_dict_by_pool_key = {pool.get('pool'): pool for pool in data['data'] if pool.get('pool')}
-            logger.info(f"Создан словарь для {len(pools_dict_by_pool_key)} пулов с ключом 'pool'.")
-            return pools_dict_by_pool_key
-        else:
-            logger.error("Ошибка: Неожиданный формат ответа от DefiLlama API. Ключ 'data' отсутствует или не является списком.")
-            logger.debug(f"Содержимое ответа (первые 500 символов): {str(response.content)[:500]}")
-            return None
-    except requests.exceptions.Timeout:
+        if pools_decoder is not None:
+            pools_snapshot, total = await decode_pools_in_process()
+            logger.info(f"Успешно получено {total} пулов с DefiLlama, оставлено {len(pools_snapshot)}.")
+            return pools_snapshot
+        parser = await upstream.get_stream(DEFILLAMA_POOLS_URL, make_pools_parser)
+        pools_dict_by_pool_key = parser.close()
+        logger.info(f"Успешно получено {parser.total} пулов с DefiLlama, оставлено {len(pools_dict_by_pool_key)}.")
+        with span("build"):
+            return PoolsSnapshot(pools_dict_by_pool_key)
+    except httpx.TimeoutException:
         logger.error(f"Ошибка: Таймаут при запросе к {DEFILLAMA_POOLS_URL}")
         return None
-    except requests.exceptions.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         logger.error(f"Ошибка HTTP при запросе к DefiLlama API: {e}")
-        logger.debug(f"Содержимое ответа (первые 500 символов): {str(response.content)[:500]}")
+        logger.debug(f"Содержимое ответа (первые 500 символов): {e.response.text[:500]}")
         return None
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Ошибка сети при запросе к DefiLlama API: {e}")
         return None
-    except json.JSONDecodeError as e:
-         logger.error(f"Ошибка декодирования JSON ответа от DefiLlama: {e}")
-         logger.debug(f"Содержимое ответа (первые 500 символов): {str(response.content)[:500]}")
-         return None
+    except ValueError as e: # JSONDecodeError тоже является ValueError
+        logger.error(f"Ошибка разбора ответа от DefiLlama: {e}")
+        return None
     except Exception as e:
         logger.error(f"Неожиданная ошибка при получении данных от DefiLlama: {e}", exc_info=True)
         return None
 
+pools_registry = PoolsRegistry(POOLS_CONFIG_PATH)
+pool_resolutions = PoolResolutions(POOLS_RESOLVED_PATH)
+snapshot_store = SnapshotStore(POOLS_SNAPSHOT_PATH)
+history_store = HistoryStore(HISTORY_DB_PATH)
+last_history_append = 0.0
+alert_store = AlertStore(ALERTS_DB_PATH)
+alert_index = AlertIndex()
+send_scheduler = SendScheduler(global_rate=TELEGRAM_GLOBAL_RATE, per_chat_rate=TELEGRAM_CHAT_RATE)
+pools_renders = RenderCache(max_size=RENDER_CACHE_SIZE)
+state_backend = make_state_backend(STATE_BACKEND, STATE_DB_PATH)
+# Во внешние API ходит только лидер, остальные воркеры берут его снимки из state_backend
+is_leader = True
+# Версии опубликованных снимков, уже загруженных в кеши этого воркера
+shared_versions: dict[str, int] = {}
+alerts_revision = 0
+run_mode = "polling"
+stack_sampler = StackSampler()
+pools_decoder = PoolsDecoder(POOLS_DECODE_PROCESSES) if POOLS_DECODE_PROCESSES > 0 else None
+loop_monitor = LoopLagMonitor(LOOP_LAG_INTERVAL)
+# Индексы скринера /top для текущего снимка (строятся при первом запросе к новому снимку)
+screener_index: ScreenerIndex | None = None
+screener_lock = asyncio.Lock()
+
+# Метрики, которые читаются из текущего состояния в момент запроса /metrics
+Gauge("bot_send_queue_depth", "Заданий в очереди исходящих сообщений", lambda: send_scheduler.depth)
+Gauge("bot_pools_snapshot_age_seconds", "Возраст снимка DefiLlama /pools", lambda: pools_cache.age)
+Gauge("bot_pools_snapshot_size", "Пулов в снимке DefiLlama /pools", lambda: len(pools_cache.peek()) if pools_cache.peek() is not None else None)
+Gauge("bot_pools_cache_hit_ratio", "Доля попаданий в кеш /pools", lambda: pools_cache.stats()["hit_ratio"])
+Gauge("bot_render_cache_size", "Готовых ответов /pools в кеше", lambda: len(pools_renders))
+Gauge("bot_alerts", "Подписок на алерты", lambda: len(alert_index))
+Gauge("bot_event_loop_lag_max_seconds", "Наибольшая задержка event loop за последние замеры", lambda: loop_monitor.max_recent)
+Gauge("bot_is_leader", "1, если воркер — лидер и сам ходит во внешние API", lambda: int(is_leader))
+
+def resolve_pool_id(pool_config, pools_snapshot: PoolsSnapshot | None) -> str | None:
+    """UUID пула DefiLlama для записи конфига (из конфига, карты найденных пулов или снимка)."""
+    pool_id = pool_config.defilama_id or pool_resolutions.get(pool_config.key)
+    if pool_id is None and pools_snapshot is not None:
+        row = pools_snapshot.find_row(pool_config, pool_resolutions)
+        pool_id = pools_snapshot.pool_ids[row] if row is not None else None
+    return pool_id
+
+def tracked_pool_ids(pools_snapshot: PoolsSnapshot) -> list[str]:
+    """UUID всех найденных в снимке пулов из конфигурации."""
+    rows = pools_snapshot.rows_for(pools_registry.pools, pool_resolutions)
+    return list(dict.fromkeys(pools_snapshot.pool_ids[row] for row in rows))
+
+async def record_history(pools_snapshot: PoolsSnapshot, now: float) -> None:
+    """Добавляет точки APY/TVL всех отслеживаемых пулов одной транзакцией (не чаще HISTORY_INTERVAL).
+
+    Строки ищутся в event loop: find_row дополняет pool_resolutions, которую save() обходит
+    тоже из event loop. В поток уходит только запись в SQLite.
+    """
+    global last_history_append
+    if now - last_history_append < HISTORY_INTERVAL:
+        return
+    rows = pools_snapshot.rows_for(pools_registry.pools, pool_resolutions)
+    points = [
+        (pools_snapshot.pool_ids[row], int(now), pools_snapshot.display_apy(row), pools_snapshot.tvl_usd(row))
+        for row in dict.fromkeys(rows)
+    ]
+    await asyncio.to_thread(history_store.append, points)
+    last_history_append = now
+
+def publish_snapshot(name: str, data: bytes, updated_at: float) -> None:
+    """Публикует снимок лидера для остальных воркеров."""
+    shared_versions[name] = state_backend.publish_snapshot(name, data, updated_at)
+
+def load_shared_snapshot(name: str, decode):
+    """Снимок, опубликованный лидером: (значение, время снимка) или None, если нового нет."""
+    if state_backend.snapshot_version(name) <= shared_versions.get(name, 0):
+        return None
+    shared = state_backend.load_snapshot(name)
+    if shared is None:
+        return None
+    version, updated_at, data = shared
+    try:
+        value = decode(data)
+    except ValueError as e:  # SnapshotFormatError и ошибки JSON
+        logger.error(f"Опубликованный снимок {name} не читается: {e}")
+        return None
+    shared_versions[name] = version
+    return value, updated_at
+
+def decode_pools_snapshot(data: bytes) -> PoolsSnapshot:
+    return decode_snapshot(data)[0]
+
+async def fetch_pools_snapshot() -> PoolsSnapshot | Timestamped | None:
+    """Загружает свежий снимок, сохраняет его на диск, дописывает историю и проверяет алерты.
+
+    Воркер, который не лидер, вместо запроса к DefiLlama берет снимок, опубликованный лидером,
+    вместе с временем этого снимка; если нового снимка нет — None (кеш оставляет прежний).
+    """
+    if not is_leader:
+        shared = await asyncio.to_thread(load_shared_snapshot, "pools", decode_pools_snapshot)
+        return Timestamped(*shared) if shared is not None else None
+    previous_snapshot = pools_cache.peek()
+    pools_snapshot = await get_defilama_pools_data()
+    if pools_snapshot is not None:
+        now = time.time()
+        await asyncio.to_thread(snapshot_store.save, pools_snapshot, now)
+        if state_backend.shared:
+            await asyncio.to_thread(lambda: publish_snapshot("pools", encode_snapshot(pools_snapshot, now), now))
+        await record_history(pools_snapshot, now)
+        if previous_snapshot is not None:
+            notify_alerts(previous_snapshot, pools_snapshot)
+    return pools_snapshot
+
+def format_metric(metric: str, value: float) -> str:
+    return f"{format_number(value)}%" if metric == "apy" else f"${format_number(value)}"
+
+def notify_alerts(previous_snapshot: PoolsSnapshot, pools_snapshot: PoolsSnapshot) -> None:
+    """Ставит в очередь уведомления по подпискам, чей порог пересечен между двумя снимками."""
+    fired = alert_index.evaluate(previous_snapshot, pools_snapshot)
+    for alert, value in fired:
+        send_scheduler.submit(
+            "send_message",
+            alert.chat_id,
+            BULK,
+            parse_mode=ParseMode.HTML,
+            text=f"🔔 <b>{html.escape(alert.pool_name)}</b>: {html.escape(alert.description)}\n"
+            f"Сейчас {alert.metric.upper()}: <code>{format_metric(alert.metric, value)}</code> (алерт #{alert.id})",
+        )
+    if fired:
+        logger.info(f"Сработало алертов: {len(fired)}")
+
+async def get_pool_chart(pool_id: str) -> list | None:
+    """Получает историю APY/TVL пула с DefiLlama /chart/{pool}."""
+    try:
+        data = await upstream.get_json(DEFILLAMA_CHART_URL.format(pool=pool_id))
+        return parse_chart_points(data)
+    except (httpx.HTTPError, ValueError) as e:
+        logger.error(f"Ошибка при запросе истории пула {pool_id}: {e}")
+        return None
+
+def parse_protocol_summary(data: dict) -> dict:
+    """Из ответа /protocol/{protocol} оставляет только текущий TVL, его изменение за 7 дней и TVL по сетям."""
+    tvl = [point for point in data.get("tvl") or [] if point.get("totalLiquidityUSD") is not None]
+    current = tvl[-1]["totalLiquidityUSD"] if tvl else None
+    week_ago = next((point["totalLiquidityUSD"] for point in reversed(tvl) if point["date"] <= tvl[-1]["date"] - 7 * 86400), None) if tvl else None
+    return {
+        "name": data.get("name"),
+        "tvl": current,
+        "tvl_change_7d": (current / week_ago - 1) * 100 if current is not None and week_ago else None,
+        # Ключи вида Ethereum-borrowed, staking, pool2 — не сети
+        "chain_tvls": {chain: value for chain, value in (data.get("currentChainTvls") or {}).items() if "-" not in chain and chain[:1].isupper()},
+    }
+
+async def get_protocol_summary(protocol: str) -> dict | None:
+    """Получает TVL протокола с DefiLlama /protocol/{protocol} (ответ — мегабайты истории, разбирается в потоке)."""
+    try:
+        response = await upstream.get(DEFILLAMA_PROTOCOL_URL.format(protocol=protocol))
+        return await asyncio.to_thread(lambda: parse_protocol_summary(response.json()))
+    except (httpx.HTTPError, ValueError, AttributeError, KeyError, TypeError) as e:
+        logger.error(f"Ошибка при запросе протокола {protocol}: {e}")
+        return None
+
+# Параллельные запросы /chart и /protocol для подробностей по пулам и загрузки истории.
+# Подробности по кнопке загружает тот воркер, который обрабатывает нажатие (как и промахи цен
+# в /prices), а загрузку истории backfill_history выполняет только лидер
+chart_fanout = FanOut(get_pool_chart, ttl=CHART_CACHE_TTL, concurrency=DETAILS_CONCURRENCY,
+                      request_timeout=DETAILS_REQUEST_TIMEOUT, name="defillama_chart")
+protocol_fanout = FanOut(get_protocol_summary, ttl=PROTOCOL_CACHE_TTL, concurrency=DETAILS_CONCURRENCY,
+                         request_timeout=DETAILS_REQUEST_TIMEOUT, max_entries=1024, name="defillama_protocol")
+
+# Общий кеш снимка DefiLlama: все нажатия кнопок ждут одну загрузку
+pools_cache = SnapshotCache(
+    fetch_pools_snapshot,
+    ttl=POOLS_CACHE_TTL,
+    stale_ttl=POOLS_CACHE_STALE_TTL,
+    name="defillama_pools",
+)
+
 # Обновляем format_number для HTML и без экранирования точек
 def format_number(number) -> str:
     """Форматирует число для вывода (добавляет запятые, округляет)."""
@@ -110,68 +382,413 @@ def format_number(number) -> str:
 
 # --- Обработчики команд ---
 
-# Функция для получения цен с CoinGecko (остается без изменений)
-def get_crypto_prices():
-    """Получает текущие цены для BTC, ETH, CRV с CoinGecko."""
-    ids = ",".join(COIN_IDS)
-    url = f"https://api.coingecko.com/api/v3/simple/price?ids={ids}&vs_currencies={VS_CURRENCY}"
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        prices = response.json()
-        return prices
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Ошибка при запросе к CoinGecko: {e}")
+# Цены DefiLlama: локальный индекс тикеров и кеш на каждую монету.
+# Исключение из правила "во внешние API ходит только лидер": промах кеша в /prices и inline
+# запросе любой воркер загружает сам — ответ нужен пользователю сейчас, а не после синхронизации
+# с лидером. Фоновое обновление отслеживаемых монет (fetch_watched_prices) — только у лидера.
+coin_index = CoinIndex.load(COINS_INDEX_PATH)
+price_service = PriceService(upstream, ttl=PRICES_CACHE_TTL)
+
+def watch_coins(coins) -> None:
+    """Добавляет монеты в фоновое обновление (пока не достигнут PRICES_WATCH_LIMIT)."""
+    for coin in coins:
+        if len(price_service.watched) >= PRICES_WATCH_LIMIT:
+            break
+        price_service.watched.add(coin)
+
+async def fetch_watched_prices() -> dict | Timestamped | None:
+    """Обновляет цены отслеживаемых монет одной пачкой запросов (не лидер берет цены, опубликованные лидером)."""
+    if not is_leader:
+        shared = await asyncio.to_thread(load_shared_snapshot, "prices", json.loads)
+        if shared is None:
+            return None
+        price_service.load(shared[0])
+        return Timestamped(*shared)
+    if not await price_service.refresh_watched():
         return None
+    prices = price_service.export(price_service.watched)
+    if state_backend.shared:
+        await asyncio.to_thread(publish_snapshot, "prices", json.dumps(prices).encode("utf-8"), time.time())
+    return prices
+
+# Снимок цен отслеживаемых монет, поддерживается в актуальном состоянии фоновым обновлением
+prices_cache = SnapshotCache(
+    fetch_watched_prices,
+    ttl=PRICES_CACHE_TTL,
+    stale_ttl=PRICES_CACHE_TTL * 5,
+    name="defillama_prices",
+)
+
+def format_price(price: float) -> str:
+    return f"{price:,.2f}" if price >= 1 else f"{price:.6g}"
+
+def format_updated_at(cache: SnapshotCache) -> str:
+    """Строка с временем последнего успешного обновления данных кеша."""
+    if cache.updated_at is None:
+        return "<i>Данные еще не обновлялись.</i>"
+    if cache.restored:
+        updated = time.strftime("%Y-%m-%d %H:%M UTC", time.gmtime(cache.updated_at))
+        return f"<i>Данные на {updated} (сохраненный снимок, идет обновление)</i>"
+    updated = time.strftime("%H:%M:%S UTC", time.gmtime(cache.updated_at))
+    return f"<i>Обновлено: {updated}</i>"
 
 async def prices_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Отправляет сообщение с текущими ценами криптовалют с CoinGecko."""
-    prices = await asyncio.to_thread(get_crypto_prices) # Выполняем синхронный запрос в потоке
-    if prices:
-        # Используем HTML для форматирования
-        message_lines = ["<b>Текущие курсы (CoinGecko):</b>\n"]
-        for coin_id in COIN_IDS:
-            coin_data = prices.get(coin_id)
-            if coin_data and VS_CURRENCY in coin_data:
-                price = coin_data[VS_CURRENCY]
-                symbol = ""
-                if coin_id == "bitcoin": symbol = "BTC"
-                elif coin_id == "ethereum": symbol = "ETH"
-                elif coin_id == "curve-dao-token": symbol = "CRV"
-                message_lines.append(f"<code>{symbol}</code>: ${format_number(price)}")
+    """/prices [тикеры] — текущие цены и изменение за 24 часа из DefiLlama coins API."""
+    symbols = context.args or PRICE_SYMBOLS
+    resolved = []
+    unknown = []
+    for symbol in symbols:
+        found = coin_index.resolve(symbol)
+        if found is None:
+            unknown.append(symbol)
+        else:
+            resolved.append(found)
+    coins = [coin for _, coin in resolved]
+    # Все монеты — одной пачкой запросов; свежие цены берутся из кеша без сети
+    quotes = await price_service.quotes(coins)
+    # В фоновое обновление — монеты из индекса и ID, для которых DefiLlama вернула цену
+    watch_coins(coin for coin in coins if coin in quotes or coin in coin_index.symbol_by_coin)
+    day_ago = await price_service.historical(list(quotes), int(time.time() - 86400) // 600 * 600) if quotes else {}
+
+    message_lines = ["<b>Текущие курсы (DefiLlama):</b>\n"]
+    for symbol, coin in resolved:
+        quote = quotes.get(coin)
+        if quote is None:
+            message_lines.append(f"Не удалось получить цену для <code>{html.escape(symbol)}</code>")
+            continue
+        line = f"<code>{html.escape(symbol)}</code>: ${format_price(quote.price)}"
+        if day_ago.get(coin):
+            line += f" ({(quote.price / day_ago[coin] - 1) * 100:+.2f}% за 24 ч)"
+        message_lines.append(line)
+    if unknown:
+        message_lines.append(f"\nНеизвестные тикеры: <code>{html.escape(', '.join(unknown))}</code> (можно указать ID вида ethereum:0x...)")
+    if quotes:
+        updated = time.strftime("%H:%M:%S UTC", time.gmtime(min(quote.fetched for quote in quotes.values())))
+        message_lines.append(f"\n<i>Обновлено: {updated}</i>")
+    await update.message.reply_text("\n".join(message_lines), parse_mode=ParseMode.HTML)
+
+async def inline_query_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Inline запрос '@бот eth': цены только из кеша, недостающие загружаются в фоне к следующему запросу."""
+    query = update.inline_query
+    matches = []
+    for word in query.query.replace(",", " ").split()[:5]:
+        matches += [match for match in coin_index.search(word, limit=10) if match not in matches]
+    matches = matches[:20]
+    coins = [coin for _, coin in matches]
+    quotes = price_service.cached(coins)
+    missing = [coin for coin in coins if coin not in quotes]
+    if missing:
+        watch_coins(missing)
+        context.application.create_task(price_service.quotes(missing))
+
+    results = []
+    for symbol, coin in matches:
+        quote = quotes.get(coin)
+        if quote is None:
+            continue
+        text = f"<b>{html.escape(symbol)}</b>: ${format_price(quote.price)}"
+        results.append(InlineQueryResultArticle(
+            id=coin[:64],
+            title=f"{symbol}: ${format_price(quote.price)}",
+            description=f"{coin} · {time.strftime('%H:%M:%S UTC', time.gmtime(quote.fetched))}",
+            input_message_content=InputTextMessageContent(text, parse_mode=ParseMode.HTML),
+        ))
+    # Пока часть цен загружается, просим Telegram не кешировать ответ
+    await query.answer(results, cache_time=1 if missing else int(PRICES_CACHE_TTL), is_personal=False)
+
+def group_title(group: str) -> str:
+    return group.capitalize() if group != ALL_GROUPS else 'Все'
+
+# Лимит длины текста сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+def split_message(message: str, max_length: int = MAX_MESSAGE_LENGTH) -> list[str]:
+    """Разбивает сообщение на части не длиннее max_length, по возможности по переносу строки."""
+    if len(message) <= max_length:
+        return [message]
+    first_part = message[:max_length]
+    # Обрезаем до последнего переноса строки
+    last_newline = first_part.rfind('\n')
+    if last_newline != -1:
+        first_part = first_part[:last_newline]
+    remaining_message = message[len(first_part):].strip()
+    return [first_part] + [remaining_message[i:i + max_length] for i in range(0, len(remaining_message), max_length)]
+
+def match_pool_rows(pools_snapshot: PoolsSnapshot, selected_chain: str, selected_group: str) -> list[int]:
+    """Строки снимка для пулов конфига выбранной сети/группы."""
+    filtered_config_pools = pools_registry.pools_for(selected_chain, selected_group)
+    # Сопоставляем: поиск по ID/ключу 'pool', затем по карте найденных пулов и индексу chain/project/symbol
+    return pools_snapshot.rows_for(filtered_config_pools, pool_resolutions)
+
+def render_pools_table(pools_snapshot: PoolsSnapshot, rows: list[int], selected_chain: str, selected_group: str, page_label: str | None = None) -> str:
+    """HTML таблица найденных пулов (одна страница результата, если задан page_label)."""
+    # Максимальная длина для выравнивания
+    max_project_len = max(len(pools_snapshot.project[row] or 'N/A') for row in rows)
+    max_symbol_len = max(len(pools_snapshot.symbol[row] or 'N/A') for row in rows)
+    # Рассчитываем ширину для числовых полей (примерно)
+    max_apy_len = 7 # Примерно: "123.45%"
+    max_tvl_len = 10 # Примерно: "$123.45B"
+
+    page_suffix = f" (стр. {page_label})" if page_label else ""
+    message_lines = [f"<b>Пулы для сети {html.escape(selected_chain.capitalize())} / группа {html.escape(group_title(selected_group))}{page_suffix}:</b>\n"]
+    for row in rows:
+        # Экранируем HTML символы в данных перед вставкой в <code>
+        project_str = html.escape(pools_snapshot.project[row] or 'N/A').ljust(max_project_len)
+        symbol_str = html.escape(pools_snapshot.symbol[row] or 'N/A').ljust(max_symbol_len)
+        apy_str = (format_number(pools_snapshot.display_apy(row)) + '%').rjust(max_apy_len)
+        tvl_str = ('$' + format_number(pools_snapshot.tvl_usd(row))).rjust(max_tvl_len)
+        message_lines.append(f"<code>{project_str} - {symbol_str} : {apy_str}, {tvl_str}</code>")
+
+    message_lines.append("\n" + format_updated_at(pools_cache))
+    return "\n".join(message_lines)
+
+# Порядок строк результата /pools: код в callback_data -> подпись кнопки
+SORT_ORDERS = {"c": "Как в конфиге", "a": "APY", "t": "TVL"}
+
+def render_pools_result(pools_snapshot: PoolsSnapshot, selected_chain: str, selected_group: str, sort: str = "c") -> list[str]:
+    """Готовит страницы HTML таблицы пулов сети/группы (пустой список — ничего не найдено).
+
+    На странице не больше POOLS_PAGE_SIZE пулов и не больше MAX_MESSAGE_LENGTH символов:
+    ширина колонок зависит от самых длинных названий, поэтому страница, которая не
+    помещается в одно сообщение, делится пополам, пока не поместится.
+    """
+    with span("match"):
+        rows = match_pool_rows(pools_snapshot, selected_chain, selected_group)
+        if sort != "c":
+            rows = pools_snapshot.sort_rows(rows, by="apy" if sort == "a" else "tvl")
+    with span("render"):
+        pending = [rows[i:i + POOLS_PAGE_SIZE] for i in range(0, len(rows), POOLS_PAGE_SIZE)]
+        pages = []
+        while pending:
+            page_rows = pending.pop(0)
+            # "999/999" — самая длинная подпись страницы, итоговое число страниц еще неизвестно
+            text = render_pools_table(pools_snapshot, page_rows, selected_chain, selected_group, "999/999")
+            if len(text) > MAX_MESSAGE_LENGTH and len(page_rows) > 1:
+                half = len(page_rows) // 2
+                pending[:0] = [page_rows[:half], page_rows[half:]]
             else:
-                 message_lines.append(f"Не удалось получить цену для <code>{coin_id.upper()}</code>")
+                pages.append(page_rows)
+        return [
+            render_pools_table(pools_snapshot, page_rows, selected_chain, selected_group, f"{number}/{len(pages)}" if len(pages) > 1 else None)
+            for number, page_rows in enumerate(pages, start=1)
+        ]
 
-        message = "\n".join(message_lines)
-        await update.message.reply_text(message, parse_mode=ParseMode.HTML)
-    else:
-        await update.message.reply_text("Не удалось получить курсы с CoinGecko. Попробуйте позже.")
+def pools_page_callback(selected_chain: str, selected_group: str, sort: str, page: int) -> str:
+    """Курсор страницы: pg:<сортировка><страница>:<сеть>:<группа>.
+
+    Короче, чем select_group:<сеть>:<группа>, поэтому проверка длины в конфиге
+    гарантирует лимит Telegram в 64 байта и для курсора.
+    """
+    return f"pg:{sort}{page}:{selected_chain}:{selected_group}"
+
+def pools_keyboard(selected_chain: str, selected_group: str, sort: str, page: int, pages: int) -> InlineKeyboardMarkup:
+    """Клавиатура под страницей: назад/вперед, выбор сортировки и подробности."""
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("◀️", callback_data=pools_page_callback(selected_chain, selected_group, sort, page - 1)))
+    if pages > 1:
+        navigation.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="noop"))
+    if page < pages - 1:
+        navigation.append(InlineKeyboardButton("▶️", callback_data=pools_page_callback(selected_chain, selected_group, sort, page + 1)))
+    sorting = [
+        InlineKeyboardButton(f"✓ {title}", callback_data="noop") if key == sort
+        else InlineKeyboardButton(title, callback_data=pools_page_callback(selected_chain, selected_group, key, 0))
+        for key, title in SORT_ORDERS.items()
+    ]
+    keyboard = [navigation] if navigation else []
+    keyboard += [sorting, details_keyboard(selected_chain, selected_group).inline_keyboard[0]]
+    return InlineKeyboardMarkup(keyboard)
+
+async def show_pools_page(query, selected_chain: str, selected_group: str, sort: str, page: int) -> None:
+    """Показывает страницу результата одной правкой сообщения с кнопками.
+
+    Страницы собираются один раз на снимок (и конфигурацию) для каждой сортировки
+    и лежат в pools_renders, поэтому листание не трогает ни DefiLlama, ни снимок.
+    """
+    # Получаем данные от DefiLlama (сообщение об ожидании — только если снимка в памяти еще нет)
+    if pools_cache.peek() is None:
+        await query.edit_message_text(text=f"Сеть: <b>{html.escape(selected_chain.capitalize())}</b>\nГруппа: <b>{html.escape(group_title(selected_group))}</b>\n\nЗапрашиваю данные...", parse_mode=ParseMode.HTML)
+    with span("cache"):
+        pools_snapshot = await pools_cache.get()
+    if pools_snapshot is None:
+        await query.edit_message_text(text="Ошибка: Не удалось получить данные от DefiLlama API.")
+        return
+
+    # Готовые страницы берутся из кеша, пока не изменились снимок или конфигурация
+    pages = pools_renders.get_or_render(
+        (selected_chain.lower(), selected_group.lower(), sort),
+        (pools_cache.version, pools_registry.version),
+        lambda: render_pools_result(pools_snapshot, selected_chain, selected_group, sort),
+    )
+    # Запоминаем пулы, найденные по chain/project/symbol, для следующих снимков
+    pool_resolutions.save()
+    if not pages:
+        await query.edit_message_text(
+            text=f"Не найдено данных в DefiLlama для пулов сети <b>{html.escape(selected_chain.capitalize())}</b> и группы <b>{html.escape(group_title(selected_group))}</b>.",
+            parse_mode=ParseMode.HTML,
+        )
+        return
+    # После обновления снимка страниц могло стать меньше
+    page = min(max(page, 0), len(pages) - 1)
+
+    # Правка идет через очередь отправки: она соблюдает лимиты Telegram и склеивает быстрые нажатия
+    with span("telegram"):
+        try:
+            await send_scheduler.edit_message_text(
+                query.message.chat_id, query.message.message_id, pages[page], INTERACTIVE, parse_mode=ParseMode.HTML,
+                reply_markup=pools_keyboard(selected_chain, selected_group, sort, page, len(pages)),
+            )
+        except BadRequest as e:
+            # Повторное нажатие той же кнопки: страница уже показана
+            if "not modified" not in str(e).lower():
+                raise
+
+def details_keyboard(selected_chain: str, selected_group: str, text: str = "📈 Подробнее: история APY и TVL протоколов") -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([[InlineKeyboardButton(text, callback_data=f"details:{selected_chain}:{selected_group}")]])
+
+async def load_pool_details(pools_snapshot: PoolsSnapshot, rows: list[int]) -> tuple[FanOutResult, FanOutResult]:
+    """Параллельно загружает /chart всех пулов и /protocol их протоколов (не дольше DETAILS_DEADLINE)."""
+    pool_ids = [pools_snapshot.pool_ids[row] for row in rows]
+    protocols = [project for project in dict.fromkeys(pools_snapshot.project[row] for row in rows) if project]
+    return await asyncio.gather(
+        chart_fanout.get_many(pool_ids, DETAILS_DEADLINE),
+        protocol_fanout.get_many(protocols, DETAILS_DEADLINE),
+    )
+
+def render_pool_details(pools_snapshot: PoolsSnapshot, rows: list[int], charts: FanOutResult, protocols: FanOutResult,
+                        selected_chain: str, selected_group: str) -> str:
+    """HTML с APY (сейчас и средний по окнам), изменением TVL пулов и TVL протоколов; недогруженные помечены."""
+    now = int(time.time())
+    message_lines = [
+        f"<b>Подробности: {html.escape(selected_chain.capitalize())} / {html.escape(group_title(selected_group))}</b>",
+        f"<i>APY сейчас / средний {' / '.join(WINDOWS)}, TVL и изменение за {next(iter(WINDOWS))}</i>\n",
+    ]
+    for row in rows:
+        pool_id = pools_snapshot.pool_ids[row]
+        name = html.escape(f"{pools_snapshot.project[row] or 'N/A'} - {pools_snapshot.symbol[row] or 'N/A'}")
+        points = charts.values.get(pool_id)
+        if points is None:
+            message_lines.append(f"<code>{name}</code>: {'загружается…' if pool_id in charts.pending else 'нет данных'}")
+            continue
+        summary = summarize_chart_points(points, now)
+        averages = " / ".join(format_number(window["apy_avg"]) + "%" for window in summary.values())
+        tvl_change = next(iter(summary.values()))["tvl_change"]
+        line = f"<code>{name}</code>: {format_number(pools_snapshot.display_apy(row))}% / {averages}, ${format_number(pools_snapshot.tvl_usd(row))}"
+        if tvl_change is not None:
+            line += f" ({tvl_change:+.1f}%)"
+        message_lines.append(line + (" <i>(устар.)</i>" if pool_id in charts.stale else ""))
+
+    if protocols.values:
+        message_lines.append("\n<b>TVL протоколов</b> (всего / в сети, изменение за 7д):")
+    for protocol, summary in protocols.values.items():
+        chain_tvl = next((value for chain, value in summary["chain_tvls"].items() if chain.lower() == selected_chain.lower()), None)
+        line = f"<code>{html.escape(summary['name'] or protocol)}</code>: ${format_number(summary['tvl'])} / ${format_number(chain_tvl)}"
+        if summary["tvl_change_7d"] is not None:
+            line += f" ({summary['tvl_change_7d']:+.1f}%)"
+        message_lines.append(line)
+
+    loading = len(charts.pending) + len(protocols.pending)
+    if loading:
+        message_lines.append(f"\n⏳ Еще загружается: {loading}. Нажмите «Обновить» через несколько секунд.")
+    elif charts.failed or protocols.failed:
+        message_lines.append(f"\nНе удалось загрузить: {len(charts.failed) + len(protocols.failed)}.")
+    message_lines.append("\n" + format_updated_at(pools_cache))
+    return "\n".join(message_lines)
+
+async def details_callback(query, selected_chain: str, selected_group: str) -> None:
+    """Кнопка "Подробнее": история APY и TVL протоколов для всех пулов сети/группы, загруженные параллельно."""
+    with span("cache"):
+        pools_snapshot = await pools_cache.get()
+    if pools_snapshot is None:
+        await send_scheduler.send_message(query.message.chat_id, "Ошибка: Не удалось получить данные от DefiLlama API.", INTERACTIVE)
+        return
+    with span("match"):
+        rows = list(dict.fromkeys(match_pool_rows(pools_snapshot, selected_chain, selected_group)))
+    if not rows:
+        await send_scheduler.send_message(query.message.chat_id, "Не найдено данных в DefiLlama для этих пулов.", INTERACTIVE)
+        return
+
+    chat_id = query.message.chat_id
+    # Если все уже в кеше, ответ будет сразу; иначе сначала показываем, что идет загрузка
+    cached = all(chart_fanout.cached(pools_snapshot.pool_ids[row], CHART_CACHE_TTL) is not None for row in rows)
+    status = None
+    if not cached:
+        status = await send_scheduler.send_message(chat_id, f"Загружаю историю {len(rows)} пулов...", INTERACTIVE)
+    with span("fanout"):
+        charts, protocols = await load_pool_details(pools_snapshot, rows)
+    with span("render"):
+        message_parts = split_message(render_pool_details(pools_snapshot, rows, charts, protocols, selected_chain, selected_group))
+    # Недогруженное можно дозапросить той же кнопкой: загрузки продолжаются в фоне
+    reply_markup = None if charts.complete and protocols.complete else details_keyboard(selected_chain, selected_group, "🔄 Обновить")
+    with span("telegram"):
+        for i, part in enumerate(message_parts):
+            markup = reply_markup if i == len(message_parts) - 1 else None
+            if i == 0 and status is not None:
+                await send_scheduler.edit_message_text(chat_id, status.message_id, part, INTERACTIVE, parse_mode=ParseMode.HTML, reply_markup=markup)
+            else:
+                await send_scheduler.send_message(chat_id, part, INTERACTIVE, parse_mode=ParseMode.HTML, reply_markup=markup)
+
+async def get_screener_index(pools_snapshot: PoolsSnapshot) -> ScreenerIndex:
+    """Индексы скринера для снимка: строятся в потоке один раз, конкурентные запросы ждут ту же сборку."""
+    global screener_index
+    async with screener_lock:
+        if screener_index is None or screener_index.snapshot is not pools_snapshot:
+            with span("build"):
+                screener_index = await asyncio.to_thread(ScreenerIndex, pools_snapshot)
+    return screener_index
+
+def render_top(index: ScreenerIndex, rows: list[int], title: str) -> str:
+    pools_snapshot = index.snapshot
+    message_lines = [f"<b>{html.escape(title)}</b>\n"]
+    for position, row in enumerate(rows, start=1):
+        name = html.escape(f"{pools_snapshot.project[row] or 'N/A'} - {pools_snapshot.symbol[row] or 'N/A'}")
+        apy = format_number(index.apy[row] if index.apy[row] == index.apy[row] else None)
+        message_lines.append(f"{position}. <code>{name}</code> ({html.escape(pools_snapshot.chain[row])}): "
+                             f"{apy}%, ${format_number(pools_snapshot.tvl_usd(row))}")
+    message_lines.append("\n" + format_updated_at(pools_cache))
+    return "\n".join(message_lines)
+
+async def top_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/top [сети] [stablecoin|volatile] [single|multi] [apy>N] [tvl>N] [sort=apy|tvl] [limit=N] — скринер по всем пулам DefiLlama."""
+    if POOLS_TRACKED_ONLY:
+        await update.message.reply_text("Скринер недоступен: в снимке только пулы из конфигурации (POOLS_TRACKED_ONLY=1).")
+        return
+    try:
+        query = parse_query(context.args)
+    except ScreenerSyntaxError as e:
+        await update.message.reply_text(f"Ошибка: {e}.\nПример: /top ethereum stablecoin apy>5 tvl>10M sort=apy limit=20")
+        return
+    with span("cache"):
+        pools_snapshot = await pools_cache.get()
+    if pools_snapshot is None:
+        await update.message.reply_text("Ошибка: Не удалось получить данные от DefiLlama API.")
+        return
+    index = await get_screener_index(pools_snapshot)
+    unknown = [chain for chain in query.chains if chain not in index.chain_names]
+    if unknown:
+        await update.message.reply_text(f"Сеть не найдена: {', '.join(unknown)}.")
+        return
+
+    with span("match"):
+        rows = index.query(query)
+    if not rows:
+        await update.message.reply_text("Под фильтры не подошел ни один пул.")
+        return
+    chains = ", ".join(index.chain_names[chain] for chain in query.chains) or "все сети"
+    with span("render"):
+        message_parts = split_message(render_top(index, rows, f"Топ {len(rows)} по {query.sort.upper()}: {chains}"))
+    for part in message_parts:
+        await update.message.reply_text(part, parse_mode=ParseMode.HTML)
 
 # Команда /pools теперь инициирует выбор сети
 async def pools_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Начинает процесс выбора сети для фильтрации пулов."""
-    tracked_pools = load_pools_config()
-    if not tracked_pools:
+    if not pools_registry.pools:
         await update.message.reply_text("Ошибка: Не удалось загрузить конфигурацию пулов.")
         return
 
-    # Получаем уникальные сети из конфига
-    chains = sorted(list(set(pool.get("chain", "Unknown") for pool in tracked_pools)))
-
-    keyboard = []
-    # Создаем кнопки для каждой сети (2 в ряд)
-    row = []
-    for chain in chains:
-        # callback_data будет содержать префикс и название сети
-        row.append(InlineKeyboardButton(chain.capitalize(), callback_data=f"select_chain:{chain}"))
-        if len(row) == 2:
-            keyboard.append(row)
-            row = []
-    if row: # Добавляем оставшиеся кнопки, если их нечетное число
-        keyboard.append(row)
-
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text("Выберите сеть:", reply_markup=reply_markup)
+    # Клавиатура с сетями (2 в ряд) заранее собрана реестром конфигурации
+    await update.message.reply_text("Выберите сеть:", reply_markup=pools_registry.chains_keyboard)
 
 # Новый обработчик для кнопок
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -186,30 +803,15 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # --- Шаг 1: Выбрана сеть ---
     if action == "select_chain":
         selected_chain = parts[1]
-        context.user_data['selected_chain'] = selected_chain # Сохраняем выбор
-
-        tracked_pools = load_pools_config()
-        # Получаем уникальные группы для выбранной сети
-        groups = sorted(list(set(
-            pool.get("ticker_group", "Unknown")
-            for pool in tracked_pools
-            if pool.get("chain", "").lower() == selected_chain.lower() and pool.get("ticker_group")
-        )))
-
-        keyboard = []
-        row = []
-        # Кнопка "Все группы"
-        row.append(InlineKeyboardButton("Все группы", callback_data=f"select_group:{selected_chain}:all_groups"))
-        # Кнопки для каждой группы (2 в ряд)
-        for group in groups:
-            row.append(InlineKeyboardButton(group.capitalize(), callback_data=f"select_group:{selected_chain}:{group}"))
-            if len(row) == 2:
-                keyboard.append(row)
-                row = []
-        if row:
-            keyboard.append(row)
-
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        # Сохраняем выбор в общем состоянии: следующее нажатие может попасть на другой воркер
+        await asyncio.to_thread(state_backend.set_user_value, query.from_user.id, "selected_chain", selected_chain)
+
+        # Клавиатура "Все группы" + группы сети (2 в ряд) заранее собрана реестром конфигурации
+        reply_markup = pools_registry.groups_keyboard(selected_chain)
+        if reply_markup is None:
+            await query.edit_message_text(text="Сеть не найдена в конфигурации. Попробуйте снова /pools")
+            return
+
         await query.edit_message_text(
             text=f"Сеть: <b>{html.escape(selected_chain.capitalize())}</b>\nВыберите группу тикеров:",
             reply_markup=reply_markup,
@@ -227,113 +829,189 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         selected_group = parts[2]
 
         # Проверяем, что сеть была сохранена
-        if context.user_data.get('selected_chain') != selected_chain:
-            logger.warning(f"Несовпадение сети в user_data и callback_data: {context.user_data.get('selected_chain')} vs {selected_chain}")
+        saved_chain = await asyncio.to_thread(state_backend.get_user_value, query.from_user.id, "selected_chain")
+        if saved_chain != selected_chain:
+            logger.warning(f"Несовпадение сети в сохраненном состоянии и callback_data: {saved_chain} vs {selected_chain}")
             await query.edit_message_text(text="Произошла ошибка состояния. Попробуйте снова /pools")
             return
 
-        await query.edit_message_text(text=f"Сеть: <b>{html.escape(selected_chain.capitalize())}</b>\nГруппа: <b>{html.escape(selected_group.capitalize() if selected_group != 'all_groups' else 'Все')}</b>\n\nЗапрашиваю данные...", parse_mode=ParseMode.HTML)
+        # Фильтруем пулы из конфига по выбранной сети и группе
+        if not pools_registry.pools_for(selected_chain, selected_group):
+             await query.edit_message_text(text=f"Не найдено настроенных пулов для сети <b>{html.escape(selected_chain.capitalize())}</b> и группы <b>{html.escape(group_title(selected_group))}</b>.", parse_mode=ParseMode.HTML)
+             return
 
-        # Получаем данные от DefiLlama
-        defilama_data_dict = await asyncio.to_thread(get_defilama_pools_data_sync)
-        if defilama_data_dict is None:
-            await query.edit_message_text(text="Ошибка: Не удалось получить данные от DefiLlama API.")
+        await show_pools_page(query, selected_chain, selected_group, "c", 0)
+
+    # --- Листание страниц и смена сортировки ---
+    elif action == "pg":
+        cursor = callback_data.split(":", 3)
+        if len(cursor) < 4 or cursor[1][:1] not in SORT_ORDERS or not cursor[1][1:].isdigit():
+            logger.warning(f"Некорректный callback_data для pg: {callback_data}")
             return
+        await show_pools_page(query, cursor[2], cursor[3], cursor[1][0], int(cursor[1][1:]))
 
-        # Фильтруем пулы из конфига по выбранной сети и группе
-        tracked_pools = load_pools_config()
-        filtered_config_pools = [
-            pool for pool in tracked_pools
-            if pool.get("chain", "").lower() == selected_chain.lower() and
-               (selected_group == "all_groups" or pool.get("ticker_group", "").lower() == selected_group.lower())
-        ]
+    elif action == "noop":
+        return
 
-        if not filtered_config_pools:
-             await query.edit_message_text(text=f"Не найдено настроенных пулов для сети <b>{html.escape(selected_chain.capitalize())}</b> и группы <b>{html.escape(selected_group.capitalize() if selected_group != 'all_groups' else 'Все')}</b>.", parse_mode=ParseMode.HTML)
-             return
+    # --- Подробности по всем пулам сети/группы ---
+    elif action == "details":
+        if len(parts) < 3:
+            logger.warning(f"Некорректный callback_data для details: {callback_data}")
+            return
+        await details_callback(query, parts[1], parts[2])
 
-        # Сопоставляем и готовим данные для вывода
-        results = []
-        max_project_len = 0
-        max_symbol_len = 0
+def format_seconds(seconds: float | None) -> str:
+    return f"{seconds * 1000:.0f} мс" if seconds is not None else "N/A"
 
-        for pool_config in filtered_config_pools:
-            pool_key_from_config = pool_config.get("defilama_id") # Ищем по ID/ключу 'pool'
-            found_pool_data = None
+def format_decoder_stats() -> str:
+    if pools_decoder is None:
+        return "Разбор /pools: в event loop (POOLS_DECODE_PROCESSES=0)"
+    decoder_stats = pools_decoder.stats()
+    return (f"Разбор /pools: процессов <code>{decoder_stats['processes']}</code>, разборов <code>{decoder_stats['decodes']}</code>, "
+            f"ошибок <code>{decoder_stats['errors']}</code>, последний <code>{format_seconds(decoder_stats['last_seconds'])}</code> "
+            f"(<code>{decoder_stats['last_bytes'] / 1024:.0f}</code> КБ снимка)")
 
-            if pool_key_from_config and pool_key_from_config in defilama_data_dict:
-                found_pool_data = defilama_data_dict[pool_key_from_config]
-            else:
-                # Поиск по chain/project/symbol (запасной вариант)
-                conf_chain = pool_config.get("chain", "").lower()
-                conf_project = pool_config.get("project", "").lower()
-                conf_symbol = pool_config.get("symbol", "").lower()
-                if conf_chain and conf_project and conf_symbol:
-                    for llama_pool in defilama_data_dict.values():
-                        # Сравнение должно быть более точным, возможно, с учетом регистра для project/symbol
-                        if (llama_pool.get("chain", "").lower() == conf_chain and
-                            llama_pool.get("project", "") == pool_config.get("project", "") and # Сверяем с оригиналом из конфига
-                            llama_pool.get("symbol", "") == pool_config.get("symbol", "")):
-                            found_pool_data = llama_pool
-                            logger.info(f"Найден пул по совпадению chain/project/symbol: {pool_config.get('user_comment')}")
-                            break
-
-            if found_pool_data:
-                project = found_pool_data.get('project', 'N/A')
-                symbol = found_pool_data.get('symbol', 'N/A')
-                apy = found_pool_data.get('apy')
-                if apy is None:
-                    apy = found_pool_data.get('apyBase')
-                tvl = found_pool_data.get('tvlUsd')
-
-                results.append({
-                    "project": project,
-                    "symbol": symbol,
-                    "apy": apy,
-                    "tvl": tvl
-                })
-                # Обновляем максимальную длину для выравнивания
-                max_project_len = max(max_project_len, len(project))
-                max_symbol_len = max(max_symbol_len, len(symbol))
-
-        # Форматируем вывод
-        if not results:
-            message = f"Не найдено данных в DefiLlama для пулов сети <b>{html.escape(selected_chain.capitalize())}</b> и группы <b>{html.escape(selected_group.capitalize() if selected_group != 'all_groups' else 'Все')}</b>."
-        else:
-            message_lines = [f"<b>Пулы для сети {html.escape(selected_chain.capitalize())} / группа {html.escape(selected_group.capitalize() if selected_group != 'all_groups' else 'Все')}:</b>\n"]
-            # Рассчитываем ширину для числовых полей (примерно)
-            max_apy_len = 7 # Примерно: "123.45%"
-            max_tvl_len = 10 # Примерно: "$123.45B"
-
-            for res in results:
-                # Экранируем HTML символы в данных перед вставкой в <code>
-                project_str = html.escape(res['project']).ljust(max_project_len)
-                symbol_str = html.escape(res['symbol']).ljust(max_symbol_len)
-                apy_str = (format_number(res['apy']) + '%').rjust(max_apy_len)
-                tvl_str = ('$' + format_number(res['tvl'])).rjust(max_tvl_len)
-                message_lines.append(f"<code>{project_str} - {symbol_str} : {apy_str}, {tvl_str}</code>")
-
-            message = "\n".join(message_lines)
-
-        # Отправляем или редактируем сообщение
-        # Разбивка на части, если нужно (логика аналогична предыдущей, но с HTML)
-        max_length = 4096
-        if len(message) <= max_length:
-            await query.edit_message_text(text=message, parse_mode=ParseMode.HTML)
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показывает счетчики кеша данных DefiLlama."""
+    stats = pools_cache.stats()
+    send_stats = send_scheduler.stats()
+    price_stats = price_service.stats()
+    chart_stats = chart_fanout.stats()
+    protocol_stats = protocol_fanout.stats()
+    lag_stats = loop_monitor.stats()
+    age = stats["age"]
+    message_lines = [
+        "<b>Кеш DefiLlama /pools:</b>",
+        f"Попадания: <code>{stats['hits']}</code> (устаревшие: <code>{stats['stale_hits']}</code>)",
+        f"Промахи: <code>{stats['misses']}</code> (объединено с текущей загрузкой: <code>{stats['coalesced']}</code>)",
+        f"Загрузок: <code>{stats['refreshes']}</code>, ошибок: <code>{stats['errors']}</code>",
+        f"Доля попаданий: <code>{stats['hit_ratio']:.0%}</code>",
+        f"Возраст снимка: <code>{f'{age:.0f} с' if age is not None else 'нет данных'}</code>",
+        f"Очередь отправки: <code>{send_stats['depth']}</code>, отправлено <code>{send_stats['sent']}</code>, "
+        f"ошибок <code>{send_stats['failed']}</code>, объединено правок <code>{send_stats['coalesced']}</code>, "
+        f"задержка p50/p95: <code>{format_seconds(send_stats['latency_p50'])}</code>/<code>{format_seconds(send_stats['latency_p95'])}</code>",
+        f"Кеш готовых ответов: <code>{len(pools_renders)}</code> (попаданий <code>{pools_renders.hits}</code>, промахов <code>{pools_renders.misses}</code>)",
+        f"Цены DefiLlama: монет в кеше <code>{price_stats['coins']}</code> (отслеживается <code>{price_stats['watched']}</code>), "
+        f"попаданий <code>{price_stats['hits']}</code>, промахов <code>{price_stats['misses']}</code>, "
+        f"объединено <code>{price_stats['coalesced']}</code>, запросов к API <code>{price_stats['upstream_calls']}</code>",
+        f"Подробности /chart: в кеше <code>{chart_stats['entries']}</code>, попаданий <code>{chart_stats['hits']}</code>, "
+        f"загрузок <code>{chart_stats['misses']}</code> (объединено <code>{chart_stats['coalesced']}</code>), "
+        f"ошибок <code>{chart_stats['errors']}</code>, таймаутов <code>{chart_stats['timeouts']}</code>",
+        f"Подробности /protocol: в кеше <code>{protocol_stats['entries']}</code>, попаданий <code>{protocol_stats['hits']}</code>, "
+        f"загрузок <code>{protocol_stats['misses']}</code>, ошибок <code>{protocol_stats['errors']}</code>",
+        f"Задержка event loop p50/p99/max: <code>{format_seconds(lag_stats['p50'])}</code>/"
+        f"<code>{format_seconds(lag_stats['p99'])}</code>/<code>{format_seconds(lag_stats['max'])}</code>",
+        format_decoder_stats(),
+        f"Воркер: <code>{html.escape(WORKER_ID)}</code> ({'лидер' if is_leader else 'получает снимки от лидера'})",
+        format_updated_at(pools_cache),
+    ]
+    await update.message.reply_text("\n".join(message_lines), parse_mode=ParseMode.HTML)
+
+async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показывает средние, минимум/максимум и изменения APY/TVL пула по локальной истории."""
+    name = " ".join(context.args)
+    if not name:
+        await update.message.reply_text("Использование: /history <пул>, например /history aave usdc")
+        return
+    pool_configs = pools_registry.find(name)
+    pools_snapshot = pools_cache.peek()
+    if not pool_configs:
+        await update.message.reply_text(f"Пул '{name}' не найден в конфигурации.")
+        return
+
+    now = int(time.time())
+    message_lines = []
+    for pool_config in pool_configs:
+        pool_id = resolve_pool_id(pool_config, pools_snapshot)
+        title = f"<b>{html.escape(pool_config.user_comment)} ({html.escape(pool_config.chain.capitalize())})</b>"
+        summary = await asyncio.to_thread(history_store.summary, pool_id, now) if pool_id else {}
+        if not summary:
+            message_lines.append(f"{title}\nИстория пока не накоплена.")
+            continue
+        message_lines.append(title)
+        for window in WINDOWS:
+            stats = summary.get(window)
+            if stats is None:
+                continue
+            apy_delta = stats['apy_delta']
+            tvl_delta = stats['tvl_delta_pct']
+            message_lines.append(
+                f"<code>{window:>3}</code>: APY ср. {format_number(stats['apy_avg'])}% "
+                f"(мин {format_number(stats['apy_min'])}%, макс {format_number(stats['apy_max'])}%, "
+                f"изм. {f'{apy_delta:+.2f}' if apy_delta is not None else 'N/A'} п.п.), "
+                f"TVL ср. ${format_number(stats['tvl_avg'])} "
+                f"(изм. {f'{tvl_delta:+.1f}%' if tvl_delta is not None else 'N/A'})"
+            )
+        message_lines.append("")
+    await update.message.reply_text("\n".join(message_lines).strip(), parse_mode=ParseMode.HTML)
+
+async def alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Создает подписку: /alert <пул> apy < 3, /alert <пул> tvl > 10M, /alert <пул> tvl drop 20%."""
+    try:
+        request = parse_alert(" ".join(context.args))
+    except AlertSyntaxError as e:
+        await update.message.reply_text(f"Ошибка: {e}.\nПример: /alert aave usdc apy < 3 или /alert aave usdc tvl drop 20%")
+        return
+    pool_configs = pools_registry.find(request.pool_name)
+    if not pool_configs:
+        await update.message.reply_text(f"Пул '{request.pool_name}' не найден в конфигурации.")
+        return
+
+    pools_snapshot = pools_cache.peek()
+    message_lines = []
+    for pool_config in pool_configs:
+        pool_name = f"{pool_config.user_comment} ({pool_config.chain.capitalize()})"
+        pool_id = resolve_pool_id(pool_config, pools_snapshot)
+        row = pools_snapshot.row_by_id.get(pool_id) if pools_snapshot is not None and pool_id else None
+        current = metric_value(pools_snapshot, row, request.metric) if row is not None else float("nan")
+        if pool_id is None or (request.drop_pct is not None and current != current):
+            message_lines.append(f"{html.escape(pool_name)}: нет данных DefiLlama, алерт не создан.")
+            continue
+
+        if request.drop_pct is not None:
+            # Падение на N% превращается в абсолютный порог от текущего значения
+            threshold = current * (1 - request.drop_pct / 100)
+            description = f"{request.metric.upper()} упал на {request.drop_pct:g}% (ниже {format_metric(request.metric, threshold)})"
         else:
-            # Отправляем первую часть через edit, остальные через send_message
-            first_part = message[:max_length]
-            # Обрезаем до последнего переноса строки
-            last_newline = first_part.rfind('\n')
-            if last_newline != -1:
-                first_part = first_part[:last_newline]
-            await query.edit_message_text(text=first_part, parse_mode=ParseMode.HTML)
-
-            remaining_message = message[len(first_part):].strip()
-            for i in range(0, len(remaining_message), max_length):
-                 part = remaining_message[i:i + max_length]
-                 await context.bot.send_message(chat_id=query.message.chat_id, text=part, parse_mode=ParseMode.HTML)
-                 await asyncio.sleep(0.5)
+            threshold = request.threshold
+            sign = ">" if request.direction == ABOVE else "<"
+            description = f"{request.metric.upper()} {sign} {format_metric(request.metric, threshold)}"
+        alert = await asyncio.to_thread(
+            alert_store.add, update.effective_chat.id, pool_id, pool_name, request.metric, request.direction, threshold, description
+        )
+        alert_index.add(alert)
+        await asyncio.to_thread(state_backend.bump_revision, "alerts")
+        message_lines.append(f"Алерт #{alert.id} создан: {html.escape(pool_name)} — {html.escape(description)}")
+        if current == current and ((current > threshold) if request.direction == ABOVE else (current < threshold)):
+            message_lines.append(f"Условие уже выполняется: сейчас <code>{format_metric(request.metric, current)}</code>.")
+    await update.message.reply_text("\n".join(message_lines), parse_mode=ParseMode.HTML)
+
+async def alerts_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показывает подписки текущего чата."""
+    chat_alerts = alert_index.for_chat(update.effective_chat.id)
+    if not chat_alerts:
+        await update.message.reply_text("Подписок нет. Создать: /alert <пул> apy < 3")
+        return
+    message_lines = ["<b>Ваши алерты:</b>"]
+    message_lines += [f"#{alert.id} {html.escape(alert.pool_name)}: {html.escape(alert.description)}" for alert in chat_alerts]
+    message_lines.append("\nУдалить: /unalert &lt;номер&gt;")
+    await update.message.reply_text("\n".join(message_lines), parse_mode=ParseMode.HTML)
+
+async def unalert_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Удаляет подписку текущего чата по номеру."""
+    try:
+        alert_id = int(context.args[0].lstrip("#"))
+    except (IndexError, ValueError):
+        await update.message.reply_text("Использование: /unalert <номер>")
+        return
+    alert = alert_index.alerts.get(alert_id)
+    if alert is None or alert.chat_id != update.effective_chat.id:
+        await update.message.reply_text(f"Алерт #{alert_id} не найден.")
+        return
+    alert_index.remove(alert_id)
+    await asyncio.to_thread(alert_store.remove, alert_id)
+    await asyncio.to_thread(state_backend.bump_revision, "alerts")
+    await update.message.reply_text(f"Алерт #{alert_id} удален.")
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Отправляет приветственное сообщение при команде /start."""
@@ -343,30 +1021,191 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         reply_markup=None,
     )
     await update.message.reply_text(
-        "Используйте команду /pools для выбора сети и группы тикеров.\n"
-        "Используйте команду /prices для получения курсов BTC, ETH, CRV с CoinGecko."
+        "Используйте команду /pools для выбора сети и группы тикеров; кнопка «Подробнее» под таблицей покажет историю APY и TVL протоколов.\n"
+        "Используйте команду /prices [тикеры] для курсов с DefiLlama (по умолчанию BTC, ETH, CRV) или @бот eth в любом чате.\n"
+        "Используйте команду /top ethereum stablecoin apy>5 tvl>10M sort=apy для поиска по всем пулам DefiLlama.\n"
+        "Используйте команду /history <пул> для истории APY/TVL за 7 и 30 дней.\n"
+        "Используйте команду /alert <пул> apy < 3 (или tvl drop 20%) для уведомлений, /alerts — список подписок.\n"
+        "Используйте команду /stats для просмотра статистики кеша данных."
     )
 
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Для администраторов: /profile [секунды] — сэмплирует стеки event loop и присылает горячие места."""
+    if update.effective_user is None or update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("Команда доступна только администраторам.")
+        return
+    try:
+        seconds = min(float(context.args[0]), PROFILE_MAX_SECONDS) if context.args else 10.0
+    except ValueError:
+        seconds = float("nan")
+    if not seconds > 0:  # заодно отсекает NaN
+        await update.message.reply_text("Использование: /profile [секунды], секунды — положительное число")
+        return
+    await update.message.reply_text(f"Профилирую {seconds:g} с...")
+    try:
+        stacks = await stack_sampler.profile(seconds)
+    except RuntimeError as e:
+        await update.message.reply_text(f"Ошибка: {e}.")
+        return
+    total = sum(stacks.values())
+    busy = busy_samples(stacks)
+    # Доли — от сэмплов, когда event loop был занят: простой в select/epoll в hot_frames не входит
+    message_lines = [f"<b>Горячие места за {seconds:g} с</b> ({busy} из {total} сэмплов event loop занят, доли без простоя):"]
+    message_lines += [f"<code>{count / busy:5.1%} {html.escape(frame)}</code>" for frame, count in hot_frames(stacks)] if busy else []
+    await update.message.reply_text("\n".join(message_lines), parse_mode=ParseMode.HTML)
+    if not total:
+        return
+    # Полные стеки — файлом в формате collapsed stacks (flamegraph.pl, speedscope)
+    await update.message.reply_document(io.BytesIO(collapsed(stacks).encode("utf-8")), filename=f"stacks-{int(time.time())}.txt")
+
+async def watch_pools_config(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Задача JobQueue: перечитывает конфиг при изменении файла и обновляет снимок под новые пулы."""
+    if pools_registry.reload_if_changed():
+        logger.info(f"Конфигурация {POOLS_CONFIG_PATH} перезагружена.")
+        if POOLS_TRACKED_ONLY and is_leader:
+            await pools_cache.refresh()
+
+async def backfill_history(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Задача JobQueue: один раз загружает историю /chart/{pool} для пулов, у которых ее еще нет."""
+    pools_snapshot = pools_cache.peek()
+    if pools_snapshot is None or not is_leader:
+        return
+    missing = await asyncio.to_thread(history_store.missing_backfill, tracked_pool_ids(pools_snapshot))
+    if not missing:
+        return
+    logger.info(f"Загрузка истории /chart для {len(missing)} пулов...")
+    # Параллельно (не больше DETAILS_CONCURRENCY запросов); графики заодно попадают в кеш подробностей
+    charts = await chart_fanout.get_many(missing)
+    for pool_id, points in charts.values.items():
+        await asyncio.to_thread(history_store.backfill, pool_id, points, int(time.time()))
+
+async def sync_shared_state(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Задача JobQueue: продлевает (или забирает) аренду лидера, подтягивает снимки лидера и изменения алертов."""
+    global is_leader, alerts_revision
+    leader = await asyncio.to_thread(state_backend.acquire_leadership, WORKER_ID, LEADER_LEASE)
+    if leader != is_leader:
+        logger.info(f"Воркер {WORKER_ID}: {'теперь лидер' if leader else 'больше не лидер'}.")
+        is_leader = leader
+    if not is_leader:
+        for name, cache, decode in (("pools", pools_cache, decode_pools_snapshot), ("prices", prices_cache, json.loads)):
+            shared = await asyncio.to_thread(load_shared_snapshot, name, decode)
+            if shared is not None:
+                cache.put(*shared)
+                if cache is prices_cache:
+                    price_service.load(shared[0])
+    revision = await asyncio.to_thread(state_backend.revision, "alerts")
+    if revision != alerts_revision:
+        alerts = await asyncio.to_thread(alert_store.load)
+        alert_index.replace(alerts)
+        alerts_revision = revision
+
+async def post_init(application: Application) -> None:
+    """Запускает очередь исходящих сообщений, замер задержки event loop и (в режиме polling,
+    если задан METRICS_PORT) сервер /metrics."""
+    send_scheduler.start(application.bot)
+    loop_monitor.start()
+    if METRICS_PORT and run_mode == "polling":
+        tornado.web.Application([("/metrics", MetricsHandler)]).listen(METRICS_PORT)
+        logger.info(f"/metrics доступен на порту {METRICS_PORT}")
+
+async def post_shutdown(application: Application) -> None:
+    """Останавливает очередь отправки и процессы разбора, закрывает HTTP клиент внешних API и базы SQLite."""
+    await send_scheduler.stop()
+    await loop_monitor.stop()
+    if pools_decoder is not None:
+        pools_decoder.shutdown()
+    await upstream.aclose()
+    history_store.close()
+    alert_store.close()
+    state_backend.release_leadership(WORKER_ID)
+    state_backend.close()
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Telegram бот DefiLlama")
+    parser.add_argument("--mode", choices=("polling", "webhook"), default=os.getenv("BOT_MODE", "polling"),
+                        help="получение обновлений: long polling или webhook (нужны WEBHOOK_URL и WEBHOOK_SECRET)")
+    return parser.parse_args()
+
+def is_ready() -> bool:
+    """Готовность для /readyz: есть снимок /pools (живой или восстановленный с диска)."""
+    return pools_cache.peek() is not None
+
 # Обновляем main для добавления CallbackQueryHandler
 def main() -> None:
     """Запускает бота."""
+    global is_leader, alerts_revision, run_mode
+    args = parse_args()
+    run_mode = args.mode
     token = os.getenv("TELEGRAM_BOT_TOKEN")
     if not token:
         logger.error("Токен TELEGRAM_BOT_TOKEN не найден в переменных окружения!")
         return
+    if args.mode == "webhook" and not (WEBHOOK_URL and WEBHOOK_SECRET):
+        logger.error("Для режима webhook нужны WEBHOOK_URL и WEBHOOK_SECRET!")
+        return
+
+    pools_registry.reload_if_changed()
+    # Сохраненный снимок отдается сразу, пока не завершится первое живое обновление
+    restored = snapshot_store.load()
+    if restored is not None:
+        pools_cache.restore(*restored)
+    watch_coins(found[1] for found in map(coin_index.resolve, PRICE_SYMBOLS) if found is not None)
+    alert_index.replace(alert_store.load())
+    logger.info(f"Загружено {len(alert_index)} алертов.")
+    alerts_revision = state_backend.revision("alerts")
+    is_leader = state_backend.acquire_leadership(WORKER_ID, LEADER_LEASE)
+    logger.info(f"Воркер {WORKER_ID}: {'лидер' if is_leader else 'получает снимки от лидера'}.")
 
     request = HTTPXRequest(connect_timeout=30.0, read_timeout=30.0, pool_timeout=30.0)
-    application = Application.builder().token(token).request(request).build()
+    application = (
+        Application.builder()
+        .token(token)
+        .request(request)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+
+    # Регистрируем обработчики команд (с замером времени для /metrics)
+    commands = {
+        "start": start_command,
+        "prices": prices_command,
+        "top": top_command,
+        "pools": pools_command,
+        "history": history_command,
+        "alert": alert_command,
+        "alerts": alerts_command,
+        "unalert": unalert_command,
+        "stats": stats_command,
+        "profile": profile_command,
+    }
+    for command, callback in commands.items():
+        application.add_handler(CommandHandler(command, timed_handler(callback, command)))
+    # Добавляем обработчик для кнопок (метка в метриках — действие из callback_data)
+    application.add_handler(CallbackQueryHandler(timed_handler(button_handler)))
+    # Inline запросы '@бот eth' (в BotFather должен быть включен inline режим)
+    application.add_handler(InlineQueryHandler(timed_handler(inline_query_handler, "inline")))
 
-    # Регистрируем обработчики команд
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("prices", prices_command))
-    application.add_handler(CommandHandler("pools", pools_command))
-    # Добавляем обработчик для кнопок
-    application.add_handler(CallbackQueryHandler(button_handler))
+    # Фоновое обновление данных, чтобы обработчики не ждали внешние API
+    if application.job_queue is not None:
+        BackgroundRefresher(pools_cache, POOLS_REFRESH_INTERVAL, enabled=lambda: is_leader).start(application.job_queue)
+        BackgroundRefresher(prices_cache, PRICES_REFRESH_INTERVAL, enabled=lambda: is_leader).start(application.job_queue, first=1.0)
+        if state_backend.shared:
+            application.job_queue.run_repeating(sync_shared_state, interval=SHARED_SYNC_INTERVAL, first=1.0, name="sync:shared_state")
+        application.job_queue.run_repeating(watch_pools_config, interval=POOLS_CONFIG_CHECK_INTERVAL, first=POOLS_CONFIG_CHECK_INTERVAL, name="watch:pools_config")
+        application.job_queue.run_repeating(backfill_history, interval=6 * 3600, first=60, name="backfill:history")
+    else:
+        logger.warning("JobQueue недоступна (нужен python-telegram-bot[job-queue]), данные будут загружаться по запросу.")
 
-    logger.info("Бот запускается...")
-    application.run_polling()
+    if args.mode == "webhook":
+        logger.info("Бот запускается в режиме webhook...")
+        asyncio.run(run_webhook(application, WEBHOOK_URL + WEBHOOK_PATH, WEBHOOK_PATH, WEBHOOK_SECRET,
+                                WEBHOOK_LISTEN, WEBHOOK_PORT, readiness=is_ready,
+                                extra_routes=[("/metrics", MetricsHandler)]))
+    else:
+        logger.info("Бот запускается...")
+        application.run_polling()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FanOutResult:
+    """Результат FanOut.get_many: что успело загрузиться к сроку, что нет."""
+
+    values: dict = field(default_factory=dict)  # ключ -> значение (свежее или, если загрузка не удалась, устаревшее)
+    stale: list = field(default_factory=list)  # ключи, для которых отдано устаревшее значение
+    failed: list = field(default_factory=list)  # ошибка загрузки и значения в кеше нет
+    pending: list = field(default_factory=list)  # не успели к сроку (загрузка продолжается в фоне)
+
+    @property
+    def complete(self) -> bool:
+        return not (self.stale or self.failed or self.pending)
+
+
+class FanOut:
+    """Параллельная загрузка по набору ключей (пул, протокол) с кешем на каждый ключ.
+
+    - Одновременно выполняется не больше concurrency загрузок.
+    - Каждая загрузка ограничена request_timeout секундами.
+    - get_many ждет не дольше deadline и возвращает то, что успело загрузиться;
+      остальные загрузки продолжаются в фоне и попадут в кеш к следующему запросу.
+    - Одинаковые ключи не загружаются повторно, пока идет загрузка: вызывающие ждут ту же задачу.
+    - Успешные значения кешируются на ttl секунд (не больше max_entries ключей, LRU).
+
+    fetch(key) возвращает значение или None при ошибке (может и выбросить исключение).
+    """
+
+    def __init__(self, fetch: Callable[[Hashable], Awaitable[Any]], ttl: float, concurrency: int = 8,
+                 request_timeout: float = 15.0, max_entries: int = 4096, name: str = "fanout"):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.request_timeout = request_timeout
+        self.max_entries = max_entries
+        self.name = name
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._cache: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()  # ключ -> (time.monotonic() загрузки, значение)
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        # Счетчики для /stats
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def cached(self, key: Hashable, max_age: float | None = None) -> Any:
+        """Значение из кеша без загрузки (None, если его нет или оно старше max_age)."""
+        entry = self._cache.get(key)
+        if entry is None or (max_age is not None and time.monotonic() - entry[0] >= max_age):
+            return None
+        return entry[1]
+
+    async def get_many(self, keys, deadline: float | None = None) -> FanOutResult:
+        """Значения по ключам: свежие из кеша, остальные параллельно, не дольше deadline секунд."""
+        keys = list(dict.fromkeys(keys))
+        result = FanOutResult()
+        tasks = {}
+        for key in keys:
+            value = self.cached(key, self.ttl)
+            if value is not None:
+                self.hits += 1
+                self._cache.move_to_end(key)
+                result.values[key] = value
+            else:
+                tasks[key] = self._start(key)
+        if tasks:
+            # asyncio.wait не отменяет задачи по таймауту: незавершенные догружаются в фоне
+            await asyncio.wait(set(tasks.values()), timeout=deadline)
+        for key, task in tasks.items():
+            value = task.result() if task.done() else None
+            if value is not None:
+                result.values[key] = value
+                continue
+            stale = self.cached(key)
+            if stale is not None:
+                result.values[key] = stale
+                result.stale.append(key)
+            elif task.done():
+                result.failed.append(key)
+            else:
+                result.pending.append(key)
+        return result
+
+    async def get(self, key: Hashable, deadline: float | None = None) -> Any:
+        """Одно значение (или None, если не загрузилось к сроку)."""
+        return (await self.get_many([key], deadline)).values.get(key)
+
+    def _start(self, key: Hashable) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return task
+        self.misses += 1
+        task = self._inflight[key] = asyncio.get_running_loop().create_task(self._load(key))
+        return task
+
+    async def _load(self, key: Hashable) -> Any:
+        try:
+            async with self._semaphore:
+                value = await asyncio.wait_for(self._fetch(key), self.request_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"{self.name}: загрузка {key} не уложилась в {self.request_timeout:.0f} с")
+            return None
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"{self.name}: ошибка загрузки {key}: {e}")
+            return None
+        finally:
+            self._inflight.pop(key, None)
+        if value is None:
+            self.errors += 1
+            return None
+        self._cache[key] = (time.monotonic(), value)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return value
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._cache),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+        }
@@ -0,0 +1,123 @@
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pool_history (
+    pool TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    apy REAL,
+    tvl REAL,
+    PRIMARY KEY (pool, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS pool_backfill (
+    pool TEXT PRIMARY KEY,
+    ts INTEGER NOT NULL
+);
+"""
+
+# Окна для /history: название -> длительность в секундах
+WINDOWS = {"7д": 7 * 86400, "30д": 30 * 86400}
+
+
+def parse_chart_points(data) -> list[tuple[int, float | None, float | None]]:
+    """Превращает ответ /chart/{pool} в список (ts, apy, tvl)."""
+    points = []
+    for point in data.get("data") or []:
+        try:
+            ts = int(datetime.fromisoformat(point["timestamp"].replace("Z", "+00:00")).timestamp())
+        except (KeyError, TypeError, ValueError):
+            continue
+        apy = point.get("apy")
+        if apy is None:
+            apy = point.get("apyBase")
+        points.append((ts, apy, point.get("tvlUsd")))
+    return points
+
+
+def summarize_chart_points(points: list[tuple[int, float | None, float | None]], now: int) -> dict:
+    """Средний APY и изменение TVL (%) по окнам WINDOWS для точек /chart/{pool} (по возрастанию времени)."""
+    result = {}
+    for name, seconds in WINDOWS.items():
+        window = [point for point in points if point[0] >= now - seconds]
+        apys = [apy for _, apy, _ in window if apy is not None]
+        tvls = [tvl for _, _, tvl in window if tvl is not None]
+        result[name] = {
+            "apy_avg": sum(apys) / len(apys) if apys else None,
+            "tvl_change": (tvls[-1] / tvls[0] - 1) * 100 if len(tvls) > 1 and tvls[0] else None,
+        }
+    return result
+
+
+class HistoryStore:
+    """Локальный временной ряд APY/TVL по пулам в SQLite (WAL).
+
+    Все методы синхронные и рассчитаны на вызов через asyncio.to_thread; одно
+    соединение защищено блокировкой. Первичный ключ (pool, ts) служит индексом
+    для выборок по окну времени.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def append(self, rows: list[tuple[str, int, float | None, float | None]]) -> None:
+        """Добавляет точки (pool, ts, apy, tvl) одной транзакцией."""
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO pool_history (pool, ts, apy, tvl) VALUES (?, ?, ?, ?)", rows)
+
+    def backfill(self, pool: str, points: list[tuple[int, float | None, float | None]], now: int) -> None:
+        """Записывает историю пула из /chart/{pool} и отмечает, что загрузка уже была."""
+        with self._lock, self._conn:
+            # Уже записанные точки не перезаписываем
+            self._conn.executemany("INSERT OR IGNORE INTO pool_history (pool, ts, apy, tvl) VALUES (?, ?, ?, ?)",
+                                   [(pool, ts, apy, tvl) for ts, apy, tvl in points])
+            self._conn.execute("INSERT OR REPLACE INTO pool_backfill (pool, ts) VALUES (?, ?)", (pool, now))
+
+    def missing_backfill(self, pools: list[str]) -> list[str]:
+        """Пулы, для которых история из /chart еще не загружалась."""
+        with self._lock:
+            done = {row[0] for row in self._conn.execute("SELECT pool FROM pool_backfill")}
+        return [pool for pool in pools if pool not in done]
+
+    def summary(self, pool: str, now: int) -> dict[str, dict]:
+        """Среднее/мин/макс и изменение APY и TVL по окнам WINDOWS."""
+        result = {}
+        with self._lock:
+            for name, seconds in WINDOWS.items():
+                since = now - seconds
+                row = self._conn.execute(
+                    "SELECT COUNT(*), AVG(apy), MIN(apy), MAX(apy), AVG(tvl) FROM pool_history WHERE pool = ? AND ts >= ?",
+                    (pool, since),
+                ).fetchone()
+                if not row[0]:
+                    continue
+                first = self._conn.execute(
+                    "SELECT apy, tvl FROM pool_history WHERE pool = ? AND ts >= ? ORDER BY ts LIMIT 1", (pool, since)
+                ).fetchone()
+                last = self._conn.execute(
+                    "SELECT apy, tvl FROM pool_history WHERE pool = ? AND ts >= ? ORDER BY ts DESC LIMIT 1", (pool, since)
+                ).fetchone()
+                result[name] = {
+                    "points": row[0],
+                    "apy_avg": row[1],
+                    "apy_min": row[2],
+                    "apy_max": row[3],
+                    "tvl_avg": row[4],
+                    "apy_delta": last[0] - first[0] if last[0] is not None and first[0] is not None else None,
+                    "tvl_delta_pct": (last[1] / first[1] - 1) * 100 if last[1] is not None and first[1] else None,
+                }
+        return result
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from metrics import LOOP_LAG_SECONDS, Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """Замер задержки event loop: таймер каждые interval секунд и насколько позже срока он сработал.
+
+    Пока loop занят синхронной работой (разбор JSON, сборка индексов, ...), таймер
+    ждет вместе со всеми обработчиками, поэтому задержка таймера — это и задержка
+    ответа на любое обновление Telegram в этот момент. Каждый замер идет в гистограмму
+    bot_event_loop_lag_seconds, последние window замеров хранятся для /stats.
+    """
+
+    def __init__(self, interval: float = 0.1, window: int = 600, warn_threshold: float = 0.5,
+                 histogram: Histogram = LOOP_LAG_SECONDS):
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.histogram = histogram
+        self._samples: deque[float] = deque(maxlen=window)
+        self._task: asyncio.Task | None = None
+        self.last: float | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="loop-lag-monitor")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.last = lag
+            self._samples.append(lag)
+            self.histogram.observe(lag)
+            if lag >= self.warn_threshold:
+                logger.warning(f"Event loop был занят {lag * 1000:.0f} мс сверх интервала таймера")
+
+    @property
+    def max_recent(self) -> float | None:
+        """Наибольшая задержка среди последних замеров."""
+        return max(self._samples) if self._samples else None
+
+    def stats(self) -> dict:
+        samples = sorted(self._samples)
+        return {
+            "samples": len(samples),
+            "last": self.last,
+            "p50": samples[len(samples) // 2] if samples else None,
+            "p99": samples[min(int(len(samples) * 0.99), len(samples) - 1)] if samples else None,
+            "max": samples[-1] if samples else None,
+        }
@@ -0,0 +1,207 @@
+import contextvars
+import functools
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable
+
+import tornado.web
+
+# Границы корзин гистограмм по умолчанию (секунды), как у prometheus_client
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+# Обработчик, внутри которого выполняется текущий код (для меток span)
+current_handler: contextvars.ContextVar[str] = contextvars.ContextVar("current_handler", default="background")
+
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Registry:
+    """Набор метрик процесса, отдаваемый в текстовом формате Prometheus."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines += metric.samples()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels[name] for name in self.labelnames), 0.0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge:
+    """Значение, которое читается функцией в момент запроса /metrics."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], float | None], registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help
+        self.read = read
+        registry.register(self)
+
+    def samples(self) -> list[str]:
+        value = self.read()
+        return [] if value is None else [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+                 registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets) + (math.inf,)
+        # метки -> [счетчики по корзинам (не накопительные), сумма, количество]
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> list[str]:
+        lines = []
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+# --- Метрики бота ---
+
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Время обработки обновления по команде или действию кнопки", ("handler",))
+STAGE_SECONDS = Histogram("bot_stage_seconds", "Время этапов обработки (fetch, decode, match, render, telegram, ...)", ("handler", "stage"))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Необработанные исключения в обработчиках", ("handler", "exception"))
+UPSTREAM_SECONDS = Histogram("bot_upstream_request_seconds", "Время запросов к внешним API (с повторами)", ("host",))
+UPSTREAM_ERRORS = Counter("bot_upstream_errors_total", "Ошибки запросов к внешним API по классу исключения", ("host", "exception"))
+TELEGRAM_SECONDS = Histogram("bot_telegram_api_seconds", "Время вызовов Bot API из очереди отправки", ("method",))
+TELEGRAM_ERRORS = Counter("bot_telegram_errors_total", "Ошибки вызовов Bot API по классу исключения", ("method", "exception"))
+LOOP_LAG_SECONDS = Histogram("bot_event_loop_lag_seconds", "Задержка планирования event loop (насколько позже срока просыпается таймер)",
+                             buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+
+
+@contextmanager
+def span(stage: str):
+    """Замер этапа внутри текущего обработчика: bot_stage_seconds{handler, stage}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, handler=current_handler.get(), stage=stage)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """То же, что span, для уже измеренного времени."""
+    STAGE_SECONDS.observe(seconds, handler=current_handler.get(), stage=stage)
+
+
+def timed_handler(callback, name: str | None = None):
+    """Оборачивает обработчик PTB: общее время в bot_handler_seconds и метка handler для span.
+
+    Без name метка берется из callback_data кнопки: callback:<действие>.
+    """
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        label = name
+        if label is None:
+            query = getattr(update, "callback_query", None)
+            label = f"callback:{query.data.split(':', 1)[0]}" if query is not None and query.data else "callback"
+        token = current_handler.set(label)
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception as e:
+            HANDLER_ERRORS.inc(handler=label, exception=type(e).__name__)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, handler=label)
+            current_handler.reset(token)
+    return wrapper
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """GET /metrics в текстовом формате Prometheus."""
+
+    def initialize(self, registry: Registry = REGISTRY) -> None:
+        self.registry = registry
+
+    def get(self) -> None:
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.finish(self.registry.render())
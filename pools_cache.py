@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class Timestamped(NamedTuple):
+    """Результат fetch со своим временем снимка (например, снимок, опубликованный другим воркером)."""
+    value: Any
+    updated_at: float
+
+
+class SnapshotCache:
+    """Общий для процесса кеш снимка данных с TTL, stale-while-revalidate и single-flight обновлением.
+
+    - Пока возраст снимка меньше ttl, он отдается из памяти без запросов.
+    - Пока возраст меньше ttl + stale_ttl, отдается устаревший снимок, а обновление
+      запускается в фоне.
+    - Если снимка нет или он слишком старый, вызывающий ждет обновления.
+    В любой момент выполняется не больше одного обновления: все конкурентные
+    вызовы ждут одну и ту же задачу.
+    """
+
+    def __init__(self, fetch: Callable[[], Awaitable[Any]], ttl: float = 300.0, stale_ttl: float = 600.0, name: str = "snapshot"):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.name = name
+        self._value = None
+        self._fetched_at: float | None = None  # time.monotonic() последнего успешного обновления
+        self.updated_at: float | None = None  # time.time() последнего успешного обновления (для показа пользователю)
+        self._inflight: asyncio.Task | None = None
+        self.version = 0  # увеличивается при каждой замене снимка (для кешей, зависящих от данных)
+        self.restored = False  # снимок восстановлен с диска и еще не обновлялся из источника
+        # Счетчики для /stats
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    @property
+    def age(self) -> float | None:
+        """Возраст текущего снимка в секундах (None, если снимка нет)."""
+        if self._fetched_at is None:
+            return None
+        return time.monotonic() - self._fetched_at
+
+    def peek(self):
+        """Возвращает текущий снимок без обращения к источнику (может быть None)."""
+        return self._value
+
+    def put(self, value, updated_at: float | None = None) -> None:
+        """Кладет готовый снимок в кеш (например, полученный фоновым обновлением).
+
+        updated_at — время снимка, если он получен не только что (например, от другого воркера).
+        """
+        now = time.time()
+        self._value = value
+        self._fetched_at = time.monotonic() - (max(now - updated_at, 0.0) if updated_at is not None else 0.0)
+        self.updated_at = updated_at if updated_at is not None else now
+        self.version += 1
+        self.restored = False
+
+    def restore(self, value, updated_at: float) -> None:
+        """Кладет снимок, сохраненный ранее (например, на диске), с его исходным временем.
+
+        Такой снимок отдается как устаревший, независимо от возраста, пока не
+        завершится первое успешное обновление из источника.
+        """
+        self._value = value
+        self._fetched_at = time.monotonic() - max(time.time() - updated_at, 0.0)
+        self.updated_at = updated_at
+        self.version += 1
+        self.restored = True
+
+    async def get(self):
+        """Возвращает снимок, при необходимости дожидаясь или запуская обновление."""
+        age = self.age
+        if self._value is not None and age is not None:
+            if age < self.ttl:
+                self.hits += 1
+                return self._value
+            if age < self.ttl + self.stale_ttl or self.restored:
+                self.stale_hits += 1
+                self._start_refresh()
+                return self._value
+
+        self.misses += 1
+        if self._inflight is not None and not self._inflight.done():
+            self.coalesced += 1
+        await asyncio.shield(self._start_refresh())
+        # Если обновление не удалось, отдаем то, что есть (возможно, очень старый снимок или None)
+        return self._value
+
+    async def refresh(self) -> bool:
+        """Принудительно обновляет снимок (с объединением с уже идущим обновлением).
+
+        Возвращает True, если обновление прошло успешно.
+        """
+        return await asyncio.shield(self._start_refresh())
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.create_task(self._do_refresh())
+        return self._inflight
+
+    async def _do_refresh(self) -> bool:
+        self.refreshes += 1
+        try:
+            value = await self._fetch()
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Ошибка обновления кеша {self.name}: {e}", exc_info=True)
+            return False
+        if value is None:
+            self.errors += 1
+            logger.warning(f"Обновление кеша {self.name} не вернуло данных, оставляем прежний снимок.")
+            return False
+        if isinstance(value, Timestamped):
+            # Снимок не свежий: возраст и "Обновлено" считаются от его собственного времени
+            self.put(value.value, value.updated_at)
+        else:
+            self.put(value)
+        return True
+
+    def stats(self) -> dict:
+        """Возвращает счетчики кеша."""
+        requests_total = self.hits + self.stale_hits + self.misses
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+            "hit_ratio": (self.hits + self.stale_hits) / requests_total if requests_total else 0.0,
+            "age": self.age,
+            "updated_at": self.updated_at,
+        }
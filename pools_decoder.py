@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import time
+from array import array
+
+from pools_snapshot import PoolsSnapshot, normalize_key
+from pools_stream import PoolsStreamParser
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# Строковые колонки снимка передаются из процесса разбора одним блоком UTF-8 каждая, значения через NUL:
+# str.split на стороне бота в разы быстрее json.loads и не держит GIL десятки миллисекунд
+_STRING_COLUMNS = ("pool_ids", "chain", "project", "symbol", "exposure")
+_FLOAT_COLUMNS = ("apy", "apy_base", "apy_reward", "tvl")
+_SEPARATOR = "\0"
+
+
+class FileSink:
+    """Приемник для upstream.get_stream: пишет тело ответа в файл как есть, без разбора.
+
+    Файл нужно закрыть (close() или with) до того, как его прочитает процесс разбора;
+    get_stream сам закрывает sink оборванной попытки через discard().
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = 0
+        self._file = open(path, 'wb')  # каждая попытка загрузки начинает файл заново
+
+    def feed(self, chunk: bytes) -> None:
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def discard(self) -> None:
+        """Попытка загрузки не удалась: файл закрывается, следующая попытка перезапишет его."""
+        self.close()
+
+    def __enter__(self) -> "FileSink":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def decode_pools_file(path: str, tracked_ids: frozenset[str] | None = None,
+                      tracked_keys: frozenset[tuple[str, str, str]] | None = None) -> tuple[tuple, int]:
+    """Разбирает сохраненный ответ /pools и возвращает (упакованные колонки снимка, пулов в ответе).
+
+    Выполняется в процессе разбора: разбор JSON и сборка колонок не держат GIL бота,
+    а обратно через pipe идут только нужные боту колонки (pack_columns), а не весь документ.
+    tracked_ids/tracked_keys — фильтр пулов конфига (None — оставить все пулы).
+    """
+    keep = None
+    if tracked_ids is not None:
+        keep = lambda pool: (pool.get("pool") in tracked_ids
+                             or normalize_key(pool.get("chain"), pool.get("project"), pool.get("symbol")) in tracked_keys)
+    parser = PoolsStreamParser(keep=keep)
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            parser.feed(chunk)
+    pools = parser.close()
+    return pack_columns(PoolsSnapshot(pools)), parser.total
+
+
+def pack_columns(snapshot: PoolsSnapshot) -> tuple:
+    """Колонки снимка для передачи между процессами: (число пулов, строковые блоки, float64 колонки, stablecoin)."""
+    strings = []
+    for name in _STRING_COLUMNS:
+        values = getattr(snapshot, name)
+        if any(_SEPARATOR in value for value in values):
+            raise ValueError(f"NUL в значении колонки {name}")
+        strings.append(_SEPARATOR.join(values).encode("utf-8"))
+    floats = tuple(getattr(snapshot, name).tobytes() for name in _FLOAT_COLUMNS)
+    return len(snapshot), tuple(strings), floats, bytes(snapshot.stablecoin)
+
+
+def unpack_columns(packed: tuple) -> PoolsSnapshot:
+    """Собирает снимок из результата pack_columns (в том же процессе или в соседнем на той же машине)."""
+    count, strings, floats, stablecoin = packed
+    columns = {}
+    for name, block in zip(_STRING_COLUMNS, strings):
+        columns[name] = block.decode("utf-8").split(_SEPARATOR) if count else []
+    for name, block in zip(_FLOAT_COLUMNS, floats):
+        columns[name] = array('d')
+        columns[name].frombytes(block)
+    return PoolsSnapshot.from_columns(**columns, stablecoin=bytearray(stablecoin))
+
+
+class DecoderError(RuntimeError):
+    """Процесс разбора завершился с ошибкой или был убит."""
+
+
+class PoolsDecoder:
+    """Разбор ответа /pools в отдельных процессах.
+
+    Потоковый разбор 100k пулов — это секунды чистого Python: в event loop он
+    останавливает все обработчики, а в потоке (asyncio.to_thread) все равно
+    конкурирует с ними за GIL. Здесь тело ответа сначала пишется во временный файл,
+    разбирает его отдельный процесс, а в бота возвращаются только колонки снимка
+    (pack_columns), из которых снимок собирается в потоке.
+
+    На каждый разбор запускается новый интерпретатор с этим файлом как главным
+    модулем (python pools_decoder.py): он не импортирует bot и не выполняет его
+    модульный код (базы SQLite, state backend, telegram/tornado), не наследует потоки
+    бота, а память разбора освобождается вместе с процессом. Старт интерпретатора —
+    десятки миллисекунд против секунд разбора. processes — сколько разборов может
+    идти одновременно.
+    """
+
+    def __init__(self, processes: int = 1, tmp_dir: str | None = None):
+        self.processes = processes
+        self.tmp_dir = tmp_dir
+        self._slots = asyncio.Semaphore(processes)
+        self._running: set[asyncio.subprocess.Process] = set()
+        self.decodes = 0
+        self.errors = 0
+        self.crashes = 0
+        self.last_seconds: float | None = None
+        self.last_bytes = 0
+
+    def temp_path(self) -> str:
+        """Путь для временного файла с телом ответа; удалять его — забота вызывающего (discard)."""
+        fd, path = tempfile.mkstemp(prefix="pools_", suffix=".json", dir=self.tmp_dir)
+        os.close(fd)
+        return path
+
+    @staticmethod
+    def discard(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    async def _run_worker(self, job: bytes) -> bytes:
+        """Запускает процесс разбора, передает ему задание и возвращает его stdout."""
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__),
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        )
+        self._running.add(process)
+        try:
+            stdout, stderr = await process.communicate(job)
+        except asyncio.CancelledError:
+            process.kill()
+            raise
+        finally:
+            self._running.discard(process)
+        if process.returncode < 0:
+            # Убит сигналом (например, OOM killer): следующий разбор запустит новый процесс
+            self.crashes += 1
+            logger.error(f"Процесс разбора /pools убит сигналом {-process.returncode}.")
+            raise DecoderError(f"процесс разбора убит сигналом {-process.returncode}")
+        if process.returncode != 0:
+            lines = stderr.decode("utf-8", "replace").strip().splitlines()
+            raise DecoderError(f"процесс разбора завершился с кодом {process.returncode}: {lines[-1] if lines else 'без вывода'}")
+        return stdout
+
+    async def decode(self, path: str, tracked_ids: frozenset[str] | None = None,
+                     tracked_keys: frozenset[tuple[str, str, str]] | None = None) -> tuple[PoolsSnapshot, int]:
+        """Разбирает файл с ответом /pools в отдельном процессе. Возвращает (снимок, пулов в ответе)."""
+        job = pickle.dumps((path, tracked_ids, tracked_keys), protocol=pickle.HIGHEST_PROTOCOL)
+        start = time.perf_counter()
+        async with self._slots:
+            try:
+                packed, total = pickle.loads(await self._run_worker(job))
+            except Exception:
+                self.errors += 1
+                raise
+        snapshot = await asyncio.to_thread(unpack_columns, packed)
+        self.decodes += 1
+        self.last_seconds = time.perf_counter() - start
+        self.last_bytes = sum(map(len, packed[1])) + sum(map(len, packed[2])) + len(packed[3])
+        return snapshot, total
+
+    def shutdown(self) -> None:
+        """Останавливает незавершенные разборы (при остановке бота)."""
+        for process in list(self._running):
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "processes": self.processes,
+            "decodes": self.decodes,
+            "errors": self.errors,
+            "crashes": self.crashes,
+            "last_seconds": self.last_seconds,
+            "last_bytes": self.last_bytes,
+        }
+
+
+def _worker_main() -> None:
+    """Процесс разбора: задание (путь и фильтр) в stdin, результат decode_pools_file в stdout, оба в pickle."""
+    path, tracked_ids, tracked_keys = pickle.load(sys.stdin.buffer)
+    result = decode_pools_file(path, tracked_ids, tracked_keys)
+    sys.stdout.buffer.write(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+if __name__ == "__main__":
+    _worker_main()
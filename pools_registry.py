@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+from dataclasses import dataclass
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from pools_snapshot import normalize_key
+
+logger = logging.getLogger(__name__)
+
+ALL_GROUPS = "all_groups"
+# Ограничение Telegram на длину callback_data
+CALLBACK_DATA_LIMIT = 64
+
+
+class ConfigError(ValueError):
+    """Ошибка в содержимом pools_config.json."""
+
+
+@dataclass(frozen=True, slots=True)
+class PoolConfig:
+    """Запись конфигурации отслеживаемого пула."""
+    defilama_id: str | None
+    chain: str
+    project: str
+    symbol: str
+    ticker_group: str
+    user_comment: str
+
+    @property
+    def key(self) -> tuple[str, str, str]:
+        return normalize_key(self.chain, self.project, self.symbol)
+
+
+def _required_str(entry: dict, field: str, index: int) -> str:
+    value = entry.get(field)
+    if not isinstance(value, str) or not value.strip():
+        raise ConfigError(f"запись #{index}: поле '{field}' должно быть непустой строкой")
+    return value.strip()
+
+
+def parse_pools_config(raw) -> list[PoolConfig]:
+    """Проверяет разобранный JSON конфига и превращает его в список PoolConfig."""
+    if not isinstance(raw, list):
+        raise ConfigError("файл должен содержать список JSON объектов")
+    pools = []
+    for index, entry in enumerate(raw):
+        if not isinstance(entry, dict):
+            raise ConfigError(f"запись #{index}: ожидается JSON объект")
+        defilama_id = entry.get("defilama_id")
+        if defilama_id is not None and (not isinstance(defilama_id, str) or not defilama_id.strip()):
+            raise ConfigError(f"запись #{index}: 'defilama_id' должен быть строкой или null")
+        user_comment = entry.get("user_comment")
+        if user_comment is not None and (not isinstance(user_comment, str) or not user_comment.strip()):
+            raise ConfigError(f"запись #{index}: 'user_comment' должен быть непустой строкой или null")
+        chain = _required_str(entry, "chain", index).lower()
+        ticker_group = _required_str(entry, "ticker_group", index).lower()
+        if len(f"select_group:{chain}:{ticker_group}".encode()) > CALLBACK_DATA_LIMIT:
+            raise ConfigError(f"запись #{index}: слишком длинные chain/ticker_group для callback_data")
+        pools.append(PoolConfig(
+            defilama_id=defilama_id.strip() if defilama_id else None,
+            chain=chain,
+            project=_required_str(entry, "project", index),
+            symbol=_required_str(entry, "symbol", index),
+            ticker_group=ticker_group,
+            user_comment=user_comment.strip() if user_comment else f"{entry['project'].strip()} {entry['symbol'].strip()}",
+        ))
+    return pools
+
+
+def _rows(buttons: list[InlineKeyboardButton], per_row: int = 2) -> list[list[InlineKeyboardButton]]:
+    return [buttons[i:i + per_row] for i in range(0, len(buttons), per_row)]
+
+
+class PoolsRegistry:
+    """Загруженная один раз конфигурация пулов с готовыми индексами и клавиатурами.
+
+    Файл перечитывается только при изменении mtime/размера (см. reload_if_changed).
+    Если новая версия файла некорректна, ошибка пишется в лог и остается последняя
+    рабочая конфигурация.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pools: tuple[PoolConfig, ...] = ()
+        self.chains: list[str] = []
+        self.groups_by_chain: dict[str, list[str]] = {}
+        self.chains_keyboard = InlineKeyboardMarkup([])
+        self._pools_by_chain: dict[str, list[PoolConfig]] = {}
+        self._pools_by_group: dict[tuple[str, str], list[PoolConfig]] = {}
+        self._groups_keyboards: dict[str, InlineKeyboardMarkup] = {}
+        self.tracked_ids: frozenset[str] = frozenset()
+        self.tracked_keys: frozenset[tuple[str, str, str]] = frozenset()
+        self._pools_by_name: dict[str, list[PoolConfig]] = {}
+        self.version = 0  # увеличивается при каждой успешной загрузке
+        self._signature: tuple[int, int] | None = (0, -1)  # (mtime_ns, size) последней прочитанной версии файла; None — файла нет
+
+    def _file_signature(self) -> tuple[int, int] | None:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def reload_if_changed(self) -> bool:
+        """Перечитывает файл, если он изменился. Возвращает True, если конфигурация обновилась."""
+        signature = self._file_signature()
+        if signature == self._signature:
+            return False
+        if signature is None:
+            # Пишем в лог один раз на пропажу файла, конфигурация остается прежней
+            logger.error(f"Ошибка: Файл конфигурации {self.path} не найден.")
+            self._signature = None
+            return False
+        self._signature = signature
+        return self.load()
+
+    def load(self) -> bool:
+        """Загружает и проверяет файл. При ошибке оставляет прежнюю конфигурацию."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                pools = parse_pools_config(json.load(f))
+        except json.JSONDecodeError as e:
+            logger.error(f"Ошибка декодирования JSON в файле {self.path}: {e}. Оставлена прежняя конфигурация.")
+            return False
+        except ConfigError as e:
+            logger.error(f"Ошибка конфигурации {self.path}: {e}. Оставлена прежняя конфигурация.")
+            return False
+        except OSError as e:
+            logger.error(f"Ошибка при чтении файла {self.path}: {e}")
+            return False
+        self._build(pools)
+        logger.info(f"Успешно загружено {len(pools)} пулов из {self.path}")
+        return True
+
+    def _build(self, pools: list[PoolConfig]) -> None:
+        pools_by_chain: dict[str, list[PoolConfig]] = {}
+        pools_by_group: dict[tuple[str, str], list[PoolConfig]] = {}
+        pools_by_name: dict[str, list[PoolConfig]] = {}
+        for pool in pools:
+            pools_by_chain.setdefault(pool.chain, []).append(pool)
+            pools_by_group.setdefault((pool.chain, pool.ticker_group), []).append(pool)
+            pools_by_name.setdefault(pool.user_comment.strip().lower(), []).append(pool)
+            if pool.defilama_id:
+                pools_by_name.setdefault(pool.defilama_id.lower(), []).append(pool)
+
+        chains = sorted(pools_by_chain)
+        groups_by_chain = {chain: sorted({pool.ticker_group for pool in chain_pools}) for chain, chain_pools in pools_by_chain.items()}
+        chains_keyboard = InlineKeyboardMarkup(_rows([
+            InlineKeyboardButton(chain.capitalize(), callback_data=f"select_chain:{chain}") for chain in chains
+        ]))
+        groups_keyboards = {
+            chain: InlineKeyboardMarkup(_rows(
+                [InlineKeyboardButton("Все группы", callback_data=f"select_group:{chain}:{ALL_GROUPS}")]
+                + [InlineKeyboardButton(group.capitalize(), callback_data=f"select_group:{chain}:{group}") for group in groups]
+            ))
+            for chain, groups in groups_by_chain.items()
+        }
+
+        # Подменяем все индексы разом, чтобы обработчики не увидели наполовину собранное состояние
+        self.pools = tuple(pools)
+        self.chains = chains
+        self.groups_by_chain = groups_by_chain
+        self.chains_keyboard = chains_keyboard
+        self._pools_by_chain = pools_by_chain
+        self._pools_by_group = pools_by_group
+        self._groups_keyboards = groups_keyboards
+        self._pools_by_name = pools_by_name
+        self.tracked_ids = frozenset(pool.defilama_id for pool in pools if pool.defilama_id)
+        self.tracked_keys = frozenset(pool.key for pool in pools)
+        self.version += 1
+
+    def groups_keyboard(self, chain: str) -> InlineKeyboardMarkup | None:
+        return self._groups_keyboards.get(chain.lower())
+
+    def pools_for(self, chain: str, group: str) -> list[PoolConfig]:
+        """Пулы конфига для сети и группы тикеров (ALL_GROUPS — все группы сети)."""
+        chain = chain.lower()
+        if group == ALL_GROUPS:
+            return self._pools_by_chain.get(chain, [])
+        return self._pools_by_group.get((chain, group.lower()), [])
+
+    def find(self, name: str) -> list[PoolConfig]:
+        """Пулы конфига по user_comment (без учета регистра) или по defilama_id."""
+        return self._pools_by_name.get(" ".join(name.split()).lower(), [])
+
+    def is_tracked(self, pool: dict) -> bool:
+        """Нужен ли пул DefiLlama хотя бы одной записи конфига (по UUID или по chain/project/symbol)."""
+        return pool.get("pool") in self.tracked_ids or normalize_key(pool.get("chain"), pool.get("project"), pool.get("symbol")) in self.tracked_keys
@@ -0,0 +1,223 @@
+import json
+import logging
+import os
+import sys
+import tempfile
+from array import array
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pools_registry import PoolConfig
+
+logger = logging.getLogger(__name__)
+
+NAN = float("nan")
+
+
+def normalize_key(chain: str | None, project: str | None, symbol: str | None) -> tuple[str, str, str]:
+    """Нормализованный ключ (chain, project, symbol) для сопоставления пулов без учета регистра."""
+    return ((chain or "").strip().lower(), (project or "").strip().lower(), (symbol or "").strip().lower())
+
+
+class PoolResolutions:
+    """Карта найденных по chain/project/symbol пулов: нормализованный ключ -> pool UUID DefiLlama.
+
+    Хранится в JSON файле, чтобы после первого удачного поиска следующие снимки
+    находили пул сразу по UUID, без запасного поиска.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._map: dict[tuple[str, str, str], str] = {}
+        self._dirty = False
+        self.load()
+
+    @staticmethod
+    def _encode(key: tuple[str, str, str]) -> str:
+        return "|".join(key)
+
+    def load(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Ошибка чтения карты пулов {self.path}: {e}")
+            return
+        if not isinstance(raw, dict):
+            logger.error(f"Ошибка: Файл {self.path} должен содержать JSON объект.")
+            return
+        self._map = {tuple(k.split("|", 2)): v for k, v in raw.items() if isinstance(v, str) and k.count("|") == 2}
+        logger.info(f"Загружено {len(self._map)} найденных ранее пулов из {self.path}")
+
+    def get(self, key: tuple[str, str, str]) -> str | None:
+        return self._map.get(key)
+
+    def pool_ids(self) -> set[str]:
+        return set(self._map.values())
+
+    def set(self, key: tuple[str, str, str], pool_id: str) -> None:
+        if self._map.get(key) != pool_id:
+            self._map[key] = pool_id
+            self._dirty = True
+
+    def save(self) -> None:
+        """Атомарно записывает карту на диск, если в ней есть изменения."""
+        if not self._dirty:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, delete=False, suffix=".tmp") as f:
+                json.dump({self._encode(k): v for k, v in sorted(self._map.items())}, f, ensure_ascii=False, indent=2)
+                tmp_path = f.name
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            logger.info(f"Карта найденных пулов сохранена в {self.path} ({len(self._map)} записей)")
+        except OSError as e:
+            logger.error(f"Ошибка записи карты пулов {self.path}: {e}")
+
+
+class PoolsSnapshot:
+    """Компактный колоночный снимок данных /pools.
+
+    Строки (chain/project/symbol) интернируются, числовые метрики лежат в колонках
+    array('d') (NaN вместо отсутствующего значения), доступ к пулу — по номеру строки.
+    Индексы по ключу 'pool', по (chain, project, symbol) и по сети строятся один раз
+    на снимок, поэтому поиск пулов конфига идет за O(1), а фильтрация и сортировка —
+    операциями над колонками, без словаря на каждый пул.
+    """
+
+    __slots__ = ("pool_ids", "chain", "project", "symbol", "apy", "apy_base", "apy_reward", "tvl", "stablecoin", "exposure",
+                 "row_by_id", "row_by_key", "rows_by_chain")
+
+    def __init__(self, pools: dict[str, dict] | None = None):
+        self.pool_ids: list[str] = []
+        self.chain: list[str] = []
+        self.project: list[str] = []
+        self.symbol: list[str] = []
+        self.apy = array('d')
+        self.apy_base = array('d')
+        self.apy_reward = array('d')
+        self.tvl = array('d')
+        self.stablecoin = bytearray()  # 1 — пул из стейблкоинов
+        self.exposure: list[str] = []  # single, multi или пустая строка
+        for pool_id, pool in (pools or {}).items():
+            self.pool_ids.append(pool_id)
+            self.chain.append(sys.intern(pool.get("chain") or ""))
+            self.project.append(sys.intern(pool.get("project") or ""))
+            self.symbol.append(sys.intern(pool.get("symbol") or ""))
+            self.apy.append(_as_float(pool.get("apy")))
+            self.apy_base.append(_as_float(pool.get("apyBase")))
+            self.apy_reward.append(_as_float(pool.get("apyReward")))
+            self.tvl.append(_as_float(pool.get("tvlUsd")))
+            self.stablecoin.append(1 if pool.get("stablecoin") else 0)
+            self.exposure.append(sys.intern(pool.get("exposure") or ""))
+        self._build_indexes()
+
+    @classmethod
+    def from_columns(cls, pool_ids: list[str], chain: list[str], project: list[str], symbol: list[str],
+                     apy: array, apy_base: array, apy_reward: array, tvl: array,
+                     stablecoin: bytearray, exposure: list[str]) -> "PoolsSnapshot":
+        """Собирает снимок из готовых колонок (например, прочитанных с диска)."""
+        lengths = {len(pool_ids), len(chain), len(project), len(symbol), len(apy), len(apy_base), len(apy_reward), len(tvl),
+                   len(stablecoin), len(exposure)}
+        if len(lengths) != 1:
+            raise ValueError("колонки снимка разной длины")
+        snapshot = cls.__new__(cls)
+        snapshot.pool_ids = pool_ids
+        snapshot.chain = [sys.intern(value) for value in chain]
+        snapshot.project = [sys.intern(value) for value in project]
+        snapshot.symbol = [sys.intern(value) for value in symbol]
+        snapshot.apy = apy
+        snapshot.apy_base = apy_base
+        snapshot.apy_reward = apy_reward
+        snapshot.tvl = tvl
+        snapshot.stablecoin = stablecoin
+        snapshot.exposure = [sys.intern(value) for value in exposure]
+        snapshot._build_indexes()
+        return snapshot
+
+    def _build_indexes(self) -> None:
+        self.row_by_id: dict[str, int] = {}
+        self.row_by_key: dict[tuple[str, str, str], int] = {}
+        self.rows_by_chain: dict[str, list[int]] = {}
+        for row, pool_id in enumerate(self.pool_ids):
+            self.row_by_id[pool_id] = row
+            key = normalize_key(self.chain[row], self.project[row], self.symbol[row])
+            # При совпадении ключей оставляем первый пул, как и прежний линейный поиск
+            self.row_by_key.setdefault(key, row)
+            self.rows_by_chain.setdefault(key[0], []).append(row)
+
+    def __len__(self) -> int:
+        return len(self.pool_ids)
+
+    def find_row(self, pool_config: "PoolConfig", resolutions: PoolResolutions | None = None) -> int | None:
+        """Находит строку пула для записи конфига: по defilama_id, по карте найденных пулов или по индексу."""
+        pool_id = pool_config.defilama_id
+        if pool_id and pool_id in self.row_by_id:
+            return self.row_by_id[pool_id]
+
+        key = pool_config.key
+        if not all(key):
+            return None
+        if resolutions is not None:
+            resolved_id = resolutions.get(key)
+            if resolved_id and resolved_id in self.row_by_id:
+                return self.row_by_id[resolved_id]
+
+        row = self.row_by_key.get(key)
+        if row is None:
+            return None
+        logger.info(f"Найден пул по совпадению chain/project/symbol: {pool_config.user_comment} -> {self.pool_ids[row]}")
+        if resolutions is not None:
+            resolutions.set(key, self.pool_ids[row])
+        return row
+
+    def rows_for(self, pool_configs, resolutions: PoolResolutions | None = None) -> list[int]:
+        """Строки найденных пулов для списка записей конфига (в порядке конфига, без ненайденных)."""
+        rows = (self.find_row(pool_config, resolutions) for pool_config in pool_configs)
+        return [row for row in rows if row is not None]
+
+    def display_apy(self, row: int) -> float | None:
+        """APY для вывода: apy, а если его нет — apyBase."""
+        value = self.apy[row]
+        if value != value:  # NaN
+            value = self.apy_base[row]
+        return None if value != value else value
+
+    def tvl_usd(self, row: int) -> float | None:
+        value = self.tvl[row]
+        return None if value != value else value
+
+    def sort_rows(self, rows: list[int], by: str = "apy", descending: bool = True) -> list[int]:
+        """Сортирует строки по колонке ('apy' или 'tvl'); пулы без значения идут в конце."""
+        column = self.apy if by == "apy" else self.tvl
+        sign = -1.0 if descending else 1.0
+        return sorted(rows, key=lambda row: (column[row] != column[row], sign * column[row] if column[row] == column[row] else 0.0))
+
+    def record(self, row: int) -> dict:
+        """Данные пула в виде словаря с полями DefiLlama (для совместимости и отладки)."""
+        return {
+            "pool": self.pool_ids[row],
+            "chain": self.chain[row],
+            "project": self.project[row],
+            "symbol": self.symbol[row],
+            "apy": _as_optional(self.apy[row]),
+            "apyBase": _as_optional(self.apy_base[row]),
+            "apyReward": _as_optional(self.apy_reward[row]),
+            "tvlUsd": _as_optional(self.tvl[row]),
+            "stablecoin": bool(self.stablecoin[row]),
+            "exposure": self.exposure[row] or None,
+        }
+
+
+def _as_float(value) -> float:
+    try:
+        return float(value) if value is not None else NAN
+    except (TypeError, ValueError):
+        return NAN
+
+
+def _as_optional(value: float) -> float | None:
+    return None if value != value else value
@@ -0,0 +1,81 @@
+import codecs
+import json
+import re
+from typing import Callable
+
+# Поля пула DefiLlama, которые нужны боту; остальные (predictions, underlyingTokens, ...) отбрасываются сразу
+POOL_FIELDS = ("pool", "chain", "project", "symbol", "apy", "apyBase", "apyReward", "tvlUsd", "stablecoin", "exposure")
+
+_DATA_START = re.compile(r'"data"\s*:\s*\[')
+_SKIP = " \t\r\n,"
+
+
+class PoolsStreamParser:
+    """Инкрементальный разбор ответа /pools вида {"status": ..., "data": [{...}, ...]}.
+
+    Тело ответа подается кусками через feed(); каждый пул декодируется по отдельности,
+    проходит фильтр keep и сразу урезается до POOL_FIELDS. Поэтому в памяти никогда
+    не лежит весь документ целиком — только буфер текущего куска и отобранные пулы.
+    """
+
+    def __init__(self, keep: Callable[[dict], bool] | None = None, fields: tuple[str, ...] = POOL_FIELDS):
+        self.keep = keep
+        self.fields = fields
+        self.pools: dict[str, dict] = {}
+        self.total = 0  # сколько пулов было в ответе всего
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._in_data = False
+        self._done = False
+
+    def feed(self, chunk: bytes) -> None:
+        if self._done:
+            return
+        self._buf += self._text.decode(chunk)
+        if not self._in_data:
+            match = _DATA_START.search(self._buf)
+            if match is None:
+                # Ключ "data" еще не пришел; оставляем хвост на случай, если он разрезан между кусками
+                self._buf = self._buf[-64:]
+                return
+            self._in_data = True
+            self._buf = self._buf[match.end():]
+        self._parse_items()
+
+    def _parse_items(self) -> None:
+        buf = self._buf
+        pos = 0
+        length = len(buf)
+        while True:
+            while pos < length and buf[pos] in _SKIP:
+                pos += 1
+            if pos >= length:
+                break
+            if buf[pos] == "]":
+                self._done = True
+                break
+            try:
+                item, end = self._decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # Объект пришел не полностью — ждем следующий кусок
+                break
+            pos = end
+            self._add(item)
+        self._buf = buf[pos:]
+
+    def _add(self, item) -> None:
+        self.total += 1
+        if not isinstance(item, dict):
+            return
+        pool_id = item.get("pool")
+        if not pool_id or (self.keep is not None and not self.keep(item)):
+            return
+        self.pools[pool_id] = {field: item.get(field) for field in self.fields}
+
+    def close(self) -> dict[str, dict]:
+        """Завершает разбор и возвращает отобранные пулы по ключу 'pool'."""
+        self._buf += self._text.decode(b"", final=True)
+        if not self._done:
+            raise ValueError("Неожиданный формат ответа от DefiLlama API: список 'data' не найден или оборван.")
+        return self.pools
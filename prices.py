@@ -0,0 +1,297 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+
+import httpx
+
+from upstream import UpstreamClient
+
+logger = logging.getLogger(__name__)
+
+COINS_BASE_URL = "https://coins.llama.fi"
+# Сколько монет запрашивать одним вызовом /prices/current (ограничение на длину URL)
+MAX_BATCH = 100
+# Окно поиска цены вокруг запрошенного времени в /batchHistorical (секунды)
+HISTORICAL_SEARCH_WIDTH = 600
+# Готовый ID монеты, который можно подставить в путь /prices/current/{coins}: без запятых, слешей и пробелов
+COIN_ID_RE = re.compile(r"^[\w-]+:[\w.-]+$")
+
+# Встроенный индекс: тикер -> ID монеты DefiLlama ({chain}:{address} или coingecko:{id})
+DEFAULT_COINS = {
+    "BTC": "coingecko:bitcoin",
+    "ETH": "coingecko:ethereum",
+    "CRV": "coingecko:curve-dao-token",
+    "USDC": "coingecko:usd-coin",
+    "USDT": "coingecko:tether",
+    "DAI": "coingecko:dai",
+    "USDE": "coingecko:ethena-usde",
+    "GHO": "coingecko:gho",
+    "CRVUSD": "coingecko:crvusd",
+    "WBTC": "coingecko:wrapped-bitcoin",
+    "CBBTC": "coingecko:coinbase-wrapped-btc",
+    "WETH": "coingecko:weth",
+    "STETH": "coingecko:staked-ether",
+    "WSTETH": "coingecko:wrapped-steth",
+    "SOL": "coingecko:solana",
+    "BNB": "coingecko:binancecoin",
+    "AVAX": "coingecko:avalanche-2",
+    "MATIC": "coingecko:matic-network",
+    "POL": "coingecko:polygon-ecosystem-token",
+    "ARB": "coingecko:arbitrum",
+    "OP": "coingecko:optimism",
+    "AAVE": "coingecko:aave",
+    "UNI": "coingecko:uniswap",
+    "LINK": "coingecko:chainlink",
+    "LDO": "coingecko:lido-dao",
+    "MKR": "coingecko:maker",
+    "COMP": "coingecko:compound-governance-token",
+    "PENDLE": "coingecko:pendle",
+    "ENA": "coingecko:ethena",
+    "CVX": "coingecko:convex-finance",
+}
+# Названия, по которым тоже ищут монеты
+DEFAULT_ALIASES = {
+    "BITCOIN": "BTC",
+    "ETHEREUM": "ETH",
+    "ETHER": "ETH",
+    "CURVE": "CRV",
+    "TETHER": "USDT",
+    "SOLANA": "SOL",
+}
+
+
+class CoinIndex:
+    """Локальный индекс тикер/название -> ID монеты DefiLlama с поиском по префиксу.
+
+    Строится один раз (встроенная таблица плюс необязательный JSON {тикер: ID});
+    поиск — бинарный по отсортированному списку ключей, без обращений к сети.
+    """
+
+    def __init__(self, coins: dict[str, str] | None = None, aliases: dict[str, str] | None = None):
+        coins = dict(DEFAULT_COINS if coins is None else coins)
+        aliases = DEFAULT_ALIASES if aliases is None else aliases
+        self._by_key: dict[str, tuple[str, str]] = {symbol.upper(): (symbol.upper(), coin) for symbol, coin in coins.items()}
+        for alias, symbol in aliases.items():
+            if symbol.upper() in self._by_key:
+                self._by_key.setdefault(alias.upper(), self._by_key[symbol.upper()])
+        self._keys = sorted(self._by_key)
+        self.symbol_by_coin = {coin: symbol for symbol, coin in self._by_key.values()}
+
+    @classmethod
+    def load(cls, path: str | None) -> "CoinIndex":
+        """Встроенный индекс, дополненный файлом path ({тикер: ID}), если он есть."""
+        coins = dict(DEFAULT_COINS)
+        if path:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    extra = json.load(f)
+                coins.update({str(symbol).upper(): str(coin) for symbol, coin in extra.items()})
+                logger.info(f"Индекс монет дополнен из {path}: {len(extra)} записей")
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, AttributeError) as e:
+                logger.error(f"Ошибка чтения индекса монет {path}: {e}")
+        return cls(coins)
+
+    def __len__(self) -> int:
+        return len(self.symbol_by_coin)
+
+    def resolve(self, text: str) -> tuple[str, str] | None:
+        """(тикер, ID монеты) по тикеру, названию или готовому ID вида chain:address.
+
+        ID не из индекса принимается, только если он похож на ID DefiLlama (COIN_ID_RE).
+        """
+        text = text.strip()
+        found = self._by_key.get(text.upper())
+        if found is not None:
+            return found
+        if COIN_ID_RE.match(text):
+            return self.symbol_by_coin.get(text, text.split(":", 1)[1][:10].upper()), text
+        return None
+
+    def search(self, prefix: str, limit: int = 10) -> list[tuple[str, str]]:
+        """Монеты, тикер или название которых начинается с prefix (точное совпадение первым)."""
+        prefix = prefix.strip().upper()
+        if not prefix:
+            return []
+        results = []
+        exact = self._by_key.get(prefix)
+        if exact is not None:
+            results.append(exact)
+        for key in self._keys[bisect_left(self._keys, prefix):]:
+            if not key.startswith(prefix) or len(results) >= limit:
+                break
+            if self._by_key[key] not in results:
+                results.append(self._by_key[key])
+        return results
+
+
+@dataclass(frozen=True, slots=True)
+class PriceQuote:
+    coin: str
+    symbol: str
+    price: float
+    timestamp: float  # время цены по данным DefiLlama
+    confidence: float | None
+    fetched: float  # time.time() загрузки
+
+
+class PriceService:
+    """Цены монет из DefiLlama coins API с кешем на каждую монету.
+
+    - Запрошенные монеты без свежей цены собираются в как можно меньше вызовов
+      /prices/current/{coins} (по MAX_BATCH монет).
+    - Монеты, которые уже загружаются, не запрашиваются повторно: вызывающие ждут
+      ту же загрузку.
+    - При ошибке остается прежняя (устаревшая) цена.
+    - Исторические цены (/batchHistorical) кешируются по (монета, время) в LRU.
+    """
+
+    def __init__(self, client: UpstreamClient, ttl: float = 60.0, base_url: str = COINS_BASE_URL, history_cache_size: int = 4096):
+        self.client = client
+        self.ttl = ttl
+        self.base_url = base_url
+        self._quotes: dict[str, PriceQuote] = {}
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._history: OrderedDict[tuple[str, int], float | None] = OrderedDict()
+        self.history_cache_size = history_cache_size
+        self.watched: set[str] = set()  # монеты для фонового обновления
+        # Счетчики для /stats
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+
+    def cached(self, coins, max_age: float | None = None) -> dict[str, PriceQuote]:
+        """Цены из кеша без обращения к сети (max_age=None — любой давности)."""
+        now = time.time()
+        result = {}
+        for coin in coins:
+            quote = self._quotes.get(coin)
+            if quote is not None and (max_age is None or now - quote.fetched < max_age):
+                result[coin] = quote
+        return result
+
+    async def quotes(self, coins) -> dict[str, PriceQuote]:
+        """Цены монет: свежие из кеша, остальные одной пачкой запросов (устаревшие — при ошибке)."""
+        coins = list(dict.fromkeys(coins))
+        now = time.time()
+        waits = []
+        missing = []
+        for coin in coins:
+            quote = self._quotes.get(coin)
+            if quote is not None and now - quote.fetched < self.ttl:
+                self.hits += 1
+            elif coin in self._inflight:
+                self.coalesced += 1
+                waits.append(self._inflight[coin])
+            else:
+                self.misses += 1
+                missing.append(coin)
+        if missing:
+            waits += self._start_fetch(missing)
+        if waits:
+            await asyncio.gather(*waits)
+        return {coin: self._quotes[coin] for coin in coins if coin in self._quotes}
+
+    async def refresh_watched(self) -> bool:
+        """Принудительно обновляет цены всех отслеживаемых монет. True, если все пачки загружены."""
+        coins = [coin for coin in self.watched if coin not in self._inflight]
+        if not coins:
+            return True
+        results = await asyncio.gather(*self._start_fetch(coins))
+        return all(results)
+
+    def _start_fetch(self, coins: list[str]) -> list[asyncio.Future]:
+        loop = asyncio.get_running_loop()
+        futures = []
+        for start in range(0, len(coins), MAX_BATCH):
+            batch = coins[start:start + MAX_BATCH]
+            future = loop.create_task(self._fetch_batch(batch))
+            for coin in batch:
+                self._inflight[coin] = future
+            futures.append(future)
+        return futures
+
+    async def _fetch_batch(self, coins: list[str]) -> bool:
+        self.upstream_calls += 1
+        try:
+            data = await self.client.get_json(f"{self.base_url}/prices/current/{','.join(coins)}", timeout=10)
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Ошибка запроса цен DefiLlama ({len(coins)} монет): {e}")
+            return False
+        finally:
+            for coin in coins:
+                self._inflight.pop(coin, None)
+        self.update(data.get("coins") or {})
+        return True
+
+    def update(self, coins: dict) -> None:
+        """Кладет в кеш ответ /prices/current ({ID: {price, symbol, timestamp, confidence}})."""
+        fetched = time.time()
+        for coin, info in coins.items():
+            try:
+                self._quotes[coin] = PriceQuote(coin, info.get("symbol") or coin, float(info["price"]), float(info.get("timestamp") or fetched),
+                                                info.get("confidence"), fetched)
+            except (KeyError, TypeError, ValueError):
+                continue
+
+    def export(self, coins=None) -> dict[str, dict]:
+        """Кеш цен (всех или только coins) в виде словаря для публикации другим воркерам."""
+        coins = self._quotes if coins is None else coins
+        return {coin: asdict(self._quotes[coin]) for coin in coins if coin in self._quotes}
+
+    def load(self, exported: dict[str, dict]) -> None:
+        """Кладет в кеш цены, опубликованные другим воркером (если они новее своих)."""
+        for coin, fields in exported.items():
+            current = self._quotes.get(coin)
+            if current is None or current.fetched < fields["fetched"]:
+                self._quotes[coin] = PriceQuote(**fields)
+
+    async def historical(self, coins, timestamp: int) -> dict[str, float]:
+        """Цены монет на момент timestamp одним вызовом /batchHistorical (с кешем по (монета, время))."""
+        coins = list(dict.fromkeys(coins))
+        result = {}
+        missing = []
+        for coin in coins:
+            key = (coin, timestamp)
+            if key in self._history:
+                self._history.move_to_end(key)
+                if self._history[key] is not None:
+                    result[coin] = self._history[key]
+            else:
+                missing.append(coin)
+        if not missing:
+            return result
+        self.upstream_calls += 1
+        params = {"coins": json.dumps({coin: [timestamp] for coin in missing}), "searchWidth": str(HISTORICAL_SEARCH_WIDTH)}
+        try:
+            data = await self.client.get_json(f"{self.base_url}/batchHistorical", params=params, timeout=10)
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Ошибка запроса исторических цен DefiLlama: {e}")
+            return result
+        found = data.get("coins") or {}
+        for coin in missing:
+            points = (found.get(coin) or {}).get("prices") or []
+            price = points[0].get("price") if points else None
+            self._history[(coin, timestamp)] = price
+            if price is not None:
+                result[coin] = price
+        while len(self._history) > self.history_cache_size:
+            self._history.popitem(last=False)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "coins": len(self._quotes),
+            "watched": len(self.watched),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "upstream_calls": self.upstream_calls,
+        }
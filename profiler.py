@@ -0,0 +1,74 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Верхние кадры простаивающего event loop (ожидание событий в selectors)
+IDLE_FRAMES = ("select (selectors.py:", "poll (selectors.py:")
+
+
+class StackSampler:
+    """Сэмплирующий профилировщик: раз в interval секунд снимает стек потока event loop.
+
+    Работает в отдельном потоке через sys._current_frames(), поэтому не требует
+    инструментирования кода и почти не замедляет бота. Результат — счетчик стеков
+    в формате collapsed stacks (flamegraph.pl, speedscope).
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def _sample(self, thread_id: int, duration: float) -> Counter:
+        stacks = Counter()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stacks[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+        return stacks
+
+    async def profile(self, duration: float) -> Counter:
+        """Снимает стеки текущего потока (event loop) в течение duration секунд."""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("профилирование уже идет")
+        try:
+            return await asyncio.to_thread(self._sample, threading.get_ident(), duration)
+        finally:
+            self._lock.release()
+
+
+def collapsed(stacks: Counter) -> str:
+    """Стеки в формате 'кадр;кадр;кадр число' (по одному на строку)."""
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+
+def is_idle(stack: str) -> bool:
+    """Стек, верхний кадр которого — ожидание событий в select/epoll."""
+    return stack.rsplit(";", 1)[-1].startswith(IDLE_FRAMES)
+
+
+def busy_samples(stacks: Counter) -> int:
+    """Сколько сэмплов поток был занят (без ожидания в select/epoll) — знаменатель для долей hot_frames."""
+    return sum(count for stack, count in stacks.items() if not is_idle(stack))
+
+
+def hot_frames(stacks: Counter, limit: int = 15) -> list[tuple[str, int]]:
+    """Самые частые верхние кадры стека (где поток проводил время) без ожидания в select/epoll."""
+    top = Counter()
+    for stack, count in stacks.items():
+        if not is_idle(stack):
+            top[stack.rsplit(";", 1)[-1]] += count
+    return top.most_common(limit)
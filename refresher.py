@@ -0,0 +1,67 @@
+import logging
+import random
+from typing import Callable
+
+from telegram.ext import ContextTypes, JobQueue
+
+from pools_cache import SnapshotCache
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundRefresher:
+    """Периодически обновляет SnapshotCache через JobQueue, чтобы обработчики читали данные только из памяти.
+
+    Каждый запуск планирует следующий через run_once: после успеха — через interval
+    (плюс случайный jitter, чтобы не бить в API ровно по расписанию), после ошибки —
+    с экспоненциальной задержкой от retry_delay до max_backoff. Пока enabled() возвращает
+    False (воркер не лидер), обновление пропускается, но расписание сохраняется.
+    """
+
+    def __init__(self, cache: SnapshotCache, interval: float, jitter: float = 0.1, retry_delay: float = 15.0, max_backoff: float = 600.0,
+                 enabled: Callable[[], bool] | None = None):
+        self.cache = cache
+        self.enabled = enabled
+        self.interval = interval
+        self.jitter = jitter  # доля от interval
+        self.retry_delay = retry_delay
+        self.max_backoff = max_backoff
+        self.failures = 0  # ошибок подряд
+
+    @property
+    def job_name(self) -> str:
+        return f"refresh:{self.cache.name}"
+
+    def start(self, job_queue: JobQueue, first: float = 0.0) -> None:
+        """Запускает первое обновление через first секунд."""
+        job_queue.run_once(self._run, when=first, name=self.job_name)
+        logger.info(f"Фоновое обновление {self.cache.name} запущено (интервал {self.interval:.0f} с).")
+
+    def next_delay(self) -> float:
+        """Задержка до следующего обновления с учетом jitter и ошибок подряд."""
+        if self.failures:
+            delay = min(self.retry_delay * 2 ** (self.failures - 1), self.max_backoff)
+        else:
+            delay = self.interval
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    async def _run(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        if self.enabled is not None and not self.enabled():
+            self.failures = 0
+            context.job_queue.run_once(self._run, when=self.next_delay(), name=self.job_name)
+            return
+        try:
+            ok = await self.cache.refresh()
+        except Exception as e:
+            logger.error(f"Неожиданная ошибка фонового обновления {self.cache.name}: {e}", exc_info=True)
+            ok = False
+
+        if ok:
+            self.failures = 0
+        else:
+            self.failures += 1
+            logger.warning(f"Фоновое обновление {self.cache.name} не удалось ({self.failures} подряд).")
+
+        delay = self.next_delay()
+        logger.debug(f"Следующее обновление {self.cache.name} через {delay:.1f} с.")
+        context.job_queue.run_once(self._run, when=delay, name=self.job_name)
@@ -0,0 +1,40 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class RenderCache:
+    """LRU кеш готовых ответов, привязанный к версии данных.
+
+    Пока версия (снимок DefiLlama + конфигурация) не изменилась, повторный запрос
+    того же ключа — это поиск в словаре. При смене версии кеш очищается целиком.
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._version: Hashable = None
+        self._items: OrderedDict[Hashable, Any] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get_or_render(self, key: Hashable, version: Hashable, render: Callable[[], Any]) -> Any:
+        if version != self._version:
+            self._items.clear()
+            self._version = version
+        try:
+            value = self._items[key]
+        except KeyError:
+            self.misses += 1
+            value = self._items[key] = render()
+            if len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+            return value
+        self.hits += 1
+        self._items.move_to_end(key)
+        return value
+
+    def clear(self) -> None:
+        self._items.clear()
+        self._version = None
@@ -0,0 +1,201 @@
+import heapq
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+
+from pools_snapshot import PoolsSnapshot
+
+SORT_KEYS = ("apy", "tvl")
+EXPOSURES = {"single": 1, "multi": 2}
+MAX_LIMIT = 50
+DEFAULT_LIMIT = 20
+
+_FILTER_RE = re.compile(r"^(?P<metric>apy|tvl)(?P<op>[<>])(?P<value>\d+(?:[.,]\d+)?)(?P<suffix>[kmb]?)$", re.IGNORECASE)
+_OPTION_RE = re.compile(r"^(?P<name>sort|limit)=(?P<value>\S+)$", re.IGNORECASE)
+_SUFFIXES = {"": 1.0, "k": 1e3, "m": 1e6, "b": 1e9}
+_STABLE_WORDS = {"stable", "stables", "stablecoin", "stablecoins"}
+_VOLATILE_WORDS = {"volatile", "nostable", "nonstable"}
+
+
+class ScreenerSyntaxError(ValueError):
+    """Некорректный текст команды /top."""
+
+
+def _parse_number(text: str) -> float:
+    """Граница фильтра: '5', '5.5' или '5,5'. '10,000' неоднозначно (10 или 10 тысяч) и отклоняется."""
+    whole, _, fraction = text.replace(",", ".").partition(".")
+    if "," in text and len(fraction) == 3:
+        raise ScreenerSyntaxError(f"'{text}' неоднозначно: пишите {whole}.{fraction} или {whole}{fraction} (можно с суффиксом k/m/b)")
+    try:
+        return float(text.replace(",", "."))
+    except ValueError:
+        raise ScreenerSyntaxError(f"'{text}' — не число") from None
+
+
+@dataclass(frozen=True, slots=True)
+class ScreenerQuery:
+    """Разобранная команда /top. Границы APY/TVL строгие: apy>5 — больше 5."""
+    chains: tuple[str, ...] = ()  # в нижнем регистре; пусто — все сети
+    stablecoin: bool | None = None
+    exposure: str | None = None
+    min_apy: float | None = None
+    max_apy: float | None = None
+    min_tvl: float | None = None
+    max_tvl: float | None = None
+    sort: str = "apy"
+    limit: int = DEFAULT_LIMIT
+
+
+def parse_query(args: list[str]) -> ScreenerQuery:
+    """Разбирает аргументы '/top ethereum,base stablecoin single apy>5 tvl>10M sort=tvl limit=20'.
+
+    Слова, которые не фильтры и не параметры, считаются названиями сетей.
+    """
+    fields = {"chains": []}
+    for arg in " ".join(args).replace(" ,", ",").replace(", ", ",").split():
+        word = arg.lower()
+        if word in _STABLE_WORDS:
+            fields["stablecoin"] = True
+        elif word in _VOLATILE_WORDS:
+            fields["stablecoin"] = False
+        elif word in EXPOSURES:
+            fields["exposure"] = word
+        elif match := _FILTER_RE.match(word):
+            value = _parse_number(match["value"]) * _SUFFIXES[match["suffix"]]
+            bound = "min" if match["op"].startswith(">") else "max"
+            fields[f"{bound}_{match['metric']}"] = value
+        elif match := _OPTION_RE.match(word):
+            if match["name"] == "sort":
+                if match["value"] not in SORT_KEYS:
+                    raise ScreenerSyntaxError(f"сортировка только по {' или '.join(SORT_KEYS)}")
+                fields["sort"] = match["value"]
+            else:
+                try:
+                    limit = int(match["value"])
+                except ValueError:
+                    raise ScreenerSyntaxError("limit должен быть числом") from None
+                if not 1 <= limit <= MAX_LIMIT:
+                    raise ScreenerSyntaxError(f"limit должен быть от 1 до {MAX_LIMIT}")
+                fields["limit"] = limit
+        elif "<=" in word or ">=" in word:
+            raise ScreenerSyntaxError(f"'{arg}': границы только строгие (apy>5, tvl<10M), >= и <= не поддерживаются")
+        elif any(op in word for op in "<>="):
+            raise ScreenerSyntaxError(f"непонятный фильтр '{arg}' (ожидается, например, apy>5 или tvl>10M)")
+        else:
+            fields["chains"] += [chain for chain in word.split(",") if chain]
+    fields["chains"] = tuple(dict.fromkeys(fields["chains"]))
+    return ScreenerQuery(**fields)
+
+
+class ScreenerIndex:
+    """Индексы для /top по всем пулам снимка, строятся один раз на снимок.
+
+    Для каждой сети (и для всех сетей сразу) строки отсортированы по убыванию APY
+    и по убыванию TVL; рядом лежат ключи сортировки (значение со знаком минус,
+    по возрастанию), поэтому фильтр вида apy>5 — это отрезок индекса, найденный
+    бинарным поиском. Для пулов из стейблкоинов (самый частый фильтр) есть свои
+    такие же индексы; признаки stablecoin и exposure для остальных проверок — колонки
+    по байту на пул.
+
+    Запрос идет одним из двух путей, смотря что дешевле:
+    - по индексу сортировки сверху вниз (несколько сетей — K-way merge их индексов),
+      с проверкой остальных фильтров, до limit найденных;
+    - по отрезку индекса другой метрики (если ее фильтр оставляет мало пулов)
+      с выбором limit лучших через heapq.
+    """
+
+    def __init__(self, snapshot: PoolsSnapshot):
+        self.snapshot = snapshot
+        self.apy = array('d', (snapshot.display_apy(row) if snapshot.display_apy(row) is not None else float("nan")
+                               for row in range(len(snapshot))))
+        self.stablecoin = snapshot.stablecoin
+        self.exposure = bytearray(EXPOSURES.get(value, 0) for value in snapshot.exposure)
+        self.chain_names = {key: snapshot.chain[rows[0]] for key, rows in snapshot.rows_by_chain.items() if key}
+        # (метрика, сеть, только стейблкоины) -> (строки по убыванию значения, ключи -значение по возрастанию);
+        # сеть "" — все сети
+        self._indexes: dict[tuple[str, str, bool], tuple[array, array]] = {}
+        for metric, column in (("apy", self.apy), ("tvl", snapshot.tvl)):
+            for chain, rows in list(snapshot.rows_by_chain.items()) + [("", range(len(snapshot)))]:
+                # sorted устойчив и при reverse=True: пулы с равным значением остаются в порядке строк
+                ordered = sorted((row for row in rows if column[row] == column[row]), key=column.__getitem__, reverse=True)
+                stable = [row for row in ordered if self.stablecoin[row]]
+                self._indexes[metric, chain, False] = (array('l', ordered), array('d', [-column[row] for row in ordered]))
+                self._indexes[metric, chain, True] = (array('l', stable), array('d', [-column[row] for row in stable]))
+
+    def _range(self, metric: str, chain: str, stable: bool, low: float | None, high: float | None) -> tuple[array, array, int, int]:
+        """Отрезок индекса metric в сети chain со значениями строго между low и high."""
+        rows, keys = self._indexes.get((metric, chain, stable), (array('l'), array('d')))
+        start = bisect_right(keys, -high) if high is not None else 0
+        end = bisect_left(keys, -low) if low is not None else len(keys)
+        return rows, keys, start, max(start, end)
+
+    def query(self, query: ScreenerQuery) -> list[int]:
+        """Строки снимка, подходящие под запрос, по убыванию query.sort (не больше query.limit)."""
+        chains = query.chains or ("",)
+        other = "tvl" if query.sort == "apy" else "apy"
+        bounds = {"apy": (query.min_apy, query.max_apy), "tvl": (query.min_tvl, query.max_tvl)}
+        stable = query.stablecoin is True
+        sort_ranges = [self._range(query.sort, chain, stable, *bounds[query.sort]) for chain in chains]
+        other_ranges = [self._range(other, chain, stable, *bounds[other]) for chain in chains]
+        if bounds[other] != (None, None):
+            other_count = sum(end - start for _, _, start, end in other_ranges)
+            if not other_count:
+                return []
+            # Сколько строк индекса сортировки придется просмотреть до limit найденных,
+            # если фильтр другой метрики пропускает долю other_count / (пулов с этой метрикой)
+            sort_count = sum(end - start for _, _, start, end in sort_ranges)
+            total = sum(len(rows) for rows, _, _, _ in other_ranges)
+            if other_count < min(sort_count, query.limit * total / other_count):
+                return self._by_other_range(query, other_ranges)
+        return self._scan_sorted(query, sort_ranges, bounds[other], other)
+
+    def _accepts(self, query: ScreenerQuery, row: int) -> bool:
+        if query.stablecoin is not None and bool(self.stablecoin[row]) != query.stablecoin:
+            return False
+        if query.exposure is not None and self.exposure[row] != EXPOSURES[query.exposure]:
+            return False
+        return True
+
+    def _scan_sorted(self, query: ScreenerQuery, ranges, other_bounds, other: str) -> list[int]:
+        column = self.apy if other == "apy" else self.snapshot.tvl
+        low, high = other_bounds
+        if len(ranges) == 1:
+            rows, _, start, end = ranges[0]
+            candidates = (rows[i] for i in range(start, end))
+        else:
+            # K-way merge отрезков нескольких сетей по ключу сортировки
+            candidates = (row for _, row in heapq.merge(*(_entries(*entry) for entry in ranges)))
+        found = []
+        for row in candidates:
+            value = column[row]
+            if low is not None and not value > low:  # NaN тоже отсекается
+                continue
+            if high is not None and not value < high:
+                continue
+            if not self._accepts(query, row):
+                continue
+            found.append(row)
+            if len(found) >= query.limit:
+                break
+        return found
+
+    def _by_other_range(self, query: ScreenerQuery, ranges) -> list[int]:
+        column = self.apy if query.sort == "apy" else self.snapshot.tvl
+        low, high = (query.min_apy, query.max_apy) if query.sort == "apy" else (query.min_tvl, query.max_tvl)
+        candidates = []
+        for rows, _, start, end in ranges:
+            for i in range(start, end):
+                row = rows[i]
+                value = column[row]
+                if value != value or (low is not None and not value > low) or (high is not None and not value < high):
+                    continue
+                if self._accepts(query, row):
+                    candidates.append((-value, row))
+        return [row for _, row in heapq.nsmallest(query.limit, candidates)]
+
+
+def _entries(rows: array, keys: array, start: int, end: int):
+    """(ключ, строка) отрезка индекса — ленивый вход для heapq.merge."""
+    for i in range(start, end):
+        yield keys[i], rows[i]
@@ -0,0 +1,243 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+
+from telegram import Bot
+from telegram.error import RetryAfter, TelegramError
+
+from metrics import TELEGRAM_ERRORS, TELEGRAM_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: меньше — раньше
+INTERACTIVE = 0
+BULK = 10
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity в запасе."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, now: float) -> float:
+        """Сколько ждать до появления токена (0 — токен есть)."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+
+@dataclass(order=True)
+class SendJob:
+    priority: int
+    seq: int
+    chat_id: int = field(compare=False)
+    method: str = field(compare=False)  # "send_message" или "edit_message_text"
+    kwargs: dict = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    created: float = field(compare=False, default_factory=time.monotonic)
+    waiters: list = field(compare=False, default_factory=list)  # futures объединенных с этой правкой
+
+
+class SendScheduler:
+    """Очередь исходящих сообщений Telegram с ограничениями на чат и на бота в целом.
+
+    - token bucket на каждый чат (per_chat_rate) и общий (global_rate, ~30 сообщений/с у Telegram);
+    - задания с меньшим priority уходят раньше (ответы пользователям раньше массовых уведомлений);
+    - сообщения в один чат отправляются по порядку и не параллельно;
+    - несколько еще не отправленных правок одного сообщения объединяются в последнюю;
+    - при 429 (RetryAfter) чат ставится на паузу на retry_after, задание повторяется.
+    """
+
+    def __init__(self, global_rate: float = 25.0, per_chat_rate: float = 1.0, per_chat_burst: float = 3.0, max_retries: int = 3):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_retries = max_retries
+        self._bot: Bot | None = None
+        self._heap: list[SendJob] = []
+        self._seq = itertools.count()
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._chat_paused_until: dict[int, float] = {}
+        self._busy_chats: set[int] = set()
+        self._pending_edits: dict[tuple[int, int], SendJob] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        # Метрики
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.retried = 0
+        self._latencies: deque[float] = deque(maxlen=1000)
+
+    def start(self, bot: Bot) -> None:
+        self._bot = bot
+        self._task = asyncio.create_task(self._run(), name="send_scheduler")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    @property
+    def depth(self) -> int:
+        return len(self._heap)
+
+    def submit(self, method: str, chat_id: int, priority: int = INTERACTIVE, **kwargs) -> asyncio.Future:
+        """Ставит вызов Bot.<method>(chat_id=..., **kwargs) в очередь и возвращает future с результатом."""
+        future = asyncio.get_running_loop().create_future()
+        # Ошибка уже записана в лог в _send; помечаем ее полученной, чтобы не было предупреждений
+        # asyncio для заданий, результат которых никто не ждет (уведомления)
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        if method == "edit_message_text":
+            key = (chat_id, kwargs["message_id"])
+            pending = self._pending_edits.get(key)
+            if pending is not None:
+                # Правка еще не ушла — заменяем ее текст, результат получат оба вызывающих
+                pending.kwargs = kwargs
+                pending.waiters.append(future)
+                if priority < pending.priority:
+                    pending.priority = priority
+                    heapq.heapify(self._heap)
+                self.coalesced += 1
+                return future
+        job = SendJob(priority, next(self._seq), chat_id, method, kwargs, future)
+        if method == "edit_message_text":
+            self._pending_edits[(chat_id, kwargs["message_id"])] = job
+        heapq.heappush(self._heap, job)
+        self._wakeup.set()
+        return future
+
+    async def send_message(self, chat_id: int, text: str, priority: int = INTERACTIVE, **kwargs) -> Any:
+        return await self.submit("send_message", chat_id, priority, text=text, **kwargs)
+
+    async def edit_message_text(self, chat_id: int, message_id: int, text: str, priority: int = INTERACTIVE, **kwargs) -> Any:
+        return await self.submit("edit_message_text", chat_id, priority, message_id=message_id, text=text, **kwargs)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+        return bucket
+
+    def _next_ready(self, now: float) -> tuple[SendJob | None, float]:
+        """Достает самое приоритетное задание, которое можно отправить сейчас, или время ожидания."""
+        deferred = []
+        job = None
+        wait = float("inf")
+        while self._heap:
+            candidate = heapq.heappop(self._heap)
+            chat_id = candidate.chat_id
+            chat_wait = max(self._chat_paused_until.get(chat_id, 0.0) - now, 0.0)
+            if chat_id in self._busy_chats:
+                chat_wait = max(chat_wait, 0.05)
+            if chat_wait == 0.0:
+                chat_wait = self._chat_bucket(chat_id).wait_time(now)
+            if chat_wait == 0.0:
+                job = candidate
+                break
+            wait = min(wait, chat_wait)
+            deferred.append(candidate)
+        for candidate in deferred:
+            heapq.heappush(self._heap, candidate)
+        return job, wait
+
+    async def _run(self) -> None:
+        while True:
+            now = time.monotonic()
+            global_wait = self.global_bucket.wait_time(now)
+            if global_wait:
+                await asyncio.sleep(global_wait)
+                continue
+            job, wait = self._next_ready(now)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=None if wait == float("inf") else wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.global_bucket.take()
+            self._chat_bucket(job.chat_id).take()
+            if job.method == "edit_message_text":
+                self._pending_edits.pop((job.chat_id, job.kwargs["message_id"]), None)
+            self._busy_chats.add(job.chat_id)
+            asyncio.create_task(self._send(job))
+
+    async def _send(self, job: SendJob) -> None:
+        futures = [job.future, *job.waiters]
+        attempt = 0
+        try:
+            while True:
+                try:
+                    with TELEGRAM_SECONDS.time(method=job.method):
+                        result = await getattr(self._bot, job.method)(chat_id=job.chat_id, **job.kwargs)
+                except RetryAfter as e:
+                    retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+                    self._chat_paused_until[job.chat_id] = time.monotonic() + retry_after
+                    if attempt >= self.max_retries:
+                        raise
+                    TELEGRAM_ERRORS.inc(method=job.method, exception=type(e).__name__)
+                    attempt += 1
+                    self.retried += 1
+                    logger.warning(f"Telegram 429 для чата {job.chat_id}, повтор через {retry_after:.1f} с")
+                    await asyncio.sleep(retry_after)
+                    continue
+                break
+        except TelegramError as e:
+            self.failed += 1
+            TELEGRAM_ERRORS.inc(method=job.method, exception=type(e).__name__)
+            logger.warning(f"Ошибка отправки {job.method} в чат {job.chat_id}: {e}")
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+        except Exception as e:
+            # Не ошибка Bot API (например, TypeError внутри PTB): ожидающие отправку тоже должны ее получить,
+            # иначе обработчик, ждущий future, зависнет навсегда
+            self.failed += 1
+            TELEGRAM_ERRORS.inc(method=job.method, exception=type(e).__name__)
+            logger.error(f"Неожиданная ошибка отправки {job.method} в чат {job.chat_id}: {e}", exc_info=True)
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+        except asyncio.CancelledError:
+            for future in futures:
+                future.cancel()
+            raise
+        else:
+            self.sent += 1
+            self._latencies.append(time.monotonic() - job.created)
+            for future in futures:
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._busy_chats.discard(job.chat_id)
+            self._wakeup.set()
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        return {
+            "depth": self.depth,
+            "sent": self.sent,
+            "failed": self.failed,
+            "coalesced": self.coalesced,
+            "retried": self.retried,
+            "latency_p50": latencies[len(latencies) // 2] if latencies else None,
+            "latency_p95": latencies[int(len(latencies) * 0.95)] if latencies else None,
+        }
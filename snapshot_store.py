@@ -0,0 +1,123 @@
+import json
+import logging
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+from pools_snapshot import PoolsSnapshot
+
+logger = logging.getLogger(__name__)
+
+# Формат файла:
+#   заголовок  MAGIC, версия схемы (uint16), время снимка (float64, unix), число пулов (uint32),
+#              длина блока строк (uint32)
+#   строки     JSON: [pool_ids, chain, project, symbol, exposure]
+#   колонки    apy, apyBase, apyReward, tvlUsd — сырые float64 (array('d').tobytes())
+#   флаги      stablecoin — по байту на пул
+# При изменении формата увеличивайте SCHEMA_VERSION: файлы старой версии будут удалены при загрузке.
+MAGIC = b"PLSNAP"
+SCHEMA_VERSION = 2
+_HEADER = struct.Struct("<6sHdII")
+_COLUMNS = ("apy", "apy_base", "apy_reward", "tvl")
+
+
+class SnapshotFormatError(ValueError):
+    """Снимок другой версии формата или поврежден."""
+
+
+def encode_snapshot(snapshot: PoolsSnapshot, updated_at: float) -> bytes:
+    """Сериализует снимок в описанный выше формат."""
+    strings = json.dumps([snapshot.pool_ids, snapshot.chain, snapshot.project, snapshot.symbol, snapshot.exposure],
+                         ensure_ascii=False).encode("utf-8")
+    parts = [_HEADER.pack(MAGIC, SCHEMA_VERSION, updated_at, len(snapshot), len(strings)), strings]
+    for column in _COLUMNS:
+        values = getattr(snapshot, column)
+        if sys.byteorder != "little":
+            values = array('d', values)
+            values.byteswap()
+        parts.append(values.tobytes())
+    parts.append(bytes(snapshot.stablecoin))
+    return b"".join(parts)
+
+
+def decode_snapshot(data: bytes) -> tuple[PoolsSnapshot, float]:
+    """Читает снимок из байтов. Возвращает (снимок, время снимка).
+
+    Другая версия формата или поврежденные данные — SnapshotFormatError.
+    """
+    try:
+        magic, version, updated_at, count, strings_len = _HEADER.unpack_from(data)
+        if magic != MAGIC or version != SCHEMA_VERSION:
+            raise SnapshotFormatError(f"другая версия формата ({version})")
+        offset = _HEADER.size
+        pool_ids, chain, project, symbol, exposure = json.loads(data[offset:offset + strings_len].decode("utf-8"))
+        offset += strings_len
+        columns = []
+        for _ in _COLUMNS:
+            values = array('d')
+            values.frombytes(data[offset:offset + count * values.itemsize])
+            if sys.byteorder != "little":
+                values.byteswap()
+            offset += count * values.itemsize
+            columns.append(values)
+        stablecoin = bytearray(data[offset:offset + count])
+        return PoolsSnapshot.from_columns(pool_ids, chain, project, symbol, *columns, stablecoin, exposure), updated_at
+    except SnapshotFormatError:
+        raise
+    except (struct.error, ValueError, UnicodeDecodeError) as e:
+        raise SnapshotFormatError(f"данные повреждены ({e})") from e
+
+
+class SnapshotStore:
+    """Сохраняет последний успешный снимок /pools на диск и читает его при старте бота."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def save(self, snapshot: PoolsSnapshot, updated_at: float) -> bool:
+        """Атомарно записывает снимок (через временный файл и os.replace)."""
+        data = encode_snapshot(snapshot, updated_at)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile('wb', dir=directory, delete=False, suffix=".tmp") as f:
+                tmp_path = f.name
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            logger.info(f"Снимок пулов сохранен в {self.path} ({len(snapshot)} пулов)")
+            return True
+        except OSError as e:
+            logger.error(f"Ошибка записи снимка пулов {self.path}: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+    def load(self) -> tuple[PoolsSnapshot, float] | None:
+        """Читает снимок с диска. Возвращает (снимок, время снимка) или None."""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.error(f"Ошибка чтения снимка пулов {self.path}: {e}")
+            return None
+
+        try:
+            snapshot, updated_at = decode_snapshot(data)
+        except SnapshotFormatError as e:
+            logger.warning(f"Снимок {self.path} не подходит: {e}, удаляем его.")
+            self._discard()
+            return None
+        logger.info(f"Загружен сохраненный снимок пулов из {self.path} ({len(snapshot)} пулов)")
+        return snapshot, updated_at
+
+    def _discard(self) -> None:
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
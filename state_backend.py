@@ -0,0 +1,191 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_state (
+    user_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (user_id, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS snapshots (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS revisions (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+
+class StateBackend:
+    """Общее состояние воркеров бота: выбор пользователя, опубликованные снимки, ревизии и лидерство.
+
+    Все методы синхронные и рассчитаны на вызов через asyncio.to_thread.
+    Эта реализация хранит все в памяти процесса (один воркер, поведение по умолчанию).
+    """
+
+    shared = False  # видят ли состояние другие процессы
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._user_state: dict[int, dict[str, Any]] = {}
+        self._snapshots: dict[str, tuple[int, float, bytes]] = {}
+        self._revisions: dict[str, int] = {}
+
+    # --- Состояние пользователя (например, выбранная в /pools сеть) ---
+
+    def get_user_value(self, user_id: int, key: str, default: Any = None) -> Any:
+        with self._lock:
+            return self._user_state.get(user_id, {}).get(key, default)
+
+    def set_user_value(self, user_id: int, key: str, value: Any) -> None:
+        with self._lock:
+            self._user_state.setdefault(user_id, {})[key] = value
+
+    # --- Снимки, которые лидер публикует для остальных воркеров ---
+
+    def publish_snapshot(self, name: str, data: bytes, updated_at: float) -> int:
+        """Сохраняет сериализованный снимок и возвращает его новую версию."""
+        with self._lock:
+            version = self._snapshots.get(name, (0, 0.0, b""))[0] + 1
+            self._snapshots[name] = (version, updated_at, data)
+            return version
+
+    def snapshot_version(self, name: str) -> int:
+        """Версия последнего опубликованного снимка (0 — еще не публиковался)."""
+        with self._lock:
+            return self._snapshots.get(name, (0, 0.0, b""))[0]
+
+    def load_snapshot(self, name: str) -> tuple[int, float, bytes] | None:
+        """Последний опубликованный снимок: (версия, время снимка, данные) или None."""
+        with self._lock:
+            return self._snapshots.get(name)
+
+    # --- Ревизии: счетчики изменений данных, которые каждый воркер держит в памяти (алерты) ---
+
+    def bump_revision(self, name: str) -> int:
+        with self._lock:
+            value = self._revisions[name] = self._revisions.get(name, 0) + 1
+            return value
+
+    def revision(self, name: str) -> int:
+        with self._lock:
+            return self._revisions.get(name, 0)
+
+    # --- Выбор лидера, который один ходит во внешние API ---
+
+    def acquire_leadership(self, worker_id: str, lease: float) -> bool:
+        """Берет или продлевает аренду лидера на lease секунд. В одном процессе лидер всегда он сам."""
+        return True
+
+    def release_leadership(self, worker_id: str) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteStateBackend(StateBackend):
+    """Общее состояние в одном файле SQLite (WAL) для нескольких воркеров на одной машине или общем томе.
+
+    Лидер выбирается арендой: воркер продлевает строку в leases, пока жив; если аренда
+    истекла, ее забирает первый, кто попробует.
+    """
+
+    shared = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def get_user_value(self, user_id: int, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM user_state WHERE user_id = ? AND key = ?", (user_id, key)).fetchone()
+        return json.loads(row[0]) if row is not None else default
+
+    def set_user_value(self, user_id: int, key: str, value: Any) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO user_state (user_id, key, value) VALUES (?, ?, ?)",
+                               (user_id, key, json.dumps(value, ensure_ascii=False)))
+
+    def publish_snapshot(self, name: str, data: bytes, updated_at: float) -> int:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO snapshots (name, version, updated_at, data) VALUES (?, 1, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at, data = excluded.data",
+                (name, updated_at, data),
+            )
+            return self._conn.execute("SELECT version FROM snapshots WHERE name = ?", (name,)).fetchone()[0]
+
+    def snapshot_version(self, name: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM snapshots WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def load_snapshot(self, name: str) -> tuple[int, float, bytes] | None:
+        with self._lock:
+            row = self._conn.execute("SELECT version, updated_at, data FROM snapshots WHERE name = ?", (name,)).fetchone()
+        return (row[0], row[1], bytes(row[2])) if row is not None else None
+
+    def bump_revision(self, name: str) -> int:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO revisions (name, value) VALUES (?, 1) ON CONFLICT (name) DO UPDATE SET value = value + 1", (name,)
+            )
+            return self._conn.execute("SELECT value FROM revisions WHERE name = ?", (name,)).fetchone()[0]
+
+    def revision(self, name: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM revisions WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def acquire_leadership(self, worker_id: str, lease: float) -> bool:
+        now = time.time()
+        with self._lock, self._conn:
+            # Одна инструкция: продлить свою аренду или забрать истекшую чужую
+            self._conn.execute(
+                "INSERT INTO leases (name, owner, expires) VALUES ('leader', ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+                "WHERE leases.owner = excluded.owner OR leases.expires < ?",
+                (worker_id, now + lease, now),
+            )
+            owner = self._conn.execute("SELECT owner FROM leases WHERE name = 'leader'").fetchone()[0]
+        return owner == worker_id
+
+    def release_leadership(self, worker_id: str) -> None:
+        """Отдает аренду при остановке, чтобы другой воркер стал лидером без ожидания."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM leases WHERE name = 'leader' AND owner = ?", (worker_id,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def make_state_backend(kind: str, path: str) -> StateBackend:
+    """Создает хранилище состояния по названию из STATE_BACKEND: memory или sqlite."""
+    if kind == "memory":
+        return StateBackend()
+    if kind == "sqlite":
+        logger.info(f"Общее состояние воркеров: SQLite {path}")
+        return SQLiteStateBackend(path)
+    raise ValueError(f"Неизвестный STATE_BACKEND: {kind!r} (ожидается memory или sqlite)")
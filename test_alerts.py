@@ -0,0 +1,91 @@
+# test_alerts.py
+"""Разбор команды /alert и поиск сработавших подписок по пересечению порога.
+
+Запуск: python -m pytest -q test_alerts.py
+"""
+import pytest
+
+from alerts import ABOVE, BELOW, Alert, AlertIndex, AlertSyntaxError, parse_alert
+
+
+@pytest.mark.parametrize("text, metric, direction, threshold", [
+    ("aave usdc apy < 3", "apy", BELOW, 3.0),
+    ("aave usdc APY <3,5", "apy", BELOW, 3.5),
+    ("aave usdc tvl > 10M", "tvl", ABOVE, 10e6),
+    ("aave usdc tvl > 1.5 b", "tvl", ABOVE, 1.5e9),
+    ("aave usdc tvl > 10.000", "tvl", ABOVE, 10.0),
+])
+def test_parse_threshold(text, metric, direction, threshold):
+    request = parse_alert(text)
+    assert request.pool_name == "aave usdc"
+    assert (request.metric, request.direction, request.drop_pct) == (metric, direction, None)
+    assert request.threshold == pytest.approx(threshold)
+
+
+def test_parse_drop():
+    request = parse_alert("aave  usdc tvl drop 20,5%")
+    assert (request.pool_name, request.metric, request.direction) == ("aave usdc", "tvl", BELOW)
+    assert request.threshold is None and request.drop_pct == 20.5
+
+
+@pytest.mark.parametrize("text", [
+    "aave usdc apy < 1.2.3",
+    "aave usdc apy < .",
+    "aave usdc apy < ,5",
+    "aave usdc tvl > 10,000",
+    "aave usdc tvl drop 1,000%",
+    "aave usdc tvl drop 0%",
+    "aave usdc tvl drop 100",
+    "aave usdc apy = 3",
+    "apy < 3",
+])
+def test_parse_rejects(text):
+    with pytest.raises(AlertSyntaxError):
+        parse_alert(text)
+
+
+def make_index(*specs) -> AlertIndex:
+    index = AlertIndex()
+    for alert_id, (direction, threshold) in enumerate(specs, 1):
+        index.add(Alert(alert_id, 1, "pool", "pool", "apy", direction, threshold, ""))
+    return index
+
+
+def fired(index: AlertIndex, old: float, new: float) -> set[int]:
+    return {alert.id for alert in index.crossed("pool", "apy", old, new)}
+
+
+def test_crossed_below():
+    index = make_index((BELOW, 3.0), (BELOW, 5.0), (BELOW, 7.0))
+    assert fired(index, 6.0, 2.0) == {1, 2}
+    # value < T стало верным: new < T <= old
+    assert fired(index, 5.0, 4.0) == {2}
+    assert fired(index, 4.0, 3.0) == set()
+    # Рост не вызывает подписок «ниже»
+    assert fired(index, 2.0, 6.0) == set()
+
+
+def test_crossed_above():
+    index = make_index((ABOVE, 3.0), (ABOVE, 5.0), (ABOVE, 7.0))
+    assert fired(index, 2.0, 6.0) == {1, 2}
+    # value > T стало верным: old <= T < new
+    assert fired(index, 5.0, 6.0) == {2}
+    assert fired(index, 4.0, 5.0) == set()
+    assert fired(index, 6.0, 2.0) == set()
+
+
+def test_crossed_ignores_nan_and_other_keys():
+    index = make_index((BELOW, 3.0), (ABOVE, 5.0))
+    assert fired(index, float("nan"), 1.0) == set()
+    assert fired(index, 1.0, float("nan")) == set()
+    assert fired(index, 4.0, 4.0) == set()
+    assert index.crossed("other", "apy", 4.0, 1.0) == []
+    assert index.crossed("pool", "tvl", 4.0, 1.0) == []
+
+
+def test_removed_alert_does_not_fire():
+    index = make_index((BELOW, 3.0), (BELOW, 3.0))
+    index.remove(1)
+    assert fired(index, 4.0, 2.0) == {2}
+    index.remove(2)
+    assert fired(index, 4.0, 2.0) == set()
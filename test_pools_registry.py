@@ -0,0 +1,35 @@
+# test_pools_registry.py
+"""Проверка pools_config.json: некорректная запись не роняет бота, а оставляет прежнюю конфигурацию.
+
+Запуск: python -m pytest -q test_pools_registry.py
+"""
+import json
+
+import pytest
+
+from pools_registry import ConfigError, PoolsRegistry, parse_pools_config
+
+ENTRY = {"chain": "Ethereum", "project": "aave-v3", "symbol": "USDC", "ticker_group": "USDC"}
+
+
+def test_user_comment_defaults_to_project_and_symbol():
+    pool, named = parse_pools_config([ENTRY, dict(ENTRY, user_comment=" Aave USDC ")])
+    assert pool.user_comment == "aave-v3 USDC"
+    assert named.user_comment == "Aave USDC"
+    assert (pool.chain, pool.ticker_group) == ("ethereum", "usdc")
+
+
+@pytest.mark.parametrize("user_comment", [5, "", "   ", ["Aave"], {"text": "Aave"}])
+def test_invalid_user_comment_is_config_error(user_comment):
+    with pytest.raises(ConfigError, match="user_comment"):
+        parse_pools_config([dict(ENTRY, user_comment=user_comment)])
+
+
+def test_invalid_reload_keeps_previous_config(tmp_path):
+    path = tmp_path / "pools_config.json"
+    path.write_text(json.dumps([dict(ENTRY, user_comment="Aave USDC")]), encoding="utf-8")
+    registry = PoolsRegistry(str(path))
+    assert registry.reload_if_changed()
+    path.write_text(json.dumps([dict(ENTRY, user_comment=42), ENTRY]), encoding="utf-8")
+    assert not registry.reload_if_changed()
+    assert [pool.user_comment for pool in registry.pools] == ["Aave USDC"]
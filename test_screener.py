@@ -0,0 +1,22 @@
+# test_screener.py
+"""Разбор аргументов команды /top.
+
+Запуск: python -m pytest -q test_screener.py
+"""
+import pytest
+
+from screener import ScreenerSyntaxError, parse_query
+
+
+def test_parse_filters_and_options():
+    query = parse_query(["ethereum, base", "stablecoin", "single", "apy>5,5", "tvl<10M", "sort=tvl", "limit=5"])
+    assert query.chains == ("ethereum", "base")
+    assert (query.stablecoin, query.exposure, query.sort, query.limit) == (True, "single", "tvl", 5)
+    assert query.min_apy == 5.5 and query.max_tvl == 10e6
+    assert query.max_apy is None and query.min_tvl is None
+
+
+@pytest.mark.parametrize("arg", ["apy>1.2.3", "apy>.", "apy>,5", "tvl>10,000", "apy>=5", "tvl<=1m", "apy=5", "limit=0", "sort=name"])
+def test_parse_rejects(arg):
+    with pytest.raises(ScreenerSyntaxError):
+        parse_query([arg])
@@ -0,0 +1,142 @@
+# test_state_backend.py
+"""Два воркера на одном файле SQLite: аренда лидера, публикация снимков и ревизии, синхронизация снимков в bot.
+
+Запуск: python -m pytest -q test_state_backend.py
+"""
+import asyncio
+import time
+
+import pytest
+
+from pools_cache import SnapshotCache
+from pools_snapshot import PoolsSnapshot
+from snapshot_store import encode_snapshot
+from state_backend import SQLiteStateBackend
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """Два независимых подключения к одному файлу — как два процесса бота."""
+    path = str(tmp_path / "state.sqlite3")
+    first, second = SQLiteStateBackend(path), SQLiteStateBackend(path)
+    yield first, second
+    first.close()
+    second.close()
+
+
+def test_leader_is_exclusive_while_lease_is_valid(workers):
+    first, second = workers
+    assert first.acquire_leadership("a", lease=30)
+    assert not second.acquire_leadership("b", lease=30)
+    # Продление своей аренды не отдает лидерство
+    assert first.acquire_leadership("a", lease=30)
+    assert not second.acquire_leadership("b", lease=30)
+
+
+def test_expired_lease_is_taken_over(workers):
+    first, second = workers
+    assert first.acquire_leadership("a", lease=0.05)
+    time.sleep(0.1)
+    assert second.acquire_leadership("b", lease=30)
+    # Прежний лидер узнает об этом при следующем продлении
+    assert not first.acquire_leadership("a", lease=30)
+
+
+def test_release_hands_over_without_waiting(workers):
+    first, second = workers
+    assert first.acquire_leadership("a", lease=30)
+    second.release_leadership("b")  # чужую аренду отпустить нельзя
+    assert not second.acquire_leadership("b", lease=30)
+    first.release_leadership("a")
+    assert second.acquire_leadership("b", lease=30)
+
+
+def test_published_snapshot_is_versioned(workers):
+    leader, follower = workers
+    assert follower.snapshot_version("pools") == 0
+    assert follower.load_snapshot("pools") is None
+    assert leader.publish_snapshot("pools", b"first", 100.0) == 1
+    assert leader.publish_snapshot("pools", b"second", 200.0) == 2
+    assert follower.snapshot_version("pools") == 2
+    assert follower.load_snapshot("pools") == (2, 200.0, b"second")
+    # Снимки разных имен версионируются независимо
+    assert leader.publish_snapshot("prices", b"{}", 300.0) == 1
+    assert follower.snapshot_version("pools") == 2
+
+
+def test_revision_bumps_are_visible_to_other_worker(workers):
+    first, second = workers
+    assert second.revision("alerts") == 0
+    assert first.bump_revision("alerts") == 1
+    assert second.revision("alerts") == 1
+    assert second.bump_revision("alerts") == 2
+    assert first.revision("alerts") == 2
+
+
+def test_user_state_is_shared(workers):
+    first, second = workers
+    first.set_user_value(42, "selected_chain", "Ethereum")
+    assert second.get_user_value(42, "selected_chain") == "Ethereum"
+    assert second.get_user_value(43, "selected_chain", "none") == "none"
+
+
+@pytest.fixture(scope="module")
+def bot(tmp_path_factory):
+    """Модуль bot с базами во временном каталоге: он открывает их при импорте."""
+    workdir = tmp_path_factory.mktemp("bot")
+    with pytest.MonkeyPatch.context() as env:
+        for name, filename in (("HISTORY_DB_PATH", "history.sqlite3"), ("ALERTS_DB_PATH", "alerts.sqlite3"),
+                               ("POOLS_SNAPSHOT_PATH", "snapshot.bin"), ("POOLS_RESOLVED_PATH", "resolved.json")):
+            env.setenv(name, str(workdir / filename))
+        import bot
+    yield bot
+    bot.history_store.close()
+    bot.alert_store.close()
+
+
+@pytest.fixture
+def leader(bot, workers, monkeypatch):
+    """bot работает как воркер, который не лидер; возвращает подключение лидера к тому же файлу."""
+    leader, follower = workers
+    monkeypatch.setattr(bot, "state_backend", follower)
+    monkeypatch.setattr(bot, "is_leader", False)
+    monkeypatch.setattr(bot, "shared_versions", {})
+    return leader
+
+
+def make_snapshot(apy: float) -> PoolsSnapshot:
+    return PoolsSnapshot({"pool-1": {"chain": "Ethereum", "project": "aave-v3", "symbol": "USDC", "apy": apy, "tvlUsd": 1e6}})
+
+
+def test_follower_cache_keeps_leader_timestamp(bot, leader):
+    """fetch_pools_snapshot у воркера, который не лидер: снимок лидера со временем лидера, без новой версии — без замены."""
+
+    async def scenario():
+        cache = SnapshotCache(bot.fetch_pools_snapshot, ttl=60, stale_ttl=60, name="test")
+        old = time.time() - 5 * 3600
+        leader.publish_snapshot("pools", encode_snapshot(make_snapshot(3.0), old), old)
+        assert list((await cache.get()).apy) == [3.0]
+        assert cache.updated_at == old
+        assert cache.age > 5 * 3600 - 60
+        version = cache.version
+        # Лидер ничего нового не опубликовал: снимок не считается свежим и кеш не меняет версию
+        assert not await cache.refresh()
+        assert cache.version == version and cache.updated_at == old
+        now = time.time()
+        leader.publish_snapshot("pools", encode_snapshot(make_snapshot(4.0), now), now)
+        assert await cache.refresh()
+        assert list(cache.peek().apy) == [4.0] and cache.updated_at == now and cache.version == version + 1
+
+    asyncio.run(scenario())
+
+
+def test_unreadable_shared_snapshot_is_skipped(bot, leader):
+    leader.publish_snapshot("pools", b"garbage", 100.0)
+    assert bot.load_shared_snapshot("pools", bot.decode_pools_snapshot) is None
+    assert bot.shared_versions == {}
+    # Следующий корректный снимок принимается, повторно он уже не загружается
+    leader.publish_snapshot("pools", encode_snapshot(make_snapshot(3.0), 200.0), 200.0)
+    value, updated_at = bot.load_shared_snapshot("pools", bot.decode_pools_snapshot)
+    assert list(value.pool_ids) == ["pool-1"] and updated_at == 200.0
+    assert bot.shared_versions == {"pools": 2}
+    assert bot.load_shared_snapshot("pools", bot.decode_pools_snapshot) is None
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable
+from urllib.parse import urlsplit
+
+import httpx
+
+from metrics import UPSTREAM_ERRORS, UPSTREAM_SECONDS, observe_stage
+
+logger = logging.getLogger(__name__)
+
+# Настройки HTTP клиента для внешних API (DefiLlama pools и coins API)
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "10"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "30"))
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))  # повторов сверх первой попытки
+UPSTREAM_RETRY_DELAY = float(os.getenv("UPSTREAM_RETRY_DELAY", "0.5"))
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "20"))
+UPSTREAM_PER_HOST_LIMIT = int(os.getenv("UPSTREAM_PER_HOST_LIMIT", "4"))
+
+# Статусы, при которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+try:
+    import h2  # noqa: F401 (HTTP/2 включается только если установлен httpx[http2])
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class UpstreamClient:
+    """Общий асинхронный HTTP клиент для внешних API.
+
+    Держит keep-alive пул соединений (без нового TCP+TLS рукопожатия на каждый запрос),
+    использует HTTP/2, если он доступен, ограничивает число одновременных запросов
+    к одному хосту и повторяет запросы при сетевых ошибках и 429/5xx.
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = UPSTREAM_CONNECT_TIMEOUT,
+        read_timeout: float = UPSTREAM_READ_TIMEOUT,
+        retries: int = UPSTREAM_RETRIES,
+        retry_delay: float = UPSTREAM_RETRY_DELAY,
+        max_connections: int = UPSTREAM_MAX_CONNECTIONS,
+        per_host_limit: int = UPSTREAM_PER_HOST_LIMIT,
+    ):
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.per_host_limit = per_host_limit
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections, keepalive_expiry=60.0)
+        self._client: httpx.AsyncClient | None = None
+        self._host_semaphores: dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                timeout=self.timeout,
+                limits=self._limits,
+                headers={"Accept-Encoding": "gzip, deflate", "Accept": "application/json"},
+                follow_redirects=True,
+            )
+        return self._client
+
+    def _semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return semaphore
+
+    async def get(self, url: str, *, params: dict | None = None, timeout: float | None = None) -> httpx.Response:
+        """GET запрос с повторами. Возвращает успешный ответ или выбрасывает httpx.HTTPError."""
+        request_timeout = httpx.Timeout(timeout, connect=self.timeout.connect) if timeout is not None else self.timeout
+        host = urlsplit(url).netloc
+        start = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    async with self._semaphore(url):
+                        response = await self.client.get(url, params=params, timeout=request_timeout)
+                    if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                        logger.warning(f"{url}: статус {response.status_code}, повтор {attempt + 1}/{self.retries}")
+                        UPSTREAM_ERRORS.inc(host=host, exception=f"HTTP {response.status_code}")
+                    else:
+                        response.raise_for_status()
+                        return response
+                except httpx.TransportError as e:
+                    if attempt >= self.retries:
+                        raise
+                    logger.warning(f"{url}: {type(e).__name__}, повтор {attempt + 1}/{self.retries}")
+                    UPSTREAM_ERRORS.inc(host=host, exception=type(e).__name__)
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+                attempt += 1
+        except Exception as e:
+            UPSTREAM_ERRORS.inc(host=host, exception=type(e).__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            UPSTREAM_SECONDS.observe(elapsed, host=host)
+            observe_stage("fetch", elapsed)
+
+    async def get_stream(self, url: str, sink_factory: Callable[[], Any], *, params: dict | None = None, timeout: float | None = None,
+                         feed_stage: str | None = "decode"):
+        """GET запрос с потоковой передачей тела ответа по кускам в sink.feed(bytes).
+
+        Для каждой попытки создается новый sink через sink_factory(), поэтому
+        оборванная на середине передача повторяется с чистого листа; у sink оборванной
+        попытки вызывается discard(), если такой метод есть (например, закрыть файл).
+        Возвращает sink успешной попытки или выбрасывает httpx.HTTPError.
+
+        Время sink.feed (разбор) учитывается как этап feed_stage, остальное — как fetch.
+        feed_stage=None — sink ничего не разбирает (например, пишет в файл), все время — fetch.
+        """
+        request_timeout = httpx.Timeout(timeout, connect=self.timeout.connect) if timeout is not None else self.timeout
+        host = urlsplit(url).netloc
+        start = time.perf_counter()
+        feed_seconds = 0.0
+        attempt = 0
+        try:
+            while True:
+                try:
+                    async with self._semaphore(url):
+                        async with self.client.stream("GET", url, params=params, timeout=request_timeout) as response:
+                            if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                                logger.warning(f"{url}: статус {response.status_code}, повтор {attempt + 1}/{self.retries}")
+                                UPSTREAM_ERRORS.inc(host=host, exception=f"HTTP {response.status_code}")
+                            else:
+                                if response.is_error:
+                                    await response.aread()  # чтобы текст ответа был доступен в HTTPStatusError
+                                response.raise_for_status()
+                                sink = sink_factory()
+                                feed_seconds = 0.0
+                                try:
+                                    async for chunk in response.aiter_bytes():
+                                        feed_start = time.perf_counter()
+                                        sink.feed(chunk)
+                                        feed_seconds += time.perf_counter() - feed_start
+                                except BaseException:
+                                    discard = getattr(sink, "discard", None)
+                                    if discard is not None:
+                                        discard()
+                                    raise
+                                return sink
+                except httpx.TransportError as e:
+                    if attempt >= self.retries:
+                        raise
+                    logger.warning(f"{url}: {type(e).__name__}, повтор {attempt + 1}/{self.retries}")
+                    UPSTREAM_ERRORS.inc(host=host, exception=type(e).__name__)
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+                attempt += 1
+        except Exception as e:
+            UPSTREAM_ERRORS.inc(host=host, exception=type(e).__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            UPSTREAM_SECONDS.observe(elapsed, host=host)
+            if feed_stage is None:
+                observe_stage("fetch", elapsed)
+            else:
+                observe_stage("fetch", elapsed - feed_seconds)
+                observe_stage(feed_stage, feed_seconds)
+
+    async def get_json(self, url: str, *, params: dict | None = None, timeout: float | None = None):
+        """GET запрос с разбором JSON ответа."""
+        response = await self.get(url, params=params, timeout=timeout)
+        return response.json()
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Общий клиент процесса
+upstream = UpstreamClient()
@@ -0,0 +1,114 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+
+import tornado.httpserver
+import tornado.web
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class TelegramWebhookHandler(tornado.web.RequestHandler):
+    """Принимает обновления от Telegram и сразу кладет их в очередь Application."""
+
+    def initialize(self, bot_app: Application, secret_token: str | None) -> None:
+        # self.application у tornado занят его собственным Application
+        self.bot_app = bot_app
+        self.secret_token = secret_token
+
+    async def post(self) -> None:
+        if self.secret_token is not None:
+            received = self.request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(received, self.secret_token):
+                logger.warning("Webhook: неверный секретный токен, запрос отклонен.")
+                raise tornado.web.HTTPError(403)
+        try:
+            update = Update.de_json(json.loads(self.request.body), self.bot_app.bot)
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Webhook: не удалось разобрать обновление: {e}")
+            raise tornado.web.HTTPError(400)
+        # Обработка идет в Application (concurrent_updates), Telegram получает ответ сразу
+        await self.bot_app.update_queue.put(update)
+        self.set_status(200)
+
+
+class HealthHandler(tornado.web.RequestHandler):
+    """/healthz — процесс жив и отвечает."""
+
+    def get(self) -> None:
+        self.set_header("Content-Type", "text/plain; charset=utf-8")
+        self.finish("ok")
+
+
+class ReadinessHandler(tornado.web.RequestHandler):
+    """/readyz — Application запущен и (если задано) данные готовы к ответам."""
+
+    def initialize(self, bot_app: Application, readiness=None) -> None:
+        self.bot_app = bot_app
+        self.readiness = readiness
+
+    def get(self) -> None:
+        ready = self.bot_app.running and (self.readiness is None or self.readiness())
+        self.set_status(200 if ready else 503)
+        self.set_header("Content-Type", "text/plain; charset=utf-8")
+        self.finish("ok" if ready else "not ready")
+
+
+class WebhookServer:
+    """Легкий асинхронный HTTP сервер (tornado) для webhook Telegram и служебных эндпоинтов."""
+
+    def __init__(self, application: Application, webhook_path: str, secret_token: str | None, readiness=None, extra_routes: list | None = None):
+        routes = [
+            (webhook_path, TelegramWebhookHandler, {"bot_app": application, "secret_token": secret_token}),
+            ("/healthz", HealthHandler),
+            ("/readyz", ReadinessHandler, {"bot_app": application, "readiness": readiness}),
+        ]
+        self.app = tornado.web.Application(routes + (extra_routes or []))
+        self._server: tornado.httpserver.HTTPServer | None = None
+
+    def listen(self, port: int, address: str = "0.0.0.0") -> None:
+        self._server = self.app.listen(port, address=address, xheaders=True)
+        logger.info(f"HTTP сервер слушает {address}:{port}")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.stop()
+            await self._server.close_all_connections()
+
+
+async def run_webhook(application: Application, webhook_url: str, webhook_path: str, secret_token: str | None,
+                      listen: str, port: int, readiness=None, extra_routes: list | None = None) -> None:
+    """Запускает Application в режиме webhook на собственном HTTP сервере и ждет SIGINT/SIGTERM.
+
+    В отличие от run_polling, здесь post_init/post_shutdown вызываются вручную.
+    """
+    server = WebhookServer(application, webhook_path, secret_token, readiness, extra_routes)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        server.listen(port, listen)
+        await application.bot.set_webhook(url=webhook_url, secret_token=secret_token, allowed_updates=Update.ALL_TYPES)
+        logger.info(f"Webhook зарегистрирован: {webhook_url}")
+        await application.start()
+        try:
+            await stop_event.wait()
+        finally:
+            logger.info("Остановка webhook сервера...")
+            await server.stop()
+            await application.stop()
+            if application.post_shutdown:
+                await application.post_shutdown(application)